@@ -47,5 +47,9 @@ setup(
       # -*- Entry points: -*-
       [z3c.autoinclude.plugin]
       target = plone
+      [console_scripts]
+      senaite-lis2a-extract = senaite.lis2a.core.cli:main
+      senaite-lis2a-listener = senaite.lis2a.core.listener:main
+      senaite-lis2a-archive = senaite.lis2a.core.archive:main
       """,
 )
@@ -20,12 +20,6 @@
 
 import logging
 
-from Products.Archetypes.atapi import listTypes
-from Products.Archetypes.atapi import process_types
-from Products.CMFCore.permissions import AddPortalContent
-from Products.CMFCore.utils import ContentInit
-from senaite.lis2a.interfaces import ISenaiteLis2aLayer
-
 PRODUCT_NAME = "senaite.lis2a"
 PROFILE_ID = "profile-{}:default".format(PRODUCT_NAME)
 UNINSTALL_PROFILE_ID = "profile-{}:uninstall".format(PRODUCT_NAME)
@@ -37,6 +31,13 @@ def initialize(context):
     """Initializer called when used as a Zope 2 product."""
     logger.info("*** Initializing SENAITE LIS2A Customization package ***")
 
+    # Zope/Plone dependencies are imported here, so the core of this package
+    # (senaite.lis2a.core) can be used without a SENAITE instance
+    from Products.Archetypes.atapi import listTypes
+    from Products.Archetypes.atapi import process_types
+    from Products.CMFCore.permissions import AddPortalContent
+    from Products.CMFCore.utils import ContentInit
+
     types = listTypes(PRODUCT_NAME)
     content_types, constructors, ftis = process_types(types, PRODUCT_NAME)
 
@@ -57,5 +58,6 @@ def is_installed():
     """Returns whether the product is installed or not
     """
     from bika.lims import api
+    from senaite.lis2a.interfaces import ISenaiteLis2aLayer
     request = api.get_request()
     return ISenaiteLis2aLayer.providedBy(request)
@@ -18,11 +18,21 @@
 # Copyright 2020 by it's authors.
 # Some rights reserved, see README and LICENSE.
 
+import base64
+import time
+
 import six
 from Products.CMFCore.interfaces import IContentish
+from bika.lims import api
+from senaite.jsonapi.api import fail
 from senaite.jsonapi.interfaces import IPushConsumer
 from senaite.lis2a import api as _api
-from senaite.lis2a.api import message as msgapi
+from senaite.lis2a.api import archive as archiveapi
+from senaite.lis2a.api import coalesce as coalesceapi
+from senaite.lis2a import logger
+from senaite.lis2a.core import metrics
+from senaite.lis2a.core import e1381
+from senaite.lis2a.core import message as msgapi
 from zope.component import adapts
 from zope.interface import implements
 from zope.interface import Interface
@@ -53,28 +63,39 @@ class PushConsumer(object):
         multiple frames
         """
         # Extract the full LIS2-A messages from the data
-        messages = self.data.get("messages")
+        messages = self.get_messages()
         if not messages:
             raise ValueError("No messages found: {}".format(repr(self.data)))
 
-        # Just in case we got a message instead of a list of messages
-        if isinstance(messages, six.string_types):
-            messages = (messages,)
+        # Reject the messages if beyond the limits of the instance
+        self.check_admission(messages)
 
         # Ensure the messages are LIS2-A compliant
         valid = map(msgapi.is_compliant, messages)
         if not all(valid):
+            metrics.PUSHED_MESSAGES.inc(len(messages), outcome="invalid")
             raise ValueError("Messages are not LIS2-A compliant")
 
-        if _api.is_queue_available():
-            # Add the messages to the import results queue. Note we add all
-            # messages in a single task, instead of adding a single task for
-            # each message. The queue adapter will handle this properly by
-            # importing chunks sequentially, making the process more performant
-            return _api.queue_import(messages)
-
-        # Try to import the messages immediately
-        map(_api.import_message, messages)
+        # Keep the raw messages received, so they can be replayed
+        archiveapi.archive_messages(messages)
+
+        if coalesceapi.is_coalesce_enabled():
+            # Buffer the messages by specimen, so the results for the same
+            # specimen are imported together. Messages from this or previous
+            # pushes that are ready are processed right away
+            metrics.PUSHED_MESSAGES.inc(len(messages), outcome="coalesced")
+            groups = coalesceapi.coalesce(messages)
+            if groups:
+                coalesceapi.process_groups(groups)
+            return True
+
+        # Add the messages to the import results queue or import them. Note
+        # we add all messages with same priority in a single task, instead of
+        # adding a single task for each message. The queue adapter will handle
+        # this properly by importing chunks sequentially, making the process
+        # more performant
+        outcome = _api.process_messages(messages)
+        metrics.PUSHED_MESSAGES.inc(len(messages), outcome=outcome)
 
         # At this point we always return True, cause "import_results" only
         # returns True if found a match in SENAITE and succeed on the result
@@ -82,6 +103,37 @@ class PushConsumer(object):
         # the message we are trying to import.
         return True
 
+    def get_messages(self):
+        """Returns the list of LIS2-A messages from the data. Messages can be
+        sent already reassembled ("messages") or as the base64-encoded bytes
+        of the E1381 frames captured from the instrument ("raw")
+        """
+        raw = self.data.get("raw")
+        if raw:
+            # Frames are verified and the records reassembled here
+            return e1381.decode(base64.b64decode(raw))
+
+        messages = self.data.get("messages")
+
+        # Just in case we got a message instead of a list of messages
+        if isinstance(messages, six.string_types):
+            messages = (messages,)
+        return messages
+
+    def check_admission(self, messages):
+        """Fails with the status code and a Retry-After header when the
+        messages exceed the limits set for the instance, so the client can
+        throttle and retry later
+        """
+        try:
+            _api.check_admission(messages)
+        except _api.AdmissionError as e:
+            metrics.PUSHED_MESSAGES.inc(len(messages), outcome="rejected")
+            if e.retry_after:
+                response = api.get_request().response
+                response.setHeader("Retry-After", str(e.retry_after))
+            fail(e.status, str(e))
+
 
 class QueuedMessageImporter(object):
     """Adapter for the async import of messages
@@ -95,18 +147,68 @@ class QueuedMessageImporter(object):
     def process(self, task):
         """Process the messages from the task
         """
-        messages = task.get("messages", [])
-        if queueapi:
+        # Seconds elapsed since the task was added to the queue
+        created = task.get("created")
+        if created:
+            metrics.QUEUE_LAG_SECONDS.observe(max(time.time() - created, 0))
+
+        messages = _api.get_task_messages(task)
+        if task.get("group"):
+            # Messages coalesced for a specimen, imported at once with the
+            # results merged by analysis
+            report = _api.import_group(messages)
+            metrics.QUEUED_MESSAGES.inc(len(messages))
+
+        elif queueapi:
             # If there are too many objects to process, split them in chunks to
             # prevent the task to take too much time to complete
             chunks = get_chunks_for(task, items=messages)
 
             # Process the first chunk
-            map(_api.import_message, chunks[0])
+            report = _api.import_messages(chunks[0])
+            metrics.QUEUED_MESSAGES.inc(len(chunks[0]))
 
-            # Add remaining objects to the queue
-            _api.queue_import(chunks[1])
+            # Add remaining objects to the queue, keeping the priority
+            priority = task.get("priority", _api.QUEUE_PRIORITY)
+            _api.queue_import(chunks[1], priority=priority)
 
         else:
             # Process all them
-            map(_api.import_message, messages)
+            report = _api.import_messages(messages)
+            metrics.QUEUED_MESSAGES.inc(len(messages))
+
+        logger.info("Queued import: {}".format(report.summary()))
+
+        # Remove the payload stored out of band, if any
+        _api.remove_task_payload(task)
+
+
+class QueuedCoalesceReleaser(object):
+    """Adapter for the release of the messages coalesced by specimen, once
+    the window of the specimens has elapsed
+    """
+    implements(IQueuedTaskAdapter)
+    adapts(IContentish)
+
+    def __init__(self, context):
+        self.context = context
+
+    def process(self, task):
+        """Adds the messages of the specimens from the task that are due to
+        the queue, a task for each specimen
+        """
+        specimen_ids = task.get("specimens") or []
+        coalescer = coalesceapi.get_coalescer()
+        now = time.time()
+        groups = coalescer.release(specimen_ids, now=now)
+        if groups:
+            coalesceapi.process_groups(groups)
+
+        # Specimens not due yet (e.g. clocks of the clients are not in sync)
+        # are released by another task, when due
+        pending = filter(coalescer.get_entries, specimen_ids)
+        if pending:
+            first = min(map(lambda spec_id: coalescer.get_entries(spec_id)[0],
+                            pending))[0]
+            delay = max(first + coalescer.window - now, 1)
+            coalesceapi.queue_release(pending, delay=delay)
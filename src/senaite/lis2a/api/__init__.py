@@ -18,23 +18,35 @@
 # Copyright 2020 by it's authors.
 # Some rights reserved, see README and LICENSE.
 
+import json
 import os
+import threading
+import time
 
 from os.path import splitext
-from os.path import isfile
 from os.path import join
 
-import analysis as anapi
-import json
-import message as msgapi
+import analysis as anapi  # noqa (sets the SENAITE backend)
+import deadletter as deadletterapi
+import payload as payloadapi
 import six
 from bika.lims import api
 from pkg_resources import resource_filename
 from pkg_resources import resource_listdir
 from plone.resource.utils import iterDirectoriesOfType
 from senaite.lis2a import PRODUCT_NAME
-from senaite.lis2a.interpreter import Interpreter
-from senaite.lis2a.interpreter import lis2a2
+from senaite.lis2a import logger
+from senaite.lis2a import profiling
+from senaite.lis2a.config import get_setting
+from senaite.lis2a.core import criteria as criteriaapi
+from senaite.lis2a.core import importer
+from senaite.lis2a.core import message as msgapi
+from senaite.lis2a.core.admission import AdmissionError  # noqa
+from senaite.lis2a.core.admission import check_limits
+from senaite.lis2a.core.interpreter import Interpreter
+from senaite.lis2a.core.interpreter import get_builtin_interpreters  # noqa
+from senaite.lis2a.core.interpreter import get_interpreter_from_json  # noqa
+from senaite.lis2a.core.report import ImportReport
 
 try:
     # SENAITE.QUEUE might or not might be installed
@@ -50,9 +62,26 @@ QUEUE_TASK_ID = "task_senaite_lis2a_import"
 # ID of the type of resources directory containing interpreters
 INTERPRETERS_RESOURCE_TYPE = "senaite.lis2a.interpreters"
 
+# Default priority of the results import tasks for the queue
+QUEUE_PRIORITY = 50
+
+# Size (in bytes) of the packed messages above which the payload is stored out
+# of band in a blob, with only a reference kept in the task
+QUEUE_BLOB_THRESHOLD = 512 * 1024
+
+
+# Seconds the client is asked to wait before retrying a rejected push
+PUSH_RETRY_AFTER = 60
+
+# Seconds between checks for changes in the interpreters from resources
+INTERPRETERS_CHECK_INTERVAL = 30
 
 _marker = object()
 
+# Configurations of the interpreters from resources folders
+_registry = {"configurations": None, "mtimes": None, "checked": 0}
+_registry_lock = threading.Lock()
+
 
 def is_queue_available():
     """Returns whether senaite.queue add-on is available and enabled
@@ -63,80 +92,340 @@ def is_queue_available():
     return available
 
 
-def queue_import(messages):
+def check_admission(messages):
+    """Raises an AdmissionError if the messages passed-in exceed the limits
+    set for a single push (max number of messages and max size in bytes) or
+    if the backlog of queued messages has reached the max allowed
+    """
+    check_limits(messages, max_messages=get_setting("push_max_messages", 0),
+                 max_bytes=get_setting("push_max_bytes", 0))
+
+    max_backlog = get_setting("queue_max_backlog", 0)
+    if max_backlog > 0 and is_queue_available():
+        backlog = get_queue_backlog()
+        if backlog + len(messages) > max_backlog:
+            retry_after = get_setting("push_retry_after", PUSH_RETRY_AFTER)
+            raise AdmissionError(
+                "Queue backlog is full: {} messages (max. {}). Retry after {} "
+                "seconds".format(backlog, max_backlog, retry_after),
+                status=503, retry_after=retry_after)
+
+
+def get_queue_backlog():
+    """Returns the number of messages awaiting for import in the queue
+    """
+    if not is_queue_available():
+        return 0
+
+    context = api.get_setup().bika_instruments
+    queue = queueapi.get_queue()
+    tasks = queue.get_tasks_for(context, name=QUEUE_TASK_ID)
+    return sum(map(get_task_size, tasks))
+
+
+def get_task_size(task):
+    """Returns the number of messages of the queued task passed-in
+    """
+    count = task.get("count")
+    if count is None:
+        count = len(task.get("messages", []))
+    return count
+
+
+def queue_import(messages, priority=None, group=False):
     """Add the LIS2-A compliant message(s) to the import results queue
     :param messages: str message or a list of messages
+    :param priority: priority of the task. If None, the priority is computed
+        for each message by its interpreter and messages are added in separate
+        tasks, one for each priority
+    :param group: whether the messages are added in a single task, with the
+        highest priority of the messages if None, and imported at once
+        instead of in chunks (e.g. messages coalesced for a specimen)
+    :returns: the list of tasks added to the queue
     """
     if not is_queue_available():
         raise RuntimeError("Cannot queue message. SENAITE.QUEUE not available")
 
     if not messages:
-        return False
+        return []
 
     if isinstance(messages, six.string_types):
         messages = (messages, )
 
+    if priority is None:
+        lanes = get_priority_lanes(messages)
+        if group:
+            priority = min(map(lambda lane: lane[0], lanes))
+            lanes = [(priority, messages)]
+    else:
+        lanes = [(priority, messages)]
+
     context = api.get_setup().bika_instruments
+    tasks = []
+    for lane_priority, lane_messages in lanes:
+        params = {
+            "priority": lane_priority,
+            "ghost": True,
+        }
+        if group:
+            params["group"] = True
+        params.update(get_task_payload(lane_messages))
+        tasks.append(queueapi.add_task(QUEUE_TASK_ID, context, **params))
+    return tasks
+
+
+def get_priority_lanes(messages, interpreters=None):
+    """Returns a list of tuples (priority, messages), sorted by priority, with
+    the messages passed-in grouped by their import priority. Composite
+    messages are split, so each specimen gets its own priority
+    :param interpreters: interpreters to choose from. All the interpreters
+        available in the system are considered if None
+    """
+    if interpreters is None:
+        interpreters = get_interpreters()
+
+    lanes = {}
+    for message in messages:
+        for msg in msgapi.split_message(message):
+            priority = get_message_priority(msg, interpreters=interpreters)
+            lanes.setdefault(priority, []).append(msg)
+    return sorted(lanes.items())
+
+
+def get_message_priority(message, default=QUEUE_PRIORITY, interpreters=None):
+    """Returns the priority for the import of the message passed-in, as
+    defined by the interpreter that supports the message
+    :param interpreters: interpreters to choose from. All the interpreters
+        available in the system are considered if None
+    """
+    interpreter = get_interpreter_for(message, interpreters=interpreters)
+    if not interpreter:
+        return default
+    return interpreter.get_priority(message, default=default)
+
+
+def get_task_payload(messages):
+    """Returns a dict with the params that represent the messages passed-in
+    within a queued task. Messages are packed and compressed to keep the task
+    small. If the packed messages are above the threshold, they are stored out
+    of band in a blob and only the reference is kept
+    """
+    payload = payloadapi.pack_messages(messages)
     params = {
-        "messages": messages,
-        "priority": 50,
-        "ghost": True,
+        "count": len(messages),
+        "format": payloadapi.PAYLOAD_FORMAT,
     }
-    return queueapi.add_task(QUEUE_TASK_ID, context, **params)
+    threshold = get_setting("queue_blob_threshold", QUEUE_BLOB_THRESHOLD)
+    if 0 < threshold < len(payload):
+        params["payload_ref"] = payloadapi.store_payload(payload)
+    else:
+        params["payload"] = payload
+    return params
+
+
+def get_task_messages(task):
+    """Returns the list of messages from the queued task passed-in
+    """
+    reference = task.get("payload_ref")
+    if reference:
+        payload = payloadapi.retrieve_payload(reference)
+        if payload is None:
+            # The transaction that stored the blob is not committed yet or
+            # the blob has been removed already. Let the queue to retry
+            raise RuntimeError("No payload found for '{}'".format(reference))
+        return payloadapi.unpack_messages(payload)
+
+    payload = task.get("payload")
+    if payload:
+        return payloadapi.unpack_messages(payload)
+
+    # Tasks added before payloads were packed
+    return task.get("messages", [])
+
+
+def remove_task_payload(task):
+    """Removes the payload stored out of band for the task, if any
+    """
+    reference = task.get("payload_ref")
+    if reference:
+        payloadapi.remove_payload(reference)
+
+
+def process_messages(messages, report=None):
+    """Adds the messages passed-in to the import results queue if the queue is
+    available. Imports the messages without delay otherwise
+    :param report: ImportReport to update with the results of the import
+    :returns: "queued" or "imported"
+    """
+    if is_queue_available():
+        # Messages with same priority are added in a single task. The queue
+        # adapter imports the chunks sequentially
+        queue_import(messages)
+        return "queued"
 
+    report = import_messages(messages, report=report)
+    logger.info("Import: {}".format(report.summary()))
+    return "imported"
 
-def import_message(message):
+
+def import_message(message, report=None, interpreters=None, deadletter=True):
     """Imports the data from the LIS2-A compliant message passed-in
     :param message: str representing a full LIS2-A compliant message
+    :param report: ImportReport to update with the results of the import
+    :param interpreters: interpreters to choose from. All the interpreters
+        available in the system are considered if None
+    :param deadletter: whether to park the message in the dead-letter store
+        if has results that do not find a match
+    :returns: the ImportReport with the status of the results and timings
     """
+    if report is None:
+        report = ImportReport()
+
     # The message might be composite. This is, a single message can contain
     # results for more than one sample
-    if msgapi.is_composite(message):
+    with report.timer("split"):
         msgs = msgapi.split_message(message)
-        return any(map(import_message, msgs))
 
-    # Look for a suitable interpreter
-    interpreter = get_interpreter_for(message)
-    if not interpreter:
-        raise ValueError("No interpreter found for {}".format(message))
+    if len(msgs) > 1:
+        if interpreters is None:
+            interpreters = get_interpreters()
+        for msg in msgs:
+            import_message(msg, report=report, interpreters=interpreters,
+                           deadletter=deadletter)
+        return report
+
+    # Import the message with a report of its own, so the report for this
+    # single message can be stored together with the profile, if any
+    if interpreters is None:
+        interpreters = get_interpreters()
+    message_report = ImportReport()
+    with profiling.profiled(message) as info:
+        interpreter = importer.import_single_message(
+            message, interpreters, message_report)
+        info.update({
+            "interpreter": interpreter.id,
+            "report": message_report.to_dict(),
+        })
+
+    # Park the message for a later retry if the sample is not received yet
+    if deadletter:
+        deadletterapi.park(message, message_report)
+
+    return report.merge(message_report)
+
+
+def import_messages(messages, report=None, deadletter=True):
+    """Imports the data from the LIS2-A compliant messages passed-in
+    :param messages: list of LIS2-A compliant messages
+    :param report: ImportReport to update with the results of the import
+    :param deadletter: whether to park the messages in the dead-letter store
+        if have results that do not find a match
+    :returns: the ImportReport aggregating the import of all messages
+    """
+    if report is None:
+        report = ImportReport()
+    interpreters = get_interpreters()
+
+    # Search each container once, no matter the number of messages for it
+    with importer.cache_containers():
+        for message in messages:
+            import_message(message, report=report, interpreters=interpreters,
+                           deadletter=deadletter)
+    return report
+
+
+def import_group(messages, report=None, deadletter=True):
+    """Imports the data from the LIS2-A compliant messages coalesced for a
+    single specimen at once, with the results merged by analysis, so each
+    analysis is set and submitted once
+    :param messages: list of LIS2-A compliant messages for the same specimen
+    :param report: ImportReport to update with the results of the import
+    :param deadletter: whether to park the messages in the dead-letter store
+        if have results that do not find a match
+    :returns: the ImportReport with the status of the merged results
+    """
+    if report is None:
+        report = ImportReport()
+
+    group_report = ImportReport()
+    with importer.cache_containers():
+        importer.import_group(messages, get_interpreters(), group_report)
+
+    # Park the messages for a later retry if the sample is not received yet
+    if deadletter:
+        for message in messages:
+            deadletterapi.park(message, group_report)
+
+    return report.merge(group_report)
+
+
+def import_archive(messages, jobs=None, report=None, pool=None):
+    """Imports the data from the LIS2-A compliant messages passed-in, with the
+    parsing and extraction of results done in parallel by a pool of processes
+    and the results imported by current thread. Suitable for bulk re-imports
+    of archived messages from analyzers
+    :param messages: iterable of LIS2-A compliant messages
+    :param jobs: number of worker processes. Uses the setting `import_jobs`
+        if None, or the number of CPUs if not set
+    :param report: ImportReport to update with the results of the import
+    :param pool: ExtractionPool from get_extraction_pool, to use the same
+        processes for all the batches of a bulk import
+    :returns: the ImportReport aggregating the import of all messages
+    """
+    if pool is not None:
+        return importer.import_archive(messages, pool.interpreters,
+                                       report=report, pool=pool)
+    if jobs is None:
+        jobs = get_import_jobs()
+    interpreters = get_interpreters()
+    return importer.import_archive(messages, interpreters, jobs=jobs,
+                                   report=report)
+
+
+def get_extraction_pool(jobs=None):
+    """Returns a pool of processes for the extraction of results with all the
+    interpreters available, to be passed to import_archive for each batch of
+    a bulk import and closed when done. Returns None if messages have to be
+    processed within current process
+    :param jobs: number of worker processes. Uses the setting `import_jobs`
+        if None, or the number of CPUs if not set
+    """
+    if jobs is None:
+        jobs = get_import_jobs()
+    if jobs is not None and jobs <= 1:
+        return None
+    return importer.ExtractionPool(get_interpreters(), jobs=jobs)
 
-    # Extract and import (R)esults
-    results = extract_results(message, interpreter)
-    imported = any(map(anapi.import_result, results))
 
-    # Extract and import other data
-    return imported
+def get_import_jobs():
+    """Returns the number of processes for the extraction of results on bulk
+    imports from the `import_jobs` setting, or None for the number of CPUs
+    """
+    return get_setting("import_jobs", 0) or None
 
 
-def extract_results(message, interpreter):
+def extract_results(message, interpreter=None):
     """Returns a list of result data dicts. A given message can contain multiple
     records from (R)esult type, so it returns a list of dicts, and each dict
     represents a potential results for a single test
     """
-    interpreter.read(message)
-    results_data = interpreter.get_results_data()
-    interpreter.close()
-    return results_data
+    if interpreter is None:
+        interpreter = get_interpreter_for(message)
+        if not interpreter:
+            raise ValueError("No interpreter found for {}".format(message))
+
+    return importer.extract_results(message, interpreter)
 
 
-def get_interpreter_for(message, default=None):
+def get_interpreter_for(message, default=None, interpreters=None):
     """Returns the interpreter that can be used for the interpretation of the
     message passed-in, if any
+    :param interpreters: interpreters to choose from. All the interpreters
+        available in the system are considered if None
     """
-    # The message might be composite
-    if msgapi.is_composite(message):
-        messages = msgapi.split_message(message)
-        interpreters = map(get_interpreter_for, messages)
-        ids = map(lambda i: i and i.id or None, interpreters)
-        if len(list(set(ids))) == 1:
-            return interpreters[0]
-        return default
-
-    for interpreter in get_interpreters():
-        if interpreter.supports(message):
-            return interpreter
-
-    return default
+    if interpreters is None:
+        interpreters = get_interpreters()
+    return importer.select_interpreter(message, interpreters, default=default)
 
 
 def get_interpreters():
@@ -165,7 +454,55 @@ def get_interpreter(id):
 def get_resources_interpreters():
     """Returns the interpreters present in resources folders
     """
-    interpreters = []
+    return map(Interpreter, get_resources_configurations())
+
+
+def get_resources_configurations():
+    """Returns the configurations of the interpreters present in resources
+    folders. Configurations are kept and only read again when the JSON files
+    change. Files are checked for changes every `interpreters_check_interval`
+    seconds at most
+    """
+    interval = get_setting("interpreters_check_interval",
+                           INTERPRETERS_CHECK_INTERVAL)
+    with _registry_lock:
+        now = time.time()
+        configurations = _registry["configurations"]
+        if configurations is not None and now - _registry["checked"] < interval:
+            return configurations
+
+        paths = get_resources_paths()
+        mtimes = dict(map(lambda path: (path, os.path.getmtime(path)), paths))
+        if configurations is None or mtimes != _registry["mtimes"]:
+            configurations = map(read_configuration, paths)
+            _registry.update({
+                "configurations": configurations,
+                "mtimes": mtimes,
+            })
+            # Interpreters selected for messages might differ now, as well as
+            # the criteria of the interpreters
+            importer.invalidate_selection_cache()
+            criteriaapi.reset_stats()
+
+        _registry["checked"] = now
+        return configurations
+
+
+def reload_interpreters():
+    """Discards the configurations of the interpreters from resources folders
+    kept, so they are read again
+    """
+    with _registry_lock:
+        _registry.update({"configurations": None, "mtimes": None})
+        importer.invalidate_selection_cache()
+        criteriaapi.reset_stats()
+
+
+def get_resources_paths():
+    """Returns the paths of the JSON files with interpreters present in
+    resources folders
+    """
+    paths = []
     extensions = [".json"]
 
     # walk-through all lis2a resources folder registered
@@ -178,25 +515,13 @@ def get_resources_interpreters():
             if ext not in extensions:
                 continue
 
-            # create an interpreter instance
-            path = os.path.join(resource.directory, content)
-            interpreter = get_interpreter_from_json(path)
-            interpreters.append(interpreter)
+            paths.append(os.path.join(resource.directory, content))
 
-    return interpreters
-
-
-def get_builtin_interpreters():
-    """Returns the built-in interpreters that are compliant with standards
-    """
-    configs = [lis2a2.CONFIGURATION, ]
-    return map(Interpreter, configs)
+    return paths
 
 
-def get_interpreter_from_json(str_or_file):
-    """Returns an interpreter built from a json resource
+def read_configuration(path):
+    """Returns the configuration of the interpreter from the JSON file
     """
-    if isfile(str_or_file):
-        with open(str_or_file, "r") as f:
-            str_or_file = f.read()
-    return Interpreter(json.loads(str_or_file))
+    with open(path, "r") as f:
+        return json.load(f)
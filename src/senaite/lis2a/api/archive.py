@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.LIS2A.
+#
+# SENAITE.LIS2A is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+from senaite.lis2a import logger
+from senaite.lis2a.api import process_messages
+from senaite.lis2a.config import get_setting
+from senaite.lis2a.core.archive import Archive
+from senaite.lis2a.core.archive import SEGMENT_SIZE
+
+# Number of messages replayed at once
+REPLAY_BATCH_SIZE = 100
+
+# Archives by directory, kept per process
+_archives = {}
+
+
+class ArchiveError(ValueError):
+    """Error raised when the archive is not available
+    """
+
+
+def get_archive():
+    """Returns the Archive for the directory set in the "archive_directory"
+    setting, or None if not set
+    """
+    directory = get_setting("archive_directory", "")
+    if not directory:
+        return None
+
+    archive = _archives.get(directory)
+    if archive is None:
+        segment_size = get_setting("archive_segment_size", SEGMENT_SIZE)
+        archive = Archive(directory, segment_size=segment_size)
+        _archives[directory] = archive
+    return archive
+
+
+def archive_messages(messages):
+    """Appends the messages passed-in to the archive of received messages, if
+    an archive directory is set. A failure on archiving never prevents the
+    import of the messages, but is logged
+    """
+    archive = get_archive()
+    if not archive or not messages:
+        return 0
+    try:
+        return archive.append(messages)
+    except Exception as e:
+        logger.error("Cannot archive {} messages: {}".format(
+            len(messages), e))
+        return 0
+
+
+def replay(**criteria):
+    """Queues or imports again the archived messages that match with the
+    criteria passed-in (sender, specimen, fingerprint, start, end, limit), in
+    the order they were received. Returns the number of messages replayed
+    """
+    archive = get_archive()
+    if not archive:
+        raise ArchiveError("No archive directory set")
+
+    count = 0
+    batch = []
+    for message in archive.iter_messages(**criteria):
+        batch.append(message)
+        if len(batch) >= REPLAY_BATCH_SIZE:
+            process_messages(batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        process_messages(batch)
+        count += len(batch)
+    return count
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.LIS2A.
+#
+# SENAITE.LIS2A is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+import math
+import time
+
+import transaction
+from bika.lims import api
+from senaite.lis2a import logger
+from senaite.lis2a.api.storage import SpecimenRecord
+from senaite.lis2a.api.storage import get_index
+from senaite.lis2a.api.storage import get_storage
+from senaite.lis2a.api.storage import pop_record
+from senaite.lis2a.config import get_setting
+from senaite.lis2a.core.coalesce import COALESCE_MAX_MESSAGES
+from senaite.lis2a.core.coalesce import Coalescer
+from ZODB.POSException import ConflictError
+
+# Key of the annotation storage that keeps the messages being coalesced
+COALESCE_STORAGE = "senaite.lis2a.coalesce"
+
+# Key of the annotation storage that keeps the deadlines of the specimens
+COALESCE_DEADLINES = "senaite.lis2a.coalesce.deadlines"
+
+# ID of the task for the queue that releases the messages coalesced
+QUEUE_RELEASE_TASK_ID = "task_senaite_lis2a_coalesce"
+
+
+class PersistentCoalescer(Coalescer):
+    """Coalescer with the messages of each specimen kept in a record of its
+    own, so concurrent pushes for different specimens do not conflict. The
+    deadlines are kept in a sorted set, so only the specimens that are due
+    are read on release
+    """
+
+    def __init__(self, storage, deadlines, **kwargs):
+        super(PersistentCoalescer, self).__init__(storage=storage, **kwargs)
+        self.deadlines = deadlines
+        self.scheduled = []
+
+    def append(self, specimen_id, entry):
+        record = self.storage.get(specimen_id)
+        if record is None:
+            record = SpecimenRecord()
+            self.storage[specimen_id] = record
+        return record.append(entry)
+
+    def schedule(self, specimen_id, deadline):
+        self.storage[specimen_id].deadline = deadline
+        self.deadlines.insert((deadline, specimen_id))
+        self.scheduled.append(specimen_id)
+
+    def get_entries(self, specimen_id):
+        record = self.storage.get(specimen_id)
+        return record and record.entries or ()
+
+    def is_due(self, specimen_id, now):
+        record = self.storage.get(specimen_id)
+        deadline = getattr(record, "deadline", None)
+        return deadline is not None and deadline <= now
+
+    def get_due(self, now):
+        # Deadlines are removed when the messages are popped, so they are
+        # kept if the import of the messages fails
+        due = []
+        for deadline, specimen_id in self.deadlines.keys():
+            if deadline > now:
+                break
+            due.append(specimen_id)
+        return filter(lambda spec_id: self.is_due(spec_id, now), due)
+
+    def pop(self, specimen_id):
+        record = pop_record(self.storage, specimen_id)
+        if record is None:
+            return []
+        key = (getattr(record, "deadline", None), specimen_id)
+        if key in self.deadlines:
+            self.deadlines.remove(key)
+        return map(lambda entry: entry[1], record.entries)
+
+
+def is_coalesce_enabled():
+    """Returns whether the messages are coalesced by specimen before import
+    """
+    return get_setting("coalesce_window", 0) > 0
+
+
+def get_coalescer():
+    """Returns the Coalescer with the messages buffered in the site
+    """
+    window = get_setting("coalesce_window", 0)
+    max_messages = get_setting("coalesce_max_messages", COALESCE_MAX_MESSAGES)
+    return PersistentCoalescer(get_storage(COALESCE_STORAGE),
+                               get_index(COALESCE_DEADLINES),
+                               window=window, max_messages=max_messages)
+
+
+def coalesce(messages):
+    """Buffers the messages passed-in by specimen and returns the groups of
+    messages that are ready for import, one for each specimen. These are the
+    groups for the specimens that reached the max number of messages, and if
+    the queue is not available, those whose window elapsed, including the
+    ones buffered from previous calls. With the queue, a delayed task releases
+    the messages of the specimens buffered for the first time when their
+    window elapses
+    """
+    # Imported here to prevent circular imports
+    from senaite.lis2a.api import is_queue_available
+
+    coalescer = get_coalescer()
+    groups = []
+    for message in messages:
+        groups.extend(coalescer.add(message))
+
+    if is_queue_available():
+        if coalescer.scheduled:
+            queue_release(coalescer.scheduled, delay=coalescer.window)
+    else:
+        groups.extend(coalescer.pop_due())
+    return groups
+
+
+def queue_release(specimen_ids, delay=0):
+    """Adds a task to the queue that releases the messages buffered for the
+    specimens passed-in after the seconds of delay
+    """
+    # Imported here to prevent circular imports
+    from senaite.lis2a.api import QUEUE_PRIORITY
+    from senaite.lis2a.api import queueapi
+
+    context = api.get_setup().bika_instruments
+    return queueapi.add_task(QUEUE_RELEASE_TASK_ID, context,
+                             specimens=list(specimen_ids),
+                             delay=int(math.ceil(delay)),
+                             priority=QUEUE_PRIORITY, ghost=True)
+
+
+def release(specimen_ids, now=None):
+    """Returns the groups of messages buffered for the specimens passed-in
+    whose window has elapsed, and removes them from the buffer
+    """
+    return get_coalescer().release(specimen_ids, now=now)
+
+
+def process_due(force=False, commit=False):
+    """Processes the messages buffered for the specimens whose window has
+    elapsed, or for all specimens if force is True. The messages of each
+    specimen are removed from the buffer and processed together
+    :param commit: whether to commit the transaction after the messages of
+        each specimen are processed, so a failure only affects the messages
+        for that specimen, that are kept in the buffer
+    :returns: the list of groups of messages processed
+    """
+    coalescer = get_coalescer()
+    if force:
+        specimen_ids = list(coalescer.storage.keys())
+    else:
+        specimen_ids = coalescer.get_due(time.time())
+
+    processed = []
+    for specimen_id in specimen_ids:
+        group = coalescer.pop(specimen_id)
+        if not group:
+            continue
+        if not commit:
+            process_groups([group])
+            processed.append(group)
+            continue
+        try:
+            process_groups([group])
+            transaction.commit()
+        except ConflictError:
+            raise
+        except Exception as e:
+            transaction.abort()
+            logger.error("Cannot process the messages coalesced for '{}': "
+                         "{}".format(specimen_id, str(e)))
+            continue
+        processed.append(group)
+    return processed
+
+
+def process_groups(groups):
+    """Processes the groups of messages passed-in, so the messages for a
+    specimen are imported together. Each group is added to the queue in a
+    task of its own if the queue is available, and imported at once
+    otherwise, with the results merged by analysis
+    :returns: "queued" or "imported"
+    """
+    # Imported here to prevent circular imports
+    from senaite.lis2a.api import import_group
+    from senaite.lis2a.api import is_queue_available
+    from senaite.lis2a.api import queue_import
+
+    if is_queue_available():
+        for group in groups:
+            queue_import(group, group=True)
+        return "queued"
+
+    for group in groups:
+        report = import_group(group)
+        logger.info("Coalesced import: {}".format(report.summary()))
+    return "imported"
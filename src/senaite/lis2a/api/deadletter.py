@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.LIS2A.
+#
+# SENAITE.LIS2A is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+import itertools
+
+from bika.lims.catalog import CATALOG_ANALYSIS_REQUEST_LISTING
+from senaite.lis2a import logger
+from senaite.lis2a.api import analysis as anapi
+from senaite.lis2a.api.storage import SpecimenRecord
+from senaite.lis2a.api.storage import get_index
+from senaite.lis2a.api.storage import get_storage
+from senaite.lis2a.api.storage import pop_record
+from senaite.lis2a.config import get_setting
+from senaite.lis2a.core import metrics
+from senaite.lis2a.core.coalesce import get_specimen_id
+from senaite.lis2a.core.deadletter import DEADLETTER_MAX_AGE
+from senaite.lis2a.core.deadletter import DEADLETTER_MAX_ATTEMPTS
+from senaite.lis2a.core.deadletter import DEADLETTER_MAX_DELAY
+from senaite.lis2a.core.deadletter import DEADLETTER_RETRY_DELAY
+from senaite.lis2a.core.deadletter import DeadLetter
+from senaite.lis2a.core.deadletter import DeadLetterStore
+from senaite.lis2a.core.deadletter import is_retryable
+from senaite.lis2a.core.report import ImportReport
+
+# Key of the annotation storage that keeps the dead letters
+DEADLETTER_STORAGE = "senaite.lis2a.deadletter"
+
+# Key of the annotation storage that keeps the next retry of the specimens
+DEADLETTER_RETRIES = "senaite.lis2a.deadletter.retries"
+
+# Key of the annotation storage that keeps the creation of the dead letters
+DEADLETTER_CREATED = "senaite.lis2a.deadletter.created"
+
+
+class PersistentDeadLetterStore(DeadLetterStore):
+    """Dead-letter store with the messages of each specimen kept in a record
+    of its own, so concurrent imports that park messages for different
+    specimens do not conflict, and those for the same specimen are merged.
+    The next retries and the creation times are kept in sorted sets, so only
+    the specimens that are due or expired are read
+    """
+
+    def __init__(self, storage, retries, created, **kwargs):
+        super(PersistentDeadLetterStore, self).__init__(storage=storage,
+                                                        **kwargs)
+        self.retries = retries
+        self.created = created
+
+    def to_letter(self, record):
+        return DeadLetter(record.entries, record.created, record.attempts,
+                          record.next_retry)
+
+    def get(self, specimen_id):
+        record = self.storage.get(specimen_id)
+        return record and self.to_letter(record) or None
+
+    def items(self):
+        return map(lambda item: (item[0], self.to_letter(item[1])),
+                   self.storage.items())
+
+    def add(self, specimen_id, letter):
+        self.storage[specimen_id] = SpecimenRecord(
+            letter.messages, created=letter.created, attempts=letter.attempts,
+            next_retry=letter.next_retry)
+        self.created.insert((letter.created, specimen_id))
+        if letter.next_retry is not None:
+            self.retries.insert((letter.next_retry, specimen_id))
+
+    def append(self, specimen_id, messages):
+        record = self.storage[specimen_id]
+        for message in messages:
+            record.append(message)
+
+    def reschedule(self, specimen_id, letter):
+        record = self.storage[specimen_id]
+        self.remove_key(self.retries, (record.next_retry, specimen_id))
+        record.attempts = letter.attempts
+        record.next_retry = letter.next_retry
+        if letter.next_retry is not None:
+            self.retries.insert((letter.next_retry, specimen_id))
+
+    def pop(self, specimen_id):
+        record = pop_record(self.storage, specimen_id)
+        if record is None:
+            return None
+        self.remove_key(self.retries, (record.next_retry, specimen_id))
+        self.remove_key(self.created, (record.created, specimen_id))
+        return self.to_letter(record)
+
+    def get_due(self, now):
+        due = []
+        for next_retry, specimen_id in self.retries.keys():
+            if next_retry > now:
+                break
+            due.append(specimen_id)
+        return due
+
+    def get_expired(self, now):
+        expired = []
+        for created, specimen_id in self.created.keys():
+            if now - created < self.max_age:
+                break
+            expired.append(specimen_id)
+        return expired
+
+    def remove_key(self, index, key):
+        if key in index:
+            index.remove(key)
+
+
+def is_deadletter_enabled():
+    """Returns whether the messages with results without match are parked in
+    the dead-letter store for a later retry
+    """
+    return get_setting("deadletter_enabled", True)
+
+
+def get_store():
+    """Returns the DeadLetterStore with the messages parked in the site
+    """
+    return PersistentDeadLetterStore(
+        get_storage(DEADLETTER_STORAGE),
+        get_index(DEADLETTER_RETRIES),
+        get_index(DEADLETTER_CREATED),
+        delay=get_setting("deadletter_retry_delay", DEADLETTER_RETRY_DELAY),
+        max_delay=get_setting("deadletter_max_delay", DEADLETTER_MAX_DELAY),
+        max_attempts=get_setting("deadletter_max_attempts",
+                                 DEADLETTER_MAX_ATTEMPTS),
+        max_age=get_setting("deadletter_max_age", DEADLETTER_MAX_AGE))
+
+
+def park(message, report):
+    """Parks the non-composite message passed-in if the ImportReport of its
+    import has results that might find a match later. Returns whether the
+    message was parked. Whether the sample was received already is not
+    checked here, but on retry, so no queries are added to the import
+    """
+    if not is_deadletter_enabled() or not is_retryable(report):
+        return False
+
+    specimen_id = get_specimen_id(message)
+    if not specimen_id:
+        logger.warn("Cannot park a message without Specimen ID")
+        return False
+
+    get_store().park(specimen_id, [message])
+    metrics.DEADLETTER_MESSAGES.inc(outcome="parked")
+    return True
+
+
+def is_sample_received(specimen_id):
+    """Returns whether a sample with the Sample ID or Client Sample ID passed-in
+    exists and was received
+    """
+    for index in ("getId", "getClientSampleID"):
+        query = {"portal_type": "AnalysisRequest", index: specimen_id}
+        samples = anapi.search(query, CATALOG_ANALYSIS_REQUEST_LISTING)
+        if any(map(lambda sample: sample.getDateReceived, samples)):
+            return True
+    return False
+
+
+def retry_due(now=None):
+    """Imports the messages parked for the specimens whose retry is due.
+    Messages with results that still find no match are parked again, with
+    the next retry delayed exponentially, unless the sample was received
+    already. Messages parked for longer than the max age are discarded
+    :returns: the ImportReport aggregating the import of all messages
+    """
+    report = ImportReport()
+    store = get_store()
+    for specimen_id, letter in store.pop_expired(now=now):
+        logger.warn("Discarding {} parked messages for '{}'".format(
+            len(letter.messages), specimen_id))
+        metrics.DEADLETTER_MESSAGES.inc(len(letter.messages),
+                                        outcome="expired")
+
+    for specimen_id, letter in store.pop_due(now=now):
+        retry_report = retry(letter.messages, report=report)
+        if not is_retryable(retry_report):
+            metrics.DEADLETTER_MESSAGES.inc(len(letter.messages),
+                                            outcome="recovered")
+        elif is_sample_received(specimen_id):
+            # Results without match are for analyses that cannot be submitted
+            # anymore, these will never find a match
+            logger.warn("Discarding {} parked messages for '{}', received "
+                        "already".format(len(letter.messages), specimen_id))
+            metrics.DEADLETTER_MESSAGES.inc(len(letter.messages),
+                                            outcome="discarded")
+        else:
+            store.park(specimen_id, letter.messages,
+                       attempts=letter.attempts + 1, now=now,
+                       created=letter.created)
+            metrics.DEADLETTER_MESSAGES.inc(len(letter.messages),
+                                            outcome="rescheduled")
+    return report
+
+
+def retry_for(specimen_ids):
+    """Retries the messages parked for the specimens passed-in without delay,
+    regardless of their schedule. Messages are never imported here, so the
+    caller (e.g. the reception of the sample) is not slowed down: these are
+    added to the queue if available, to be imported in a task of their own,
+    or their retry is made due otherwise, so they are imported with the next
+    call to retry_due
+    :returns: the list of messages queued or made due
+    """
+    # Imported here to prevent circular imports
+    from senaite.lis2a.api import is_queue_available
+    from senaite.lis2a.api import queue_import
+
+    store = get_store()
+    specimen_ids = filter(None, set(specimen_ids))
+    if not is_queue_available():
+        letters = filter(None, map(store.make_due, specimen_ids))
+        return get_messages(letters)
+
+    specimen_ids = filter(lambda spec_id: spec_id in store, specimen_ids)
+    messages = get_messages(map(store.get, specimen_ids))
+    if not messages:
+        return messages
+
+    try:
+        queue_import(messages)
+    except Exception as e:
+        # Do not let the retry interfere with the caller (e.g. the reception
+        # of the sample), keep the messages for the next scheduled retry
+        logger.error("Cannot queue parked messages: {}".format(str(e)))
+        return []
+
+    store.pop_all(specimen_ids)
+    metrics.DEADLETTER_MESSAGES.inc(len(messages), outcome="retried")
+    return messages
+
+
+def get_messages(letters):
+    """Returns the list of messages from the dead letters passed-in
+    """
+    return list(itertools.chain(*map(lambda letter: letter.messages,
+                                     letters)))
+
+
+def retry(messages, report=None):
+    """Imports the messages passed-in without parking them
+    :returns: the ImportReport of the import of the messages
+    """
+    # Imported here to prevent circular imports
+    from senaite.lis2a.api import import_messages
+
+    retry_report = import_messages(messages, deadletter=False)
+    if report is not None:
+        report.merge(retry_report)
+    return retry_report
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.LIS2A.
+#
+# SENAITE.LIS2A is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+import traceback
+
+import transaction
+from senaite.lis2a import logger
+from senaite.lis2a.api import get_interpreters
+from senaite.lis2a.api.archive import archive_messages
+from senaite.lis2a.api import import_message
+from senaite.lis2a.config import get_setting
+from senaite.lis2a.core import importer
+from senaite.lis2a.core.hotfolder import CLAIM_TIMEOUT
+from senaite.lis2a.core.hotfolder import HotFolder
+from senaite.lis2a.core.hotfolder import STABLE_SECONDS
+from senaite.lis2a.core.report import ImportReport
+from ZODB.POSException import ConflictError
+
+# Number of messages imported within a single transaction
+HOTFOLDER_BATCH_SIZE = 100
+
+# Maximum number of files imported on each poll
+HOTFOLDER_MAX_FILES = 100
+
+# Hot folders by directory. Kept per process, for the stability checks to
+# compare the files with the ones from the previous poll
+_hotfolders = {}
+
+
+def get_hotfolder(directory=None):
+    """Returns the HotFolder for the directory passed-in, or for the directory
+    set in the "hotfolder_directory" setting if None
+    """
+    if directory is None:
+        directory = get_setting("hotfolder_directory", "")
+    if not directory:
+        raise ValueError("No hot folder directory set")
+
+    hotfolder = _hotfolders.get(directory)
+    if hotfolder is None:
+        extensions = get_setting("hotfolder_extensions", "")
+        extensions = filter(None, map(lambda e: e.strip(),
+                                      extensions.split(",")))
+        stable_seconds = get_setting("hotfolder_stable_seconds",
+                                     STABLE_SECONDS)
+        hotfolder = HotFolder(directory, stable_seconds=stable_seconds,
+                              extensions=extensions)
+        _hotfolders[directory] = hotfolder
+    return hotfolder
+
+
+def import_hotfolder(directory=None, max_files=None):
+    """Imports the messages from the files of the hot folder that are ready.
+    Messages are imported in batched transactions, and each file is moved to
+    the "done" sub-folder once all its messages are imported, or to the
+    "failed" sub-folder otherwise, unless the import failed because of a
+    conflict, and the file is moved back to the hot folder. The number of
+    messages committed is kept for each file, so the messages imported already
+    are skipped if the file is retried or a file claimed by a process that
+    crashed is recovered.
+    Returns the ImportReport
+    """
+    hotfolder = get_hotfolder(directory)
+    if max_files is None:
+        max_files = get_setting("hotfolder_max_files", HOTFOLDER_MAX_FILES)
+    batch_size = get_setting("hotfolder_batch_size", HOTFOLDER_BATCH_SIZE)
+
+    # Files claimed by processes that did not make any progress for a while
+    timeout = get_setting("hotfolder_claim_timeout", CLAIM_TIMEOUT)
+    for path in hotfolder.recover(timeout=timeout):
+        logger.warn("Recovered stale file {} ({} messages imported)".format(
+            path, hotfolder.get_offset(path)))
+
+    # Commit the transaction of the request before the first batch
+    transaction.commit()
+
+    report = ImportReport()
+    interpreters = get_interpreters()
+    for path in hotfolder.get_ready_files()[:max_files]:
+        path = hotfolder.claim(path)
+        if not path:
+            # Claimed by another process
+            continue
+
+        offset = hotfolder.get_offset(path)
+        batch = []
+        try:
+            for message in hotfolder.iter_messages(path, offset=offset):
+                batch.append(message)
+                if len(batch) >= batch_size:
+                    offset = import_batch(hotfolder, path, batch, offset,
+                                          report, interpreters)
+                    batch = []
+            import_batch(hotfolder, path, batch, offset, report, interpreters)
+        except ConflictError:
+            # The batch is not committed, but nothing is wrong with the file.
+            # Release it, so it is imported with the next poll, from the
+            # messages that were not committed
+            transaction.abort()
+            logger.warn("Conflict while importing {}, {} messages were "
+                        "imported. Released for the next poll".format(
+                            path, hotfolder.get_offset(path)))
+            hotfolder.release(path)
+            continue
+        except Exception:
+            transaction.abort()
+            details = "{}\n{} messages were imported before the failure, " \
+                      "and are skipped if the file is retried".format(
+                          traceback.format_exc(), hotfolder.get_offset(path))
+            logger.error("Cannot import {}: {}".format(path, details))
+            hotfolder.failed(path, details=details)
+            continue
+
+        hotfolder.done(path)
+
+    if report.messages:
+        logger.info("Hot folder import: {}".format(report.summary()))
+    return report
+
+
+def import_batch(hotfolder, path, messages, offset, report, interpreters):
+    """Imports the batch of messages from the file passed-in within a single
+    transaction, and archives the batch and keeps the offset of the file once
+    committed, so a batch that is not committed is neither archived nor
+    skipped when the file is imported again. Returns the new offset
+    """
+    if not messages:
+        return offset
+
+    with importer.cache_containers():
+        for message in messages:
+            import_message(message, report=report, interpreters=interpreters)
+    transaction.commit()
+
+    # Archive the batch at once, not message by message
+    archive_messages(messages)
+
+    offset += len(messages)
+    hotfolder.set_offset(path, offset)
+    return offset
+
+
+def retry_failed(name, directory=None):
+    """Moves the failed file with the name passed-in back to the hot folder,
+    so it is imported again with the next poll, skipping the messages that
+    were imported already. Returns the new path or None
+    """
+    return get_hotfolder(directory).retry(name)
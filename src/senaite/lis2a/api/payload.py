@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.LIS2A.
+#
+# SENAITE.LIS2A is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+import uuid
+
+from BTrees.OOBTree import OOBTree
+from bika.lims import api
+from senaite.lis2a.core.payload import PAYLOAD_FORMAT  # noqa
+from senaite.lis2a.core.payload import pack_messages  # noqa
+from senaite.lis2a.core.payload import unpack_messages  # noqa
+from zope.annotation.interfaces import IAnnotations
+from ZODB.blob import Blob
+
+# Key of the annotation storage that keeps the payloads stored out of band
+PAYLOADS_STORAGE = "senaite.lis2a.payloads"
+
+
+def store_payload(payload):
+    """Stores the payload out of band in a ZODB blob and returns the reference
+    that can be used to retrieve it later
+    """
+    reference = uuid.uuid4().hex
+    blob = Blob()
+    with blob.open("w") as f:
+        f.write(payload)
+    get_payloads_storage()[reference] = blob
+    return reference
+
+
+def retrieve_payload(reference, default=None):
+    """Returns the payload stored out of band for the reference passed-in
+    """
+    blob = get_payloads_storage(create=False).get(reference)
+    if blob is None:
+        return default
+    with blob.open("r") as f:
+        return f.read()
+
+
+def remove_payload(reference):
+    """Removes the payload stored out of band for the reference passed-in
+    """
+    storage = get_payloads_storage(create=False)
+    if reference in storage:
+        del storage[reference]
+
+
+def get_payloads_storage(create=True):
+    """Returns the storage of payloads that are kept out of band
+    """
+    annotations = IAnnotations(api.get_setup())
+    storage = annotations.get(PAYLOADS_STORAGE)
+    if storage is None:
+        storage = OOBTree()
+        if not create:
+            return storage
+        annotations[PAYLOADS_STORAGE] = storage
+    return storage
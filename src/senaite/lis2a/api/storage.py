@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.LIS2A.
+#
+# SENAITE.LIS2A is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+"""Persistent storages of messages by specimen (e.g. the messages coalesced
+or parked in the dead-letter store). Each specimen is kept in a record of its
+own within an OOBTree, so pushes for different specimens never change the
+same persistent objects, and pushes for the same specimen are merged on
+conflict instead of failing
+"""
+
+from BTrees.OOBTree import OOBTree
+from BTrees.OOBTree import OOTreeSet
+from bika.lims import api
+from persistent import Persistent
+from ZODB.POSException import ConflictError
+from zope.annotation.interfaces import IAnnotations
+
+_marker = object()
+
+
+class SpecimenRecord(Persistent):
+    """Messages (entries) stored for a specimen, with additional attributes.
+    Entries are only appended or the record released as a whole, so changes
+    made concurrently by two transactions can be merged:
+
+    - entries appended by both transactions are kept
+    - attributes changed by only one transaction are taken
+    - a record released by one transaction while the other added entries or
+      changed the same attribute raises a ConflictError, and the transaction
+      is retried
+    """
+
+    def __init__(self, entries=(), **kwargs):
+        self.entries = tuple(entries)
+        self.released = False
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def append(self, entry):
+        """Appends the entry passed-in and returns the number of entries
+        """
+        self.entries = self.entries + (entry, )
+        return len(self.entries)
+
+    def release(self):
+        """Flags the record as released (e.g. removed from the storage), so
+        entries appended concurrently by other transactions are not lost
+        """
+        self.released = True
+
+    def _p_resolveConflict(self, old, committed, new):
+        old_entries = old.get("entries", ())
+        committed_entries = committed.get("entries", ())
+        new_entries = new.get("entries", ())
+        for entries in (committed_entries, new_entries):
+            if entries[:len(old_entries)] != old_entries:
+                # Entries were not only appended
+                raise ConflictError
+        added = new_entries[len(old_entries):]
+        if added and committed.get("released"):
+            raise ConflictError
+        if new.get("released") and \
+                len(committed_entries) > len(old_entries):
+            raise ConflictError
+
+        resolved = dict(committed)
+        resolved["entries"] = committed_entries + added
+        keys = set(old.keys() + committed.keys() + new.keys())
+        for key in keys - set(["entries"]):
+            old_value = old.get(key, _marker)
+            new_value = new.get(key, _marker)
+            committed_value = committed.get(key, _marker)
+            if new_value == old_value or new_value == committed_value:
+                continue
+            if committed_value != old_value:
+                # Changed by both transactions to different values
+                raise ConflictError
+            if new_value is _marker:
+                resolved.pop(key, None)
+            else:
+                resolved[key] = new_value
+        return resolved
+
+
+def get_storage(key, factory=OOBTree):
+    """Returns the persistent storage for the key passed-in, created with the
+    factory passed-in if it does not exist yet
+    """
+    annotations = IAnnotations(api.get_setup())
+    storage = annotations.get(key)
+    if storage is None:
+        storage = factory()
+        annotations[key] = storage
+    return storage
+
+
+def get_index(key):
+    """Returns the persistent sorted set for the key passed-in (e.g. for the
+    deadlines of the specimens), created if it does not exist yet
+    """
+    return get_storage(key, factory=OOTreeSet)
+
+
+def pop_record(storage, specimen_id):
+    """Removes the record of the specimen passed-in from the storage and
+    returns it, flagged as released. Returns None if no record
+    """
+    record = storage.pop(specimen_id, None)
+    if record is not None:
+        record.release()
+    return record
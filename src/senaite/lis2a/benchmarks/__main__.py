@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.LIS2A.
+#
+# SENAITE.LIS2A is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+import argparse
+
+from senaite.lis2a.benchmarks import suites
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmarks for the parsing core of senaite.lis2a")
+    parser.add_argument("--specimens", type=int, default=10,
+                        help="Specimens per message (default: 10)")
+    parser.add_argument("--results", type=int, default=5,
+                        help="R records per order (default: 5)")
+    parser.add_argument("--field-width", type=int, default=8,
+                        help="Width of ids and values (default: 8)")
+    parser.add_argument("--interpreters", type=int, default=20,
+                        help="Interpreters registered (default: 20)")
+    parser.add_argument("--delimiters", default=None,
+                        help="Field, repeat, component and escape delimiters")
+    parser.add_argument("--number", type=int, default=None,
+                        help="Loops per repeat (default: auto)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Repeats, best is reported (default: 3)")
+    parser.add_argument("--filter", default=None,
+                        help="Run only benchmarks containing this text")
+    args = parser.parse_args(argv)
+
+    benchmarks = suites.get_benchmarks(
+        specimens=args.specimens, results=args.results,
+        field_width=args.field_width, interpreters=args.interpreters,
+        delimiters=args.delimiters)
+    timings = suites.run(benchmarks, number=args.number, repeat=args.repeat,
+                         name_filter=args.filter)
+    suites.report(timings)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.LIS2A.
+#
+# SENAITE.LIS2A is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+from __future__ import print_function
+
+import argparse
+import random
+import socket
+import threading
+from timeit import default_timer
+
+from senaite.lis2a.benchmarks.generator import MessageGenerator
+from senaite.lis2a.core import e1381
+
+# Seconds to wait for the reply of the receiver
+REPLY_TIMEOUT = 15
+
+# Number of times a frame is sent before giving up
+MAX_RETRIES = 6
+
+
+class AnalyzerClient(object):
+    """Simulated analyzer that sends LIS2-A messages to a listener with the
+    ASTM E1381 low-level protocol over TCP/IP
+    :param error_rate: ratio of frames sent with a wrong checksum, to exercise
+        the retransmission of frames
+    """
+
+    def __init__(self, host, port, error_rate=0.0, seed=None):
+        self.address = (host, port)
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.socket = None
+        self.retransmissions = 0
+
+    def connect(self):
+        self.socket = socket.create_connection(self.address,
+                                               timeout=REPLY_TIMEOUT)
+
+    def close(self):
+        if self.socket:
+            self.socket.close()
+            self.socket = None
+
+    def send_messages(self, messages):
+        """Sends the messages passed-in within a single transmission
+        """
+        self.send_and_wait(chr(e1381.ENQ))
+        frame_number = 1
+        for message in messages:
+            frames = e1381.encode_message(message, frame_number=frame_number)
+            for frame in frames:
+                self.send_frame(frame)
+            frame_number += len(frames)
+        self.socket.sendall(chr(e1381.EOT))
+
+    def send_frame(self, frame):
+        """Sends the frame until the receiver accepts it
+        """
+        for retry in range(MAX_RETRIES):
+            data = frame
+            if self.random.random() < self.error_rate:
+                # Corrupt the checksum
+                data = frame[:-4] + "ZZ" + frame[-2:]
+            if self.send_and_wait(data, raise_on_nak=False):
+                return
+            self.retransmissions += 1
+        raise IOError("Frame rejected {} times".format(MAX_RETRIES))
+
+    def send_and_wait(self, data, raise_on_nak=True):
+        """Sends the data and waits for the reply of the receiver. Returns
+        whether the receiver replied with ACK
+        """
+        self.socket.sendall(data)
+        reply = self.socket.recv(1)
+        if reply == chr(e1381.ACK):
+            return True
+        if reply == chr(e1381.NAK) and not raise_on_nak:
+            return False
+        raise IOError("Unexpected reply: {}".format(repr(reply)))
+
+
+def simulate(host, port, analyzers=10, messages=100, per_transmission=1,
+             error_rate=0.0, **kwargs):
+    """Simulates the analyzers passed-in sending messages concurrently to the
+    listener. Returns a dict with the messages sent, the retransmissions and
+    the elapsed time
+    """
+    stats = {"messages": 0, "retransmissions": 0, "errors": 0}
+    lock = threading.Lock()
+
+    def run(index):
+        client = AnalyzerClient(host, port, error_rate=error_rate, seed=index)
+        batch = MessageGenerator(seed=index, **kwargs).generate(messages)
+        sent = 0
+        try:
+            client.connect()
+            for start in range(0, len(batch), per_transmission):
+                client.send_messages(batch[start:start + per_transmission])
+                sent += len(batch[start:start + per_transmission])
+        except (IOError, socket.error):
+            with lock:
+                stats["errors"] += 1
+        finally:
+            client.close()
+        with lock:
+            stats["messages"] += sent
+            stats["retransmissions"] += client.retransmissions
+
+    start = default_timer()
+    threads = map(lambda idx: threading.Thread(target=run, args=(idx, )),
+                  range(analyzers))
+    map(lambda thread: thread.start(), threads)
+    map(lambda thread: thread.join(), threads)
+    stats["elapsed"] = default_timer() - start
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Simulates analyzers sending LIS2-A messages to a "
+                    "listener with ASTM over TCP/IP")
+    parser.add_argument("--host", default="localhost",
+                        help="Address of the listener (default: localhost)")
+    parser.add_argument("--port", type=int, required=True,
+                        help="Port of the listener")
+    parser.add_argument("--analyzers", type=int, default=10,
+                        help="Concurrent analyzers (default: 10)")
+    parser.add_argument("--messages", type=int, default=100,
+                        help="Messages per analyzer (default: 100)")
+    parser.add_argument("--per-transmission", type=int, default=1,
+                        help="Messages per transmission (default: 1)")
+    parser.add_argument("--results", type=int, default=5,
+                        help="R records per order (default: 5)")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Ratio of frames with wrong checksum")
+    args = parser.parse_args(argv)
+
+    stats = simulate(args.host, args.port, analyzers=args.analyzers,
+                     messages=args.messages,
+                     per_transmission=args.per_transmission,
+                     error_rate=args.error_rate, results=args.results)
+    print("{messages} messages sent in {elapsed:.2f}s, {retransmissions} "
+          "retransmissions, {errors} analyzers with errors".format(**stats))
+
+
+if __name__ == "__main__":
+    main()
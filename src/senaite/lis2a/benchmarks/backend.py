@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.LIS2A.
+#
+# SENAITE.LIS2A is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+import itertools
+import time
+from timeit import default_timer
+
+from senaite.lis2a.core import importer
+from senaite.lis2a.core.backend import Backend
+
+# Names of the simulated catalogs
+SAMPLES_CATALOG = "memory_samples"
+WORKSHEETS_CATALOG = "memory_worksheets"
+ANALYSES_CATALOG = "memory_analyses"
+
+# Review states in which analyses can be submitted
+SUBMITTABLE_STATES = ("unassigned", "assigned")
+
+_uids = itertools.count(1)
+
+
+class MemoryAnalysis(object):
+    """In-memory analysis, with the subset of the interface of SENAITE's
+    analyses that is used on results import
+    """
+
+    def __init__(self, keyword, interims=None, state="unassigned"):
+        self.uid = "analysis-{}".format(next(_uids))
+        self.keyword = keyword
+        self.result = ""
+        self.interims = interims or []
+        self.state = state
+        self.results_range = None
+        self.detection_limit_operand = None
+        self.allow_manual_detection_limit = False
+        self.capture_date = None
+
+    def UID(self):
+        return self.uid
+
+    def getKeyword(self):
+        return self.keyword
+
+    def getResult(self):
+        return self.result
+
+    def setResult(self, value):
+        self.result = value
+
+    def getInterimFields(self):
+        return self.interims
+
+    def setInterimFields(self, value):
+        self.interims = value
+
+    def calculateResult(self, override=False):
+        return False
+
+    def setResultsRange(self, value):
+        self.results_range = value
+
+    def setAllowManualDetectionLimit(self, value):
+        self.allow_manual_detection_limit = value
+
+    def setDetectionLimitOperand(self, value):
+        self.detection_limit_operand = value
+
+    def setResultCaptureDate(self, value):
+        self.capture_date = value
+
+
+class MemoryContainer(object):
+    """In-memory analyses container (Sample or Worksheet)
+    """
+
+    def __init__(self, container_id, portal_type="AnalysisRequest",
+                 state="sample_received", client_sample_id=None):
+        self.id = container_id
+        self.portal_type = portal_type
+        self.state = state
+        self.client_sample_id = client_sample_id
+        self.analyses = []
+
+    def add_analysis(self, keyword, **kwargs):
+        analysis = MemoryAnalysis(keyword, **kwargs)
+        self.analyses.append(analysis)
+        return analysis
+
+    def get_analyses(self, keywords, states=SUBMITTABLE_STATES):
+        return filter(lambda a: a.keyword in keywords and a.state in states,
+                      self.analyses)
+
+
+class MemoryBackend(Backend):
+    """Backend that keeps samples, worksheets and analyses in memory and
+    simulates the latency of catalog searches and writes, so the whole import
+    pipeline can be load-tested and profiled without a SENAITE site. The
+    catalog searches are the same as those made by the SENAITE backend
+    """
+
+    def __init__(self, query_latency=0.0, submit_latency=0.0):
+        """
+        :param query_latency: seconds each simulated catalog query takes
+        :param submit_latency: seconds each simulated submission takes
+        """
+        self.query_latency = query_latency
+        self.submit_latency = submit_latency
+        self.samples = {}
+        self.client_samples = {}
+        self.worksheets = {}
+        self.submitted = 0
+
+    def add_sample(self, sample_id, keywords, client_sample_id=None,
+                   state="sample_received"):
+        """Adds a sample with analyses for the keywords passed-in
+        """
+        sample = MemoryContainer(sample_id, state=state,
+                                 client_sample_id=client_sample_id)
+        map(sample.add_analysis, keywords)
+        self.samples[sample_id] = sample
+        if client_sample_id:
+            self.client_samples[client_sample_id] = sample
+        return sample
+
+    def add_worksheet(self, worksheet_id, analyses, state="open"):
+        """Adds a worksheet with the analyses passed-in
+        """
+        worksheet = MemoryContainer(worksheet_id, portal_type="Worksheet",
+                                    state=state)
+        worksheet.analyses.extend(analyses)
+        self.worksheets[worksheet_id] = worksheet
+        return worksheet
+
+    def add_samples_for(self, results):
+        """Adds the samples and analyses required for the results data passed
+        in (as returned by the interpreters) to find a match on import
+        """
+        keywords = {}
+        for result in results:
+            sample_id = result["id"][0]
+            keywords.setdefault(sample_id, set()).add(result["keyword"][0])
+        for sample_id, sample_keywords in keywords.items():
+            if sample_id not in self.samples:
+                self.add_sample(sample_id, sorted(sample_keywords))
+
+    def query(self, catalog, indexes, func):
+        """Simulates a catalog query, with the latency set for the backend
+        """
+        start = default_timer()
+        try:
+            if self.query_latency:
+                time.sleep(self.query_latency)
+            return func()
+        finally:
+            importer.record_query(catalog, indexes, default_timer() - start)
+
+    def search_container(self, container_ids):
+        # Try by Sample ID (only received samples can be submitted)
+        def by_id(storage, state):
+            found = map(storage.get, container_ids)
+            found = filter(lambda c: c and c.state == state, found)
+            return found and found[0] or None
+
+        sample = self.query(SAMPLES_CATALOG,
+                            ["portal_type", "getId", "review_state"],
+                            lambda: by_id(self.samples, "sample_received"))
+        if sample:
+            return sample
+
+        # Try by Worksheet ID (only open worksheets)
+        worksheet = self.query(WORKSHEETS_CATALOG,
+                               ["portal_type", "getId", "review_state"],
+                               lambda: by_id(self.worksheets, "open"))
+        if worksheet:
+            return worksheet
+
+        # Try by Client Sample ID
+        return self.query(SAMPLES_CATALOG,
+                          ["portal_type", "getClientSampleID", "review_state"],
+                          lambda: by_id(self.client_samples, "sample_received"))
+
+    def search_analysis(self, container, container_ids, keywords):
+        indexes = ["getKeyword", "portal_type", "review_state"]
+        analyses = self.query(ANALYSES_CATALOG,
+                              indexes + ["getAncestorsUIDs"],
+                              lambda: container.get_analyses(keywords))
+        if len(analyses) == 1:
+            return analyses[0]
+
+        # Simulate the search of reference analyses
+        self.query(ANALYSES_CATALOG,
+                   indexes + ["getReferenceAnalysesGroupID"], lambda: None)
+        return None
+
+    def submit(self, analysis, capture_date):
+        if self.submit_latency:
+            time.sleep(self.submit_latency)
+        analysis.setResultCaptureDate(capture_date)
+        analysis.state = "to_be_verified"
+        self.submitted += 1
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.LIS2A.
+#
+# SENAITE.LIS2A is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+import random
+from datetime import datetime
+from datetime import timedelta
+
+# Default delimiters (field, repeat, component and escape)
+DEFAULT_DELIMITERS = "|\\^&"
+
+
+class MessageGenerator(object):
+    """Generator of synthetic, valid LIS2-A2 messages
+    """
+
+    def __init__(self, specimens=1, results=3, field_width=8,
+                 delimiters=DEFAULT_DELIMITERS, composite=True,
+                 sender="SENAITE^Synthetic^1.0", priority="R", seed=None):
+        """
+        :param specimens: number of specimens (O records) per message
+        :param results: number of R records per order
+        :param field_width: width of specimen ids, test ids and results
+        :param delimiters: str with field, repeat, component and escape
+            delimiters, in this order
+        :param composite: whether all specimens are sent in a single
+            (composite) message or in a message for each specimen
+        :param sender: sender name (H.SenderName)
+        :param priority: priority of the orders (O.Priority)
+        :param seed: seed for the random generator, for reproducible messages
+        """
+        if len(delimiters) != 4 or len(set(delimiters)) != 4:
+            raise ValueError("Four different delimiters are required")
+        self.specimens = specimens
+        self.results = results
+        self.field_width = field_width
+        self.delimiters = delimiters
+        self.composite = composite
+        self.sender = sender
+        self.priority = priority
+        self.random = random.Random(seed)
+        self.date = datetime(2020, 1, 1)
+        self.counter = 0
+
+    @property
+    def field_delimiter(self):
+        return self.delimiters[0]
+
+    @property
+    def repeat_delimiter(self):
+        return self.delimiters[1]
+
+    @property
+    def component_delimiter(self):
+        return self.delimiters[2]
+
+    def next_date(self):
+        """Returns the next capture date in ANSI X3.30 format
+        """
+        self.date += timedelta(seconds=1)
+        return self.date.strftime("%Y%m%d%H%M%S")
+
+    def next_id(self, prefix):
+        """Returns a new unique id with the field width
+        """
+        self.counter += 1
+        return "{}{}".format(prefix, self.counter).zfill(self.field_width)
+
+    def make_value(self):
+        """Returns a random result value with the field width
+        """
+        value = "{:.3f}".format(self.random.uniform(0, 1000))
+        return value[:self.field_width]
+
+    def make_record(self, record_type, *fields):
+        return self.field_delimiter.join((record_type, ) + fields)
+
+    def make_header(self):
+        sender = self.sender.replace("^", self.component_delimiter)
+        fields = [""] * 12
+        fields[0] = self.delimiters[1:]
+        fields[3] = sender
+        fields[10] = "P"
+        fields[11] = "LIS2-A2"
+        return self.make_record("H", *(fields + [self.next_date()]))
+
+    def make_order(self, sequence, test_ids):
+        comp = self.component_delimiter
+        tests = map(lambda t: "{0}{0}{0}{1}".format(comp, t), test_ids)
+        tests = self.repeat_delimiter.join(tests)
+        specimen_id = self.next_id("S")
+        return self.make_record("O", str(sequence), specimen_id, "", tests,
+                                self.priority)
+
+    def make_result(self, sequence, test_id):
+        comp = self.component_delimiter
+        test = "{0}{0}{0}{1}".format(comp, test_id)
+        fields = [str(sequence), test, self.make_value(), "mg/L",
+                  "[0.5 - 1.5]", "N", "", "F", "", "", self.next_date()]
+        return self.make_record("R", *fields)
+
+    def make_specimen_records(self, sequence):
+        """Returns the O and R records for a single specimen
+        """
+        test_ids = map(lambda i: "T{}".format(i).zfill(self.field_width),
+                       range(self.results))
+        records = [self.make_order(sequence, test_ids)]
+        for index, test_id in enumerate(test_ids):
+            records.append(self.make_result(index + 1, test_id))
+        return records
+
+    def make_message(self, specimens):
+        """Returns a message with the number of specimens passed-in
+        """
+        records = [self.make_header(), self.make_record("P", "1")]
+        for sequence in range(specimens):
+            records.extend(self.make_specimen_records(sequence + 1))
+        records.append(self.make_record("L", "1", "N"))
+        return "\n".join(records)
+
+    def generate(self, count=1):
+        """Returns a list of messages in accordance with the settings
+        """
+        messages = []
+        for num in range(count):
+            if self.composite:
+                messages.append(self.make_message(self.specimens))
+            else:
+                messages.extend(map(lambda s: self.make_message(1),
+                                    range(self.specimens)))
+        return messages
+
+    def __iter__(self):
+        """Yields messages endlessly
+        """
+        while True:
+            for message in self.generate():
+                yield message
+
+
+def generate_messages(count=1, **kwargs):
+    """Returns a list with count synthetic LIS2-A2 messages. Keyword arguments
+    are the same as for MessageGenerator
+    """
+    return MessageGenerator(**kwargs).generate(count)
+
+
+def make_interpreter_configs(count, matching_sender=None):
+    """Returns a list of count interpreter configurations that extend from
+    LIS2-A2. Only the last one supports messages from the sender passed-in
+    """
+    configs = []
+    for num in range(count):
+        sender = "Device {}".format(num)
+        if matching_sender and num == count - 1:
+            sender = matching_sender
+        configs.append({
+            "id": "interpreter_{}".format(num),
+            "extends": "LIS2-A2",
+            "selection_criteria": {
+                "H.SenderName": sender,
+            },
+        })
+    return configs
@@ -0,0 +1,474 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.LIS2A.
+#
+# SENAITE.LIS2A is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+"""Load generator for the push pipeline. Replays captured or synthetic
+LIS2-A messages against the push consumer, either in-process (with the
+in-memory backend) or through the push endpoint of a local instance, at a
+target rate or at full speed, with concurrent simulated analyzers:
+
+    python -m senaite.lis2a.benchmarks.loadgen --analyzers 8 --rate 200
+    python -m senaite.lis2a.benchmarks.loadgen --url http://localhost:8080/senaite \\
+        --username admin --password secret --files captured/
+"""
+
+from __future__ import print_function
+
+import argparse
+import itertools
+import json
+import threading
+import time
+from timeit import default_timer
+
+from senaite.lis2a.benchmarks.generator import MessageGenerator
+from senaite.lis2a.benchmarks.pipeline import make_backend_for
+from senaite.lis2a.core import importer
+from senaite.lis2a.core import message as msgapi
+from senaite.lis2a.core.admission import AdmissionError
+from senaite.lis2a.core.admission import check_limits
+from senaite.lis2a.core.archive import Archive
+from senaite.lis2a.core.cli import iter_sources
+from senaite.lis2a.core.coalesce import COALESCE_MAX_MESSAGES
+from senaite.lis2a.core.coalesce import Coalescer
+from senaite.lis2a.core.interpreter import get_builtin_interpreters
+from senaite.lis2a.core.listener import PUSH_CONSUMER
+from senaite.lis2a.core.report import INVALID
+from senaite.lis2a.core.report import ImportReport
+from senaite.lis2a.core.report import NO_ANALYSIS
+from senaite.lis2a.core.report import NO_CONTAINER
+
+# Percentiles of the latency of pushes reported
+PERCENTILES = (50, 90, 95, 99)
+
+# Statuses of the results from pushes accepted that count as errors, because
+# the results were not imported
+RESULT_ERRORS = (NO_CONTAINER, NO_ANALYSIS, INVALID)
+
+
+def percentile(values, percent):
+    """Returns the percentile (nearest-rank) of the sorted values passed-in
+    """
+    if not values:
+        return 0.0
+    rank = int(round(percent / 100.0 * len(values) + 0.5)) - 1
+    return values[max(0, min(rank, len(values) - 1))]
+
+
+class PushError(Exception):
+    """Raised when a push is not accepted. The kind of error (e.g. the status
+    code of the response) is used for the breakdown of errors
+    """
+
+    def __init__(self, kind, message=""):
+        super(PushError, self).__init__(message or kind)
+        self.kind = kind
+
+
+class InProcessTarget(object):
+    """Pushes the messages through the same steps as the push consumer does,
+    with the in-memory backend, so no instance is required: admission limits,
+    compliance check, archiving of the raw messages, coalescing by specimen
+    (without queue, so the groups that are due are imported on each push) and
+    import. Interpreters keep the message being read, so each thread gets
+    interpreters of its own, as each request does in an instance
+    :param max_messages: max number of messages per push (0 for no limit)
+    :param max_bytes: max size in bytes of a push (0 for no limit)
+    :param archive: directory of the archive of raw messages, if any
+    :param coalesce_window: seconds the messages for a specimen are buffered
+        before import (0 to import them without delay)
+    :param coalesce_max_messages: number of messages for a specimen that are
+        imported without waiting for the window to elapse
+    """
+
+    def __init__(self, messages, max_messages=0, max_bytes=0, archive=None,
+                 coalesce_window=0, coalesce_max_messages=COALESCE_MAX_MESSAGES,
+                 **kwargs):
+        self.backend = make_backend_for(messages, **kwargs)
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.archive = archive and Archive(archive) or None
+        self.coalescer = None
+        if coalesce_window > 0:
+            self.coalescer = Coalescer(window=coalesce_window,
+                                       max_messages=coalesce_max_messages)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.previous = None
+
+    def __repr__(self):
+        return "in-process"
+
+    def open(self):
+        self.previous = importer.set_backend(self.backend)
+
+    def close(self):
+        importer.set_backend(self.previous)
+
+    def get_interpreters(self):
+        interpreters = getattr(self.local, "interpreters", None)
+        if interpreters is None:
+            interpreters = get_builtin_interpreters()
+            self.local.interpreters = interpreters
+        return interpreters
+
+    def push(self, messages):
+        """Pushes the messages and returns the ImportReport of the messages
+        imported, that might include messages coalesced from previous pushes
+        """
+        try:
+            check_limits(messages, max_messages=self.max_messages,
+                         max_bytes=self.max_bytes)
+        except AdmissionError as e:
+            raise PushError("http_{}".format(e.status), str(e))
+
+        if not all(map(msgapi.is_compliant, messages)):
+            raise PushError("not_compliant")
+
+        if self.archive:
+            self.archive.append(messages)
+
+        if self.coalescer:
+            with self.lock:
+                groups = []
+                for message in messages:
+                    groups.extend(self.coalescer.add(message))
+                groups.extend(self.coalescer.pop_due())
+            messages = list(itertools.chain(*groups))
+
+        report = ImportReport()
+        interpreters = self.get_interpreters()
+        for message in messages:
+            importer.import_message(message, interpreters, report)
+        return report
+
+    def flush(self):
+        """Imports the messages that remain coalesced and returns the
+        ImportReport, or None if there are none
+        """
+        if not self.coalescer:
+            return None
+        with self.lock:
+            groups = self.coalescer.pop_due(force=True)
+        report = ImportReport()
+        interpreters = self.get_interpreters()
+        for message in itertools.chain(*groups):
+            importer.import_message(message, interpreters, report)
+        return report
+
+
+class HTTPTarget(object):
+    """Pushes the messages to the push endpoint of senaite.jsonapi. Each
+    thread keeps a session of its own, so connections are reused
+    """
+
+    def __init__(self, url, username=None, password=None, timeout=60):
+        self.url = "{}/@@API/senaite/v1/push".format(url.rstrip("/"))
+        self.auth = username and (username, password) or None
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def __repr__(self):
+        return self.url
+
+    def open(self):
+        # Fail early if requests is not available
+        self.get_session()
+
+    def close(self):
+        pass
+
+    def get_session(self):
+        import requests
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.auth = self.auth
+            self.local.session = session
+        return session
+
+    def push(self, messages):
+        import requests
+        data = {"consumer": PUSH_CONSUMER, "messages": messages}
+        try:
+            response = self.get_session().post(self.url, json=data,
+                                               timeout=self.timeout)
+        except requests.RequestException as e:
+            raise PushError(type(e).__name__, str(e))
+        if response.status_code != 200:
+            raise PushError("http_{}".format(response.status_code))
+
+    def flush(self):
+        """Messages are coalesced by the instance, nothing to flush here
+        """
+        return None
+
+
+class Pacer(object):
+    """Spaces the pushes from all analyzers so messages are sent at the rate
+    passed-in (messages per second). Pushes are sent at full speed if the
+    rate is 0. Each push is scheduled for a time slot regardless of how long
+    previous pushes took, so slow responses do not lower the rate offered
+    """
+
+    def __init__(self, rate=0):
+        self.rate = rate
+        self.lock = threading.Lock()
+        self.start = None
+        self.sent = 0
+
+    def wait(self, count=1):
+        """Waits for the time slot of the push of count messages
+        """
+        if self.rate <= 0:
+            return
+        with self.lock:
+            if self.start is None:
+                self.start = default_timer()
+            slot = self.start + float(self.sent) / self.rate
+            self.sent += count
+        delay = slot - default_timer()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class LoadStats(object):
+    """Accounting of the pushes made, with the latency of each push and the
+    number of errors by kind. Errors are either pushes not accepted or results
+    from the pushes accepted that were not imported, by status
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.messages = 0
+        self.errors = {}
+        self.elapsed = 0.0
+
+    def add(self, latency, messages, error=None, report=None):
+        """Adds a push of the number of messages passed-in, with the error if
+        not accepted, or the ImportReport of the messages imported otherwise
+        """
+        with self.lock:
+            self.latencies.append(latency)
+            if error:
+                self.errors[error] = self.errors.get(error, 0) + 1
+            else:
+                self.messages += messages
+        self.add_report(report)
+
+    def add_report(self, report):
+        """Adds the results from the ImportReport passed-in that were not
+        imported to the errors, by status
+        """
+        if report is None:
+            return
+        counts = report.counts
+        with self.lock:
+            for status in RESULT_ERRORS:
+                if counts[status]:
+                    self.errors[status] = (self.errors.get(status, 0) +
+                                           counts[status])
+
+    def to_dict(self):
+        """Returns a dict with the throughput, latency percentiles (in
+        seconds) and the number of errors by kind
+        """
+        latencies = sorted(self.latencies)
+        elapsed = self.elapsed or 1e-9
+        stats = {
+            "pushes": len(latencies),
+            "messages": self.messages,
+            "errors": dict(self.errors),
+            "elapsed": self.elapsed,
+            "messages_per_second": self.messages / elapsed,
+            "pushes_per_second": len(latencies) / elapsed,
+            "latency": {
+                "mean": latencies and sum(latencies) / len(latencies) or 0.0,
+                "max": latencies and latencies[-1] or 0.0,
+            },
+        }
+        for percent in PERCENTILES:
+            key = "p{}".format(percent)
+            stats["latency"][key] = percentile(latencies, percent)
+        return stats
+
+    def summary(self):
+        """Returns a human-readable summary of the stats
+        """
+        stats = self.to_dict()
+        latency = stats["latency"]
+        lines = [
+            "{} messages in {} pushes in {:.2f}s: {:.1f} messages/s, "
+            "{:.1f} pushes/s".format(stats["messages"], stats["pushes"],
+                                     stats["elapsed"],
+                                     stats["messages_per_second"],
+                                     stats["pushes_per_second"]),
+            "latency (ms): mean={:.1f} {} max={:.1f}".format(
+                latency["mean"] * 1000, " ".join(map(
+                    lambda p: "p{}={:.1f}".format(
+                        p, latency["p{}".format(p)] * 1000), PERCENTILES)),
+                latency["max"] * 1000),
+        ]
+        errors = sorted(stats["errors"].items())
+        lines.append("errors: {}".format(", ".join(map(
+            lambda item: "{}={}".format(*item), errors)) or "none"))
+        return "\n".join(lines)
+
+
+def run(target, messages, analyzers=1, per_push=1, rate=0):
+    """Pushes the messages passed-in to the target from concurrent simulated
+    analyzers, each one pushing per_push messages at a time, and returns the
+    LoadStats. Messages are sent at the rate (messages per second) passed-in,
+    or at full speed if 0
+    """
+    stats = LoadStats()
+    pacer = Pacer(rate)
+    batches = iter(map(lambda start: messages[start:start + per_push],
+                       range(0, len(messages), per_push)))
+    lock = threading.Lock()
+
+    def analyzer():
+        while True:
+            with lock:
+                batch = next(batches, None)
+            if batch is None:
+                return
+            pacer.wait(len(batch))
+            error = report = None
+            start = default_timer()
+            try:
+                report = target.push(batch)
+            except PushError as e:
+                error = e.kind
+            except Exception as e:
+                error = type(e).__name__
+            stats.add(default_timer() - start, len(batch), error=error,
+                      report=report)
+
+    target.open()
+    try:
+        start = default_timer()
+        threads = map(lambda idx: threading.Thread(target=analyzer),
+                      range(analyzers))
+        map(lambda thread: thread.start(), threads)
+        map(lambda thread: thread.join(), threads)
+        # Import the messages that remain coalesced, if any
+        stats.add_report(target.flush())
+        stats.elapsed = default_timer() - start
+    finally:
+        target.close()
+    return stats
+
+
+def get_messages(count=0, files=None, **kwargs):
+    """Returns the list of messages to push. Messages are read from the files
+    (or directories) passed-in, if any, and repeated until count is reached.
+    Synthetic messages are generated otherwise
+    """
+    if not files:
+        return MessageGenerator(seed=0, **kwargs).generate(count or 1000)
+
+    messages = map(lambda source: source[1], iter_sources(files))
+    if not count or not messages:
+        return messages
+    return list(itertools.islice(itertools.cycle(messages), count))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Load generator for the push pipeline of senaite.lis2a. "
+                    "Pushes in-process with an in-memory backend unless an "
+                    "instance url is set")
+    parser.add_argument("--url", default=None,
+                        help="URL of the site to push to (e.g. "
+                             "http://localhost:8080/senaite)")
+    parser.add_argument("--username", default=None,
+                        help="User name for the push endpoint")
+    parser.add_argument("--password", default=None,
+                        help="Password for the push endpoint")
+    parser.add_argument("--files", nargs="+", default=None,
+                        help="Files or directories with captured messages "
+                             "to replay (default: synthetic messages)")
+    parser.add_argument("--messages", type=int, default=0,
+                        help="Messages to push (default: 1000, or all from "
+                             "the files)")
+    parser.add_argument("--analyzers", type=int, default=1,
+                        help="Concurrent simulated analyzers (default: 1)")
+    parser.add_argument("--per-push", type=int, default=1,
+                        help="Messages per push (default: 1)")
+    parser.add_argument("--rate", type=float, default=0,
+                        help="Target rate in messages/s (default: full "
+                             "speed)")
+    parser.add_argument("--specimens", type=int, default=1,
+                        help="Specimens per synthetic message (default: 1)")
+    parser.add_argument("--results", type=int, default=5,
+                        help="R records per order of synthetic messages "
+                             "(default: 5)")
+    parser.add_argument("--query-latency", type=float, default=0.0,
+                        help="Seconds per simulated catalog query "
+                             "(in-process)")
+    parser.add_argument("--submit-latency", type=float, default=0.0,
+                        help="Seconds per simulated submission (in-process)")
+    parser.add_argument("--max-messages", type=int, default=0,
+                        help="Max messages per push, as the push_max_messages "
+                             "setting (in-process)")
+    parser.add_argument("--max-bytes", type=int, default=0,
+                        help="Max bytes per push, as the push_max_bytes "
+                             "setting (in-process)")
+    parser.add_argument("--archive", default=None,
+                        help="Directory to archive the messages to, as the "
+                             "archive_directory setting (in-process)")
+    parser.add_argument("--coalesce-window", type=int, default=0,
+                        help="Seconds to coalesce the messages by specimen, "
+                             "as the coalesce_window setting (in-process)")
+    parser.add_argument("--coalesce-max-messages", type=int,
+                        default=COALESCE_MAX_MESSAGES,
+                        help="Messages for a specimen imported without "
+                             "waiting, as the coalesce_max_messages setting "
+                             "(in-process)")
+    parser.add_argument("--json", action="store_true",
+                        help="Print the stats as JSON")
+    args = parser.parse_args(argv)
+
+    messages = get_messages(args.messages, files=args.files,
+                            specimens=args.specimens, results=args.results)
+    if args.url:
+        target = HTTPTarget(args.url, username=args.username,
+                            password=args.password)
+    else:
+        target = InProcessTarget(
+            messages, max_messages=args.max_messages,
+            max_bytes=args.max_bytes, archive=args.archive,
+            coalesce_window=args.coalesce_window,
+            coalesce_max_messages=args.coalesce_max_messages,
+            query_latency=args.query_latency,
+            submit_latency=args.submit_latency)
+
+    stats = run(target, messages, analyzers=args.analyzers,
+                per_push=args.per_push, rate=args.rate)
+    if args.json:
+        print(json.dumps(stats.to_dict(), indent=2, sort_keys=True))
+    else:
+        print("Target: {}".format(target))
+        print(stats.summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.LIS2A.
+#
+# SENAITE.LIS2A is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+from __future__ import print_function
+
+import argparse
+import cProfile
+from timeit import default_timer
+
+from senaite.lis2a.benchmarks.backend import MemoryBackend
+from senaite.lis2a.benchmarks.generator import MessageGenerator
+from senaite.lis2a.core import importer
+from senaite.lis2a.core import message as msgapi
+from senaite.lis2a.core.interpreter import get_builtin_interpreters
+from senaite.lis2a.core.report import ImportReport
+
+
+def make_backend_for(messages, **kwargs):
+    """Returns a MemoryBackend with the samples and analyses required for the
+    results from the messages passed-in to find a match on import
+    """
+    backend = MemoryBackend(**kwargs)
+    interpreters = get_builtin_interpreters()
+    for message in messages:
+        for msg in msgapi.split_message(message):
+            interpreter = importer.select_interpreter(msg, interpreters)
+            if not interpreter:
+                # Not supported, the import of the message will fail
+                continue
+            try:
+                results = importer.extract_results(msg, interpreter)
+            except ValueError:
+                # Malformed, the import of the message will fail
+                continue
+            backend.add_samples_for(results)
+    return backend
+
+
+def run_pipeline(messages, backend, batch_size=100, jobs=1):
+    """Imports the messages passed-in in batches with the backend and returns
+    the aggregated ImportReport. Each batch goes through the same steps as a
+    push: compliance check and import with the built-in interpreters. The
+    extraction of results is done by a pool of processes if jobs is above 1
+    """
+    report = ImportReport()
+    interpreters = get_builtin_interpreters()
+    # The processes are started once for all batches
+    pool = None
+    if jobs > 1:
+        pool = importer.ExtractionPool(interpreters, jobs=jobs)
+    previous = importer.set_backend(backend)
+    try:
+        for start in range(0, len(messages), batch_size):
+            batch = messages[start:start + batch_size]
+            if not all(map(msgapi.is_compliant, batch)):
+                raise ValueError("Messages are not LIS2-A compliant")
+            importer.import_archive(batch, interpreters, jobs=jobs,
+                                    report=report, pool=pool)
+    finally:
+        importer.set_backend(previous)
+        if pool:
+            pool.close()
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Load test of the import pipeline of senaite.lis2a with "
+                    "an in-memory backend")
+    parser.add_argument("--messages", type=int, default=1000,
+                        help="Number of messages (default: 1000)")
+    parser.add_argument("--specimens", type=int, default=1,
+                        help="Specimens per message (default: 1)")
+    parser.add_argument("--results", type=int, default=5,
+                        help="R records per order (default: 5)")
+    parser.add_argument("--batch-size", type=int, default=100,
+                        help="Messages per push (default: 100)")
+    parser.add_argument("--query-latency", type=float, default=0.0,
+                        help="Seconds per simulated catalog query")
+    parser.add_argument("--submit-latency", type=float, default=0.0,
+                        help="Seconds per simulated submission")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Processes for the extraction of results "
+                             "(default: 1)")
+    parser.add_argument("--profile", default=None,
+                        help="Store cProfile stats of the run in this file")
+    args = parser.parse_args(argv)
+
+    generator = MessageGenerator(specimens=args.specimens,
+                                 results=args.results, seed=0)
+    messages = generator.generate(args.messages)
+    backend = make_backend_for(messages, query_latency=args.query_latency,
+                               submit_latency=args.submit_latency)
+
+    profiler = args.profile and cProfile.Profile() or None
+    start = default_timer()
+    if profiler:
+        profiler.enable()
+    report = run_pipeline(messages, backend, batch_size=args.batch_size,
+                          jobs=args.jobs)
+    if profiler:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+    elapsed = default_timer() - start
+
+    print(report.summary())
+    print("{} messages, {} results in {:.2f}s: {:.1f} messages/s, "
+          "{:.1f} results/s".format(report.messages, len(report.results),
+                                    elapsed, report.messages / elapsed,
+                                    len(report.results) / elapsed))
+
+
+if __name__ == "__main__":
+    main()
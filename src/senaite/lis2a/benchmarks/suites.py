@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.LIS2A.
+#
+# SENAITE.LIS2A is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+from __future__ import print_function
+
+import timeit
+from collections import OrderedDict
+
+from senaite.lis2a.benchmarks.generator import MessageGenerator
+from senaite.lis2a.benchmarks.generator import make_interpreter_configs
+from senaite.lis2a.core import message as msgapi
+from senaite.lis2a.core.importer import invalidate_selection_cache
+from senaite.lis2a.core.importer import select_interpreter
+from senaite.lis2a.core.interpreter import Interpreter
+from senaite.lis2a.core.interpreter import get_builtin_interpreters
+
+
+class Benchmark(object):
+    """A benchmark of a function call, timed with timeit
+    """
+
+    def __init__(self, name, func, *args):
+        self.name = name
+        self.func = func
+        self.args = args
+
+    def __call__(self):
+        return self.func(*self.args)
+
+    def run(self, number=None, repeat=3):
+        """Runs the benchmark and returns the best time per call in seconds
+        """
+        timer = timeit.Timer(self)
+        if not number:
+            number = autorange(timer)
+        timings = timer.repeat(repeat=repeat, number=number)
+        return min(timings) / number, number
+
+
+def autorange(timer, min_time=0.2):
+    """Returns the number of loops so the total time is at least min_time
+    """
+    number = 1
+    while True:
+        if timer.timeit(number) >= min_time:
+            return number
+        number *= 10
+
+
+def extract_results(interpreter, message):
+    """Extracts the results from the message with the interpreter
+    """
+    interpreter.read(message)
+    results = interpreter.get_results_data()
+    interpreter.close()
+    return results
+
+
+def select_interpreter_cold(message, interpreters):
+    """Selects the interpreter for the message with the selection cache
+    cleared, as for a message with a header signature not seen before
+    """
+    invalidate_selection_cache()
+    return select_interpreter(message, interpreters)
+
+
+def get_benchmarks(specimens=10, results=5, field_width=8, interpreters=20,
+                   delimiters=None):
+    """Returns the list of benchmarks for the parsing core
+    """
+    kwargs = dict(specimens=specimens, results=results,
+                  field_width=field_width, seed=0)
+    if delimiters:
+        kwargs["delimiters"] = delimiters
+
+    composite = MessageGenerator(composite=True, **kwargs).generate()[0]
+    single = MessageGenerator(composite=False, **kwargs).generate()[0]
+
+    builtin = get_builtin_interpreters()[0]
+    sender = msgapi.get_value_at(
+        msgapi.get_header(single), (4, 0),
+        field_delimiter=msgapi.get_field_delimiter(single),
+        component_delimiter=msgapi.get_component_delimiter(single))
+    configs = make_interpreter_configs(interpreters, matching_sender=sender)
+    registered = map(Interpreter, configs)
+
+    return [
+        Benchmark("split_message", msgapi.split_message, composite),
+        Benchmark("is_compliant", msgapi.is_compliant, single),
+        Benchmark("get_records", msgapi.get_records, single, "R"),
+        Benchmark("Interpreter.supports", builtin.supports, single),
+        Benchmark("get_results_data", extract_results, builtin, single),
+        Benchmark("select_interpreter ({} interpreters, cold)".format(
+                  interpreters), select_interpreter_cold, single, registered),
+        Benchmark("select_interpreter ({} interpreters, cached)".format(
+                  interpreters), select_interpreter, single, registered),
+    ]
+
+
+def run(benchmarks, number=None, repeat=3, name_filter=None):
+    """Runs the benchmarks passed-in and returns an ordered dict with the best
+    time per call in seconds for each benchmark
+    """
+    timings = OrderedDict()
+    for benchmark in benchmarks:
+        if name_filter and name_filter not in benchmark.name:
+            continue
+        timings[benchmark.name] = benchmark.run(number=number, repeat=repeat)
+    return timings
+
+
+def report(timings):
+    """Prints the timings in a table
+    """
+    width = max(map(len, timings.keys()) + [10])
+    print("{}  {:>14}  {:>10}".format("benchmark".ljust(width),
+                                      "usec per call", "loops"))
+    for name, (per_call, number) in timings.items():
+        print("{}  {:>14.2f}  {:>10}".format(name.ljust(width),
+                                             per_call * 1e6, number))
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.LIS2A.
+#
+# SENAITE.LIS2A is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+import json
+
+from Products.Five.browser import BrowserView
+from senaite.lis2a.api import archive as archiveapi
+from senaite.lis2a.core.archive import parse_date
+
+
+class ReplayView(BrowserView):
+    """Queues or imports again the archived messages that match with the
+    criteria from the parameters of a POST request: "sender", "specimen",
+    "fingerprint", "start" and "end" (local dates, as YYYY-MM-DD[THH:MM[:SS]])
+    and "limit". Replayed messages are not archived again
+    """
+
+    def __call__(self):
+        self.request.response.setHeader("Content-Type", "application/json")
+        if self.request.get("REQUEST_METHOD") != "POST":
+            return self.fail(405, "Only POST requests are supported")
+
+        try:
+            criteria = self.get_criteria()
+        except ValueError as e:
+            return self.fail(400, str(e))
+        if not any(criteria.values()):
+            return self.fail(400, "No criteria set")
+
+        try:
+            count = archiveapi.replay(**criteria)
+        except archiveapi.ArchiveError as e:
+            return self.fail(400, str(e))
+        return json.dumps({"success": True, "messages": count})
+
+    def get_criteria(self):
+        """Returns the criteria for the lookup of the archived messages from
+        the request. Raises a ValueError if a criterion is not valid
+        """
+        form = self.request.form
+        criteria = {}
+        for name in ("sender", "specimen", "fingerprint"):
+            criteria[name] = form.get(name) or None
+        for name in ("start", "end"):
+            value = form.get(name)
+            criteria[name] = value and parse_date(value) or None
+        limit = form.get("limit")
+        criteria["limit"] = limit and int(limit) or None
+        return criteria
+
+    def fail(self, status, message):
+        self.request.response.setStatus(status)
+        return json.dumps({"success": False, "message": message})
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.LIS2A.
+#
+# SENAITE.LIS2A is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+import json
+
+from Products.Five.browser import BrowserView
+from senaite.lis2a.api import coalesce as coalesceapi
+
+
+class CoalesceView(BrowserView):
+    """Queues or imports the messages coalesced by specimen whose window has
+    elapsed. Meant to be called periodically (e.g. with a clock-server), so
+    buffered messages are released even if no more messages are pushed. All
+    buffered messages are released with the "force" parameter
+    """
+
+    def __call__(self):
+        self.request.response.setHeader("Content-Type", "application/json")
+        force = self.request.form.get("force") in ("1", "true", "True")
+        # The messages of each specimen are processed in a transaction of
+        # their own, so a failure does not affect other specimens
+        groups = coalesceapi.process_due(force=force, commit=True)
+        return json.dumps({
+            "specimens": len(groups),
+            "messages": sum(map(len, groups)),
+        })
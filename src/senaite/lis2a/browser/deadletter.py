@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.LIS2A.
+#
+# SENAITE.LIS2A is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+import json
+
+from Products.Five.browser import BrowserView
+from senaite.lis2a.api import deadletter as deadletterapi
+
+
+class DeadLetterView(BrowserView):
+    """Retries the import of the messages from the dead-letter store whose
+    retry is due. Meant to be called periodically (e.g. with a clock-server).
+    Returns the results of the retries, along with the specimens that remain
+    in the store
+    """
+
+    def __call__(self):
+        self.request.response.setHeader("Content-Type", "application/json")
+        report = deadletterapi.retry_due()
+        store = deadletterapi.get_store()
+        parked = dict(map(lambda item: (item[0], item[1].to_dict()),
+                          store.items()))
+        return json.dumps({
+            "messages": report.messages,
+            "results": report.counts,
+            "parked": parked,
+        })
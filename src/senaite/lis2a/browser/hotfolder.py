@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.LIS2A.
+#
+# SENAITE.LIS2A is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+import json
+
+from Products.Five.browser import BrowserView
+from senaite.lis2a.api.hotfolder import import_hotfolder
+from senaite.lis2a.api.hotfolder import retry_failed
+
+
+class HotFolderView(BrowserView):
+    """Imports the messages from the files of the hot folder that are ready.
+    Meant to be called periodically (e.g. with a clock-server). A failed file
+    is moved back to the hot folder with the "retry" parameter, so it is
+    imported with the next call, after the messages imported already
+    """
+
+    def __call__(self):
+        self.request.response.setHeader("Content-Type", "application/json")
+        name = self.request.form.get("retry")
+        if name:
+            path = retry_failed(name)
+            return json.dumps({"retried": path and True or False})
+
+        report = import_hotfolder()
+        return json.dumps({
+            "messages": report.messages,
+            "counts": report.counts,
+            "timings": report.timings,
+        })
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.LIS2A.
+#
+# SENAITE.LIS2A is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+import itertools
+import json
+import zlib
+
+import transaction
+from Products.Five.browser import BrowserView
+from senaite.lis2a import api
+from senaite.lis2a import logger
+from senaite.lis2a.api import archive as archiveapi
+from senaite.lis2a.config import get_setting
+from senaite.lis2a.core import importer
+from senaite.lis2a.core import message as msgapi
+from senaite.lis2a.core import metrics
+from senaite.lis2a.core import stream
+from senaite.lis2a.core.report import ImportReport
+from ZODB.POSException import ConflictError
+
+# Number of messages queued or imported at once
+IMPORT_BATCH_SIZE = 100
+
+# Content types of newline-delimited JSON bodies
+NDJSON_TYPES = ("application/x-ndjson", "application/jsonl")
+
+# Content types of gzip-compressed bodies
+GZIP_TYPES = ("application/gzip", "application/x-gzip")
+
+
+class ImportView(BrowserView):
+    """Imports the LIS2-A messages from the body of a POST request, meant for
+    bulk uploads. The body can be gzip-compressed (Content-Encoding: gzip) and
+    contain either newline-delimited JSON (Content-Type: application/x-ndjson)
+    or concatenated messages or ASTM E1381 frames (any other Content-Type).
+    The body is read, decompressed and split into messages as a stream, and
+    messages are queued or imported in batches, each one committed in a
+    transaction of its own
+    """
+
+    def __call__(self):
+        self.request.response.setHeader("Content-Type", "application/json")
+        if self.request.get("REQUEST_METHOD") != "POST":
+            return self.fail(405, "Only POST requests are supported")
+
+        # Reject the upload while the queue backlog is full
+        try:
+            api.check_admission([])
+        except api.AdmissionError as e:
+            if e.retry_after:
+                self.request.response.setHeader("Retry-After",
+                                                str(e.retry_after))
+            return self.fail(e.status, str(e))
+
+        body = self.request.stdin
+        body.seek(0)
+        messages = stream.iter_messages(body, body_format=self.get_format(),
+                                        gzip=self.is_gzip())
+        batch_size = get_setting("import_batch_size", IMPORT_BATCH_SIZE)
+        self.counts = {"messages": 0, "invalid": 0, "failed": 0}
+        self.report = ImportReport()
+        while True:
+            try:
+                batch = list(itertools.islice(messages, batch_size))
+            except (ValueError, zlib.error) as e:
+                # Batches read before the failure are committed already
+                transaction.abort()
+                return self.fail(400, "Cannot read the messages after {} "
+                                      "messages: {}".format(
+                                          self.counts["messages"], e))
+            if not batch:
+                break
+            self.process(batch)
+            transaction.commit()
+
+        return json.dumps(dict(self.counts, success=True,
+                               imported=self.report.imported))
+
+    def process(self, messages):
+        """Queues or imports the LIS2-A compliant messages from the batch
+        passed-in. Non-compliant messages are skipped
+        """
+        valid = filter(msgapi.is_compliant, messages)
+        invalid = len(messages) - len(valid)
+        self.counts["messages"] += len(messages)
+        self.counts["invalid"] += invalid
+        if invalid:
+            metrics.PUSHED_MESSAGES.inc(invalid, outcome="invalid")
+        if not valid:
+            return
+
+        # Keep the raw messages received, so they can be replayed
+        archiveapi.archive_messages(valid)
+        if api.is_queue_available():
+            outcome = api.process_messages(valid, report=self.report)
+        else:
+            outcome = "imported"
+            self.import_messages(valid)
+        metrics.PUSHED_MESSAGES.inc(len(valid), outcome=outcome)
+
+    def import_messages(self, messages):
+        """Imports the messages passed-in. The changes made by a message that
+        cannot be imported are rolled back and the message is counted as
+        failed, without affecting the rest of messages of the upload
+        """
+        interpreters = api.get_interpreters()
+        with importer.cache_containers():
+            for message in messages:
+                savepoint = transaction.savepoint(optimistic=True)
+                try:
+                    api.import_message(message, report=self.report,
+                                       interpreters=interpreters)
+                except ConflictError:
+                    raise
+                except Exception as e:
+                    savepoint.rollback()
+                    self.counts["failed"] += 1
+                    logger.error("Cannot import message {}: {}".format(
+                        msgapi.get_fingerprint(message), str(e)))
+
+    def get_content_type(self):
+        """Returns the content type of the body, without parameters
+        """
+        content_type = self.request.getHeader("Content-Type") or ""
+        return content_type.split(";")[0].strip().lower()
+
+    def is_gzip(self):
+        """Returns whether the body is gzip-compressed
+        """
+        encoding = self.request.getHeader("Content-Encoding") or ""
+        if encoding.strip().lower() in ("gzip", "x-gzip"):
+            return True
+        return self.get_content_type() in GZIP_TYPES
+
+    def get_format(self):
+        """Returns the format of the body. The "format" parameter of the
+        request takes precedence over the content type
+        """
+        body_format = self.request.form.get("format")
+        if body_format in (stream.NDJSON, stream.TEXT):
+            return body_format
+        if self.get_content_type() in NDJSON_TYPES:
+            return stream.NDJSON
+        return stream.TEXT
+
+    def fail(self, status, message):
+        self.request.response.setStatus(status)
+        return json.dumps({"success": False, "message": message})
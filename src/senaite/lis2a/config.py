@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.LIS2A.
+#
+# SENAITE.LIS2A is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+import os
+
+import six
+from senaite.lis2a import PRODUCT_NAME
+
+# Prefix for the environment variables that can be used to override settings
+ENVIRON_PREFIX = "SENAITE_LIS2A_"
+
+
+def get_setting(name, default=None):
+    """Returns the value of the setting with the name passed-in. The value is
+    looked up in the product-config section of zope.conf first and in the
+    environment afterwards (e.g. SENAITE_LIS2A_QUEUE_BLOB_THRESHOLD), so each
+    ZEO client can be configured separately:
+
+        <product-config senaite.lis2a>
+            queue_blob_threshold 524288
+        </product-config>
+
+    The value is converted to the type of the default value, if any
+    """
+    value = get_product_config().get(name)
+    if value is None:
+        value = os.environ.get("{}{}".format(ENVIRON_PREFIX, name.upper()))
+    if value is None:
+        return default
+    return to_type(value, default)
+
+
+def get_product_config():
+    """Returns the dict with the product-config settings for this add-on
+    """
+    try:
+        from App.config import getConfiguration
+        product_config = getattr(getConfiguration(), "product_config", None)
+    except ImportError:
+        product_config = None
+    product_config = product_config or {}
+    return product_config.get(PRODUCT_NAME) or {}
+
+
+def to_type(value, default):
+    """Converts the value passed-in to the type of the default value
+    """
+    if default is None or not isinstance(value, six.string_types):
+        return value
+    if isinstance(default, bool):
+        return value.strip().lower() in ["1", "true", "yes", "on"]
+    if isinstance(default, six.integer_types + (float, )):
+        try:
+            return type(default)(value)
+        except ValueError:
+            return default
+    return value
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.LIS2A.
+#
+# SENAITE.LIS2A is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+"""Admission of the messages pushed. Pushes beyond the limits set for a
+single push are rejected before any processing, so the client can split them
+or throttle and retry later
+"""
+
+
+class AdmissionError(Exception):
+    """Raised when the messages pushed cannot be admitted because of the
+    limits set for the instance
+    """
+
+    def __init__(self, message, status=503, retry_after=None):
+        super(AdmissionError, self).__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+def check_limits(messages, max_messages=0, max_bytes=0):
+    """Raises an AdmissionError if the messages passed-in exceed the limits
+    set for a single push: max number of messages and max size in bytes. A
+    limit of 0 means no limit
+    """
+    if 0 < max_messages < len(messages):
+        raise AdmissionError(
+            "Too many messages: {} (max. {})".format(
+                len(messages), max_messages), status=413)
+
+    if max_bytes > 0:
+        num_bytes = sum(map(len, messages))
+        if num_bytes > max_bytes:
+            raise AdmissionError(
+                "Messages are too large: {} bytes (max. {})".format(
+                    num_bytes, max_bytes), status=413)
@@ -0,0 +1,313 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.LIS2A.
+#
+# SENAITE.LIS2A is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+"""Append-only archive of the raw messages received. Messages are compressed
+one by one and appended to segment files that are rotated by size, and an
+index (sqlite) keeps the timestamp, sender, specimen and fingerprint of each
+message together with its location, so messages can be looked up and
+replayed without scanning the segments:
+
+    senaite-lis2a-archive /var/senaite/lis2a/archive --sender COBAS \\
+        --start 2020-10-21T10:00 --end 2020-10-21T11:00 > messages.txt
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from datetime import datetime
+
+from senaite.lis2a.core import message as msgapi
+from senaite.lis2a.core.coalesce import get_specimen_id
+from senaite.lis2a.core.payload import to_bytes
+
+# Size in bytes above which a new segment is started
+SEGMENT_SIZE = 64 * 1024 * 1024
+
+# Name of the index database within the archive directory
+INDEX_NAME = "index.sqlite"
+
+# Extension of the segment files
+SEGMENT_EXTENSION = ".seg"
+
+# Position of the Sender Name field of the (H)eader record
+SENDER_NAME_POSITION = (4, 0)
+
+# Formats of dates accepted from the command line
+DATE_FORMATS = ("%Y-%m-%dT%H:%M:%S", "%Y-%m-%dT%H:%M", "%Y-%m-%d")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    sender TEXT,
+    specimen TEXT,
+    fingerprint TEXT NOT NULL,
+    segment TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_ts ON messages (ts);
+CREATE INDEX IF NOT EXISTS idx_sender_ts ON messages (sender, ts);
+CREATE INDEX IF NOT EXISTS idx_specimen ON messages (specimen);
+CREATE INDEX IF NOT EXISTS idx_fingerprint ON messages (fingerprint);
+CREATE TABLE IF NOT EXISTS specimens (
+    message_id INTEGER NOT NULL,
+    specimen TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_specimens ON specimens (specimen);
+"""
+
+
+def get_sender(message):
+    """Returns the Sender Name from the (H)eader record of the message
+    passed-in, or None
+    """
+    try:
+        return msgapi.get_value_at(
+            msgapi.get_header(message), SENDER_NAME_POSITION,
+            field_delimiter=msgapi.get_field_delimiter(message),
+            component_delimiter=msgapi.get_component_delimiter(message))
+    except (ValueError, TypeError, IndexError):
+        return None
+
+
+def get_specimen_ids(message):
+    """Returns the list of Specimen IDs from the message passed-in, one for
+    each sub-message if composite
+    """
+    specimen_ids = []
+    for msg in msgapi.split_message(message) or [message]:
+        specimen_id = get_specimen_id(msg)
+        if specimen_id and specimen_id not in specimen_ids:
+            specimen_ids.append(specimen_id)
+    return specimen_ids
+
+
+class Archive(object):
+    """Compressed, segment-rotated, append-only archive of messages with an
+    index for lookups. Each process writes to segments of its own, so several
+    processes can append to the same archive
+    :param directory: directory of the archive
+    :param segment_size: size in bytes above which a new segment is started
+    :param writer: name of the writer, used as prefix of its segments
+    """
+
+    def __init__(self, directory, segment_size=SEGMENT_SIZE, writer=None):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.writer = writer or "{}-{}".format(socket.gethostname(),
+                                               os.getpid())
+        self.segment_number = 0
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.get_connection().executescript(SCHEMA)
+
+    def get_connection(self):
+        """Returns the connection to the index for current thread
+        """
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            path = os.path.join(self.directory, INDEX_NAME)
+            connection = sqlite3.connect(path, timeout=30)
+            self.local.connection = connection
+        return connection
+
+    def get_segment(self):
+        """Returns the name of the segment to append to, rotated by size
+        """
+        while True:
+            name = "{}-{:06d}{}".format(self.writer, self.segment_number,
+                                        SEGMENT_EXTENSION)
+            path = os.path.join(self.directory, name)
+            if not os.path.exists(path):
+                return name
+            if os.path.getsize(path) < self.segment_size:
+                return name
+            self.segment_number += 1
+
+    def append(self, messages, timestamp=None):
+        """Appends the messages passed-in to the archive, indexed with the
+        timestamp (reception time by default)
+        """
+        if timestamp is None:
+            timestamp = time.time()
+
+        rows = []
+        with self.lock:
+            segment = self.get_segment()
+            path = os.path.join(self.directory, segment)
+            with open(path, "ab") as f:
+                offset = f.tell()
+                for message in messages:
+                    message = to_bytes(message)
+                    data = zlib.compress(message)
+                    f.write(data)
+                    rows.append(((timestamp, get_sender(message),
+                                  get_specimen_id(message),
+                                  msgapi.get_fingerprint(message), segment,
+                                  offset, len(data)),
+                                 get_specimen_ids(message)))
+                    offset += len(data)
+
+        connection = self.get_connection()
+        with connection:
+            for row, specimen_ids in rows:
+                cursor = connection.execute(
+                    "INSERT INTO messages (ts, sender, specimen, fingerprint, "
+                    "segment, offset, length) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    row)
+                # Composite messages can be found by any of their specimens
+                connection.executemany(
+                    "INSERT INTO specimens (message_id, specimen) "
+                    "VALUES (?, ?)", map(lambda specimen_id: (
+                        cursor.lastrowid, specimen_id), specimen_ids))
+        return len(rows)
+
+    def search(self, sender=None, specimen=None, fingerprint=None,
+               start=None, end=None, limit=None):
+        """Returns the index entries that match with the criteria passed-in,
+        sorted by timestamp, as (timestamp, sender, specimen, fingerprint,
+        segment, offset, length) tuples
+        :param start: timestamp from which messages are considered, inclusive
+        :param end: timestamp until which messages are considered, exclusive
+        """
+        conditions = []
+        params = []
+        for column, value in (("sender", sender),
+                              ("fingerprint", fingerprint)):
+            if value is not None:
+                conditions.append("{} = ?".format(column))
+                params.append(value)
+        if specimen is not None:
+            # Any of the specimens of composite messages. Entries archived
+            # before specimens were indexed only have the first one
+            conditions.append("(specimen = ? OR id IN (SELECT message_id "
+                              "FROM specimens WHERE specimen = ?))")
+            params.extend([specimen, specimen])
+        if start is not None:
+            conditions.append("ts >= ?")
+            params.append(start)
+        if end is not None:
+            conditions.append("ts < ?")
+            params.append(end)
+
+        query = "SELECT ts, sender, specimen, fingerprint, segment, offset, " \
+                "length FROM messages"
+        if conditions:
+            query += " WHERE {}".format(" AND ".join(conditions))
+        query += " ORDER BY ts, id"
+        if limit:
+            query += " LIMIT {:d}".format(limit)
+        return self.get_connection().execute(query, params).fetchall()
+
+    def read(self, entry):
+        """Returns the message for the index entry passed-in
+        """
+        segment, offset, length = entry[-3:]
+        with open(os.path.join(self.directory, segment), "rb") as f:
+            f.seek(offset)
+            return zlib.decompress(f.read(length))
+
+    def iter_messages(self, **criteria):
+        """Generates the messages that match with the criteria, sorted by
+        timestamp. Accepts the same criteria as search
+        """
+        files = {}
+        try:
+            for entry in self.search(**criteria):
+                segment, offset, length = entry[-3:]
+                f = files.get(segment)
+                if f is None:
+                    path = os.path.join(self.directory, segment)
+                    f = files[segment] = open(path, "rb")
+                f.seek(offset)
+                yield zlib.decompress(f.read(length))
+        finally:
+            map(lambda f: f.close(), files.values())
+
+
+def parse_date(value):
+    """Returns the timestamp for the local date passed-in as a string, in one
+    of the DATE_FORMATS. Raises a ValueError if not a valid date
+    """
+    for date_format in DATE_FORMATS:
+        try:
+            date = datetime.strptime(value, date_format)
+        except ValueError:
+            continue
+        return time.mktime(date.timetuple())
+    raise ValueError("Not a valid date: {}".format(value))
+
+
+def to_timestamp(value):
+    """Returns the timestamp for the date passed-in as a string
+    """
+    try:
+        return parse_date(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Writes the archived messages that match with the "
+                    "criteria to the standard output, ready to be replayed")
+    parser.add_argument("directory", help="Directory of the archive")
+    parser.add_argument("--sender", default=None, help="Sender name")
+    parser.add_argument("--specimen", default=None, help="Specimen ID")
+    parser.add_argument("--fingerprint", default=None,
+                        help="Fingerprint of the message")
+    parser.add_argument("--start", type=to_timestamp, default=None,
+                        help="Received from this local date (inclusive), as "
+                             "YYYY-MM-DD[THH:MM[:SS]]")
+    parser.add_argument("--end", type=to_timestamp, default=None,
+                        help="Received until this local date (exclusive)")
+    parser.add_argument("--limit", type=int, default=None,
+                        help="Maximum number of messages")
+    parser.add_argument("--list", action="store_true",
+                        help="List the index entries instead of the messages")
+    args = parser.parse_args(argv)
+
+    archive = Archive(args.directory)
+    criteria = dict(sender=args.sender, specimen=args.specimen,
+                    fingerprint=args.fingerprint, start=args.start,
+                    end=args.end, limit=args.limit)
+    if args.list:
+        for entry in archive.search(**criteria):
+            received = datetime.fromtimestamp(entry[0]).isoformat()
+            print("\t".join([received] + map(lambda v: v or "", entry[1:4])))
+        return
+
+    for message in archive.iter_messages(**criteria):
+        sys.stdout.write(message)
+        sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.LIS2A.
+#
+# SENAITE.LIS2A is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+
+class Backend(object):
+    """Backend used by the import of results for the search of analyses and
+    the storage of results. The default backend searches and writes on the
+    SENAITE site, but other backends can be plugged-in (e.g. an in-memory
+    backend for benchmarking)
+    """
+
+    def search_container(self, container_ids):
+        """Returns the analyses container (e.g. Sample or Worksheet) that
+        matches with any of the ids passed-in, if any
+        """
+        raise NotImplementedError("search_container not implemented")
+
+    def search_analysis(self, container, container_ids, keywords):
+        """Returns the analysis from the container that matches with any of
+        the keywords, or the reference analysis for the container ids passed
+        in and the keywords, if any
+        """
+        raise NotImplementedError("search_analysis not implemented")
+
+    def set_result(self, analysis, data):
+        """Sets the result, interims and ranges from the result data to the
+        analysis passed in. Returns whether the result of the analysis changed
+        """
+        from senaite.lis2a.core.importer import set_result
+        return set_result(analysis, data)
+
+    def submit(self, analysis, capture_date):
+        """Sets the capture date to the analysis and submits the result
+        """
+        raise NotImplementedError("submit not implemented")
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.LIS2A.
+#
+# SENAITE.LIS2A is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+"""Command line tool to extract the results from files with LIS2-A messages
+without a SENAITE instance, e.g. to validate interpreters against captured
+messages or to process historical data:
+
+    senaite-lis2a-extract --interpreters ./interpreters --jobs 4 \\
+        --format csv --output results.csv ./captures
+"""
+
+from __future__ import print_function
+
+import argparse
+import csv
+import json
+import os
+import sys
+from collections import deque
+from datetime import datetime
+
+from senaite.lis2a.core import message as msgapi
+from senaite.lis2a.core.compat import string_types
+from senaite.lis2a.core.importer import extract_messages
+from senaite.lis2a.core.interpreter import get_builtin_interpreters
+from senaite.lis2a.core.interpreter import get_interpreters_from_directory
+
+# Output formats supported
+JSONL = "jsonl"
+CSV = "csv"
+
+# Columns of the CSV output
+CSV_COLUMNS = ("source", "fingerprint", "interpreter", "id", "keyword",
+               "detection_limit", "result", "units", "capture_date",
+               "interims")
+
+# Name of the source for the messages read from the standard input
+STDIN = "-"
+
+
+def iter_files(paths, extensions=None):
+    """Generates the paths of the files from the paths passed-in. Directories
+    are walked recursively and files are generated sorted by name
+    :param extensions: extensions of the files to consider within directories
+    """
+    for path in paths:
+        if path == STDIN or not os.path.isdir(path):
+            yield path
+            continue
+
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if extensions and not name.endswith(tuple(extensions)):
+                    continue
+                yield os.path.join(root, name)
+
+
+def iter_sources(paths, extensions=None):
+    """Generates (source, message) tuples for the messages from the files
+    passed-in. Files are read line by line, so they are never fully loaded
+    """
+    for path in iter_files(paths, extensions=extensions):
+        if path == STDIN:
+            for message in msgapi.iter_messages(sys.stdin):
+                yield path, message
+            continue
+
+        with open(path, "rU") as f:
+            for message in msgapi.iter_messages(f):
+                yield path, message
+
+
+def get_interpreters(directories, builtin=True):
+    """Returns the interpreters from the JSON files of the directories
+    passed-in, followed by the built-in ones unless builtin is False
+    """
+    interpreters = []
+    for directory in directories:
+        interpreters.extend(get_interpreters_from_directory(directory))
+    if builtin:
+        interpreters.extend(get_builtin_interpreters())
+    return interpreters
+
+
+def to_json_value(value):
+    """Returns a JSON serializable representation of the value passed-in
+    """
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError("{} is not JSON serializable".format(repr(value)))
+
+
+def to_csv_value(value):
+    """Returns the value passed-in as a str suitable for a CSV cell. Lists and
+    dicts are stored as JSON
+    """
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (list, tuple, dict)):
+        return json.dumps(value, default=to_json_value, sort_keys=True)
+    if isinstance(value, string_types):
+        return value
+    return str(value)
+
+
+class JSONLinesWriter(object):
+    """Writes the records as JSON Lines
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, record):
+        self.stream.write(json.dumps(record, default=to_json_value))
+        self.stream.write("\n")
+
+
+class CSVWriter(object):
+    """Writes the records as CSV, with the columns from CSV_COLUMNS
+    """
+
+    def __init__(self, stream):
+        self.writer = csv.writer(stream)
+        self.writer.writerow(CSV_COLUMNS)
+
+    def write(self, record):
+        self.writer.writerow(map(lambda column: to_csv_value(
+            record.get(column)), CSV_COLUMNS))
+
+
+WRITERS = {
+    JSONL: JSONLinesWriter,
+    CSV: CSVWriter,
+}
+
+
+def extract(sources, interpreters, writer, jobs=1, errors=None):
+    """Extracts the results from the (source, message) tuples passed-in with
+    the interpreters and writes them with the writer. Returns a dict with the
+    number of messages, results and messages without interpreter
+    :param errors: stream to report the messages without interpreter to
+    """
+    counts = {"messages": 0, "results": 0, "unsupported": 0}
+
+    # Messages are consumed before their results are generated, so the source
+    # of each message is kept until its results are written
+    pending = deque()
+
+    def iter_messages():
+        for source, message in sources:
+            pending.append(source)
+            yield message
+
+    extracted = extract_messages(iter_messages(), interpreters, jobs=jobs)
+    for message_results, timings in extracted:
+        source = pending.popleft()
+        for interpreter, results, fingerprint in message_results:
+            counts["messages"] += 1
+            if not interpreter:
+                counts["unsupported"] += 1
+                if errors:
+                    print("{}: no interpreter found for message {}".format(
+                        source, fingerprint), file=errors)
+                continue
+
+            for result in results:
+                counts["results"] += 1
+                record = dict(result, source=source, fingerprint=fingerprint,
+                              interpreter=interpreter.id)
+                writer.write(record)
+
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Extracts the results from files with LIS2-A messages "
+                    "as JSON Lines or CSV")
+    parser.add_argument("paths", nargs="+",
+                        help="Files or directories with messages, or '-' to "
+                             "read from the standard input")
+    parser.add_argument("-i", "--interpreters", action="append", default=[],
+                        help="Directory with interpreters as JSON files. Can "
+                             "be set more than once")
+    parser.add_argument("--no-builtin", action="store_true",
+                        help="Do not use the built-in interpreters")
+    parser.add_argument("-f", "--format", choices=sorted(WRITERS.keys()),
+                        default=JSONL, help="Output format (default: jsonl)")
+    parser.add_argument("-o", "--output", default=None,
+                        help="Output file (default: standard output)")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Processes for the extraction, 0 for as many as "
+                             "CPUs (default: 1)")
+    parser.add_argument("-e", "--extension", action="append", default=[],
+                        help="Extension of the files to read from directories "
+                             "(default: all files)")
+    args = parser.parse_args(argv)
+
+    interpreters = get_interpreters(args.interpreters,
+                                    builtin=not args.no_builtin)
+    if not interpreters:
+        parser.error("No interpreters available")
+
+    sources = iter_sources(args.paths, extensions=args.extension)
+    output = args.output and open(args.output, "wb") or sys.stdout
+    try:
+        writer = WRITERS[args.format](output)
+        counts = extract(sources, interpreters, writer,
+                         jobs=args.jobs or None, errors=sys.stderr)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    print("{messages} messages, {results} results, {unsupported} messages "
+          "without interpreter".format(**counts), file=sys.stderr)
+    return counts["unsupported"] and 1 or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
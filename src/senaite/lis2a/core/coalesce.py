@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.LIS2A.
+#
+# SENAITE.LIS2A is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+"""Coalescing of messages by specimen. Some instruments send a message per
+test as soon as each test finishes. Messages are buffered by specimen for a
+time window, or until a number of messages is reached, so the results for
+the same specimen are imported together, within a single transaction
+"""
+
+import heapq
+import time
+
+from senaite.lis2a.core import message as msgapi
+
+# Seconds the messages for a specimen are buffered at most
+COALESCE_WINDOW = 30
+
+# Number of messages for a specimen that are released without waiting
+COALESCE_MAX_MESSAGES = 50
+
+# Positions of the Specimen ID and Instrument Specimen ID fields of the
+# (O)rder record, as defined in LIS2-A2
+SPECIMEN_ID_POSITIONS = ((2, 0), (3, 0))
+
+
+def get_specimen_id(message):
+    """Returns the Specimen ID from the first (O)rder record of the message
+    passed-in, or the Instrument Specimen ID if empty. Returns None if the
+    message has no (O)rder record or the fields are empty
+    """
+    record = msgapi.get_record(message, "O")
+    if not record:
+        return None
+
+    delimiters = {
+        "field_delimiter": msgapi.get_field_delimiter(message),
+        "component_delimiter": msgapi.get_component_delimiter(message),
+    }
+    for position in SPECIMEN_ID_POSITIONS:
+        try:
+            specimen_id = msgapi.get_value_at(record, position, **delimiters)
+        except ValueError:
+            # The record does not have the field
+            return None
+        if specimen_id:
+            return specimen_id
+    return None
+
+
+class Coalescer(object):
+    """Buffers messages by specimen. The buffer is kept in the storage
+    passed-in, a mapping of Specimen ID -> tuple of (timestamp, message).
+    The deadline of each specimen is kept in a heap, so the groups that are
+    due are found without going through the whole buffer
+    :param window: seconds the messages for a specimen are buffered at most
+    :param max_messages: number of messages for a specimen that are released
+        without waiting for the window to elapse
+    """
+
+    def __init__(self, window=COALESCE_WINDOW,
+                 max_messages=COALESCE_MAX_MESSAGES, storage=None):
+        self.window = window
+        self.max_messages = max_messages
+        self.storage = {} if storage is None else storage
+        self.deadlines = []
+
+    def add(self, message, now=None):
+        """Buffers the message passed-in and returns the list of groups of
+        messages that are released. Composite messages are split, so each
+        sub-message is buffered with those for the same specimen. Messages
+        without Specimen ID are released immediately
+        """
+        if now is None:
+            now = time.time()
+
+        released = []
+        for msg in msgapi.split_message(message) or [message]:
+            specimen_id = get_specimen_id(msg)
+            if not specimen_id:
+                released.append([msg])
+                continue
+
+            size = self.append(specimen_id, (now, msg))
+            if size == 1:
+                # First message for the specimen, the window starts now
+                self.schedule(specimen_id, now + self.window)
+            if size >= self.max_messages:
+                released.append(self.pop(specimen_id))
+        return released
+
+    def append(self, specimen_id, entry):
+        """Buffers the entry (timestamp, message) for the specimen passed-in
+        and returns the number of messages buffered for the specimen
+        """
+        entries = self.storage.get(specimen_id, ()) + (entry, )
+        self.storage[specimen_id] = entries
+        return len(entries)
+
+    def schedule(self, specimen_id, deadline):
+        """Sets the time when the messages for the specimen are released
+        """
+        heapq.heappush(self.deadlines, (deadline, specimen_id))
+
+    def get_entries(self, specimen_id):
+        """Returns the tuple of (timestamp, message) buffered for the
+        specimen passed-in
+        """
+        return self.storage.get(specimen_id) or ()
+
+    def is_due(self, specimen_id, now):
+        """Returns whether the window of the specimen passed-in has elapsed
+        """
+        entries = self.get_entries(specimen_id)
+        return bool(entries) and now - entries[0][0] >= self.window
+
+    def get_due(self, now):
+        """Returns the Specimen IDs whose window has elapsed
+        """
+        due = []
+        while self.deadlines and self.deadlines[0][0] <= now:
+            deadline, specimen_id = heapq.heappop(self.deadlines)
+            # Messages might have been released already because of the max
+            # number of messages, and buffered again afterwards
+            if self.is_due(specimen_id, now):
+                due.append(specimen_id)
+        return due
+
+    def pop(self, specimen_id):
+        """Returns the list of messages buffered for the specimen passed-in
+        and removes them from the buffer
+        """
+        entries = self.storage.pop(specimen_id, None) or ()
+        return map(lambda entry: entry[1], entries)
+
+    def pop_due(self, now=None, force=False):
+        """Returns the list of groups of messages whose first message has been
+        buffered for the window seconds, and removes them from the buffer.
+        All groups are returned if force is True
+        """
+        if now is None:
+            now = time.time()
+
+        if force:
+            specimen_ids = list(self.storage.keys())
+        else:
+            specimen_ids = self.get_due(now)
+        return filter(None, map(self.pop, specimen_ids))
+
+    def release(self, specimen_ids, now=None):
+        """Returns the list of groups of messages for the specimens passed-in
+        whose window has elapsed, and removes them from the buffer
+        """
+        if now is None:
+            now = time.time()
+
+        due = filter(lambda spec_id: self.is_due(spec_id, now),
+                     set(specimen_ids))
+        return filter(None, map(self.pop, due))
+
+    def __len__(self):
+        return sum(map(len, self.storage.values()))
@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.LIS2A.
+#
+# SENAITE.LIS2A is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+"""Criteria of interpreters. The expected values of criteria are compiled
+once into matchers, functions that return whether a value meets the
+criteria. Besides a string (exact match) or a list of strings (any of), the
+expected value can be a dict with an operator:
+
+    {"prefix": "cobas"}                value starts with (any of) the prefix
+    {"iexact": ["F", "C"]}             case-insensitive match with any of
+    {"regex": "^cobas (6000|8000)$"}   value matches the regular expression
+    {"range": [0, 10]}                 numeric value within the limits
+    {"not": <criteria>}                value does not meet the criteria
+
+All criteria must be met, so the evaluation stops with the first criteria
+that is not met. Criteria are evaluated in ascending order of their cost
+divided by their observed rejection rate, so cheap criteria that often reject
+the message go first and the messages not supported are rejected with the
+fewest records scanned
+"""
+
+import re
+import threading
+
+from senaite.lis2a.core.compat import string_types
+
+# Relative cost of the evaluation of a criteria by record type. The header is
+# always the first record, while criteria on other records have to scan the
+# records of the message, and (R)esult records are the most numerous
+RECORD_COSTS = {
+    "H": 1,
+    "P": 2,
+    "O": 2,
+    "C": 3,
+    "M": 3,
+    "S": 3,
+    "Q": 3,
+    "L": 3,
+    "R": 4,
+}
+
+# Cost of the criteria for other record types
+DEFAULT_COST = 4
+
+# Number of evaluations after which the order of the criteria is computed
+# again, from the rejection rates observed
+REORDER_INTERVAL = 100
+
+# Statistics of criteria, by key of the criteria (e.g. selection_key of the
+# interpreter), so interpreters with the same id but other criteria do not
+# share the statistics
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def compile_criteria(criteria):
+    """Returns a dict with the matchers for the criteria passed-in, by key
+    """
+    return dict(map(lambda item: (item[0], compile_criterion(item[1])),
+                    criteria.items()))
+
+
+def compile_criterion(expected_value):
+    """Returns the matcher for the expected value passed-in, a function that
+    returns whether a value (stripped) meets the criteria. Raises a ValueError
+    if the expected value is not supported
+    """
+    if callable(expected_value):
+        # Compiled already
+        return expected_value
+
+    if expected_value is None:
+        expected_value = ""
+
+    if isinstance(expected_value, string_types):
+        expected_value = expected_value.strip()
+        return lambda value: value == expected_value
+
+    if isinstance(expected_value, (list, tuple)):
+        if all(map(lambda item: isinstance(item, string_types),
+                   expected_value)):
+            expected_values = frozenset(expected_value)
+            return lambda value: value in expected_values
+        matchers = map(compile_criterion, expected_value)
+        return lambda value: any(map(lambda match: match(value), matchers))
+
+    if isinstance(expected_value, dict) and len(expected_value) == 1:
+        operator, operand = expected_value.items()[0]
+        compiler = OPERATORS.get(operator)
+        if compiler:
+            return compiler(operand)
+
+    raise ValueError("Criteria not supported: {}".format(repr(expected_value)))
+
+
+def to_strings(operand):
+    """Returns a tuple with the string or strings passed-in
+    """
+    if isinstance(operand, string_types):
+        return (operand, )
+    if isinstance(operand, (list, tuple)) and all(map(
+            lambda item: isinstance(item, string_types), operand)):
+        return tuple(operand)
+    raise ValueError("Criteria not supported: {}".format(repr(operand)))
+
+
+def compile_prefix(operand):
+    prefixes = to_strings(operand)
+    return lambda value: value.startswith(prefixes)
+
+
+def compile_iexact(operand):
+    expected_values = frozenset(map(lambda item: item.strip().lower(),
+                                    to_strings(operand)))
+    return lambda value: value.lower() in expected_values
+
+
+def compile_regex(operand):
+    pattern = re.compile(operand)
+    return lambda value: pattern.search(value) is not None
+
+
+def compile_range(operand):
+    if not isinstance(operand, (list, tuple)) or len(operand) != 2:
+        raise ValueError("Range not supported: {}".format(repr(operand)))
+    try:
+        min_value, max_value = map(to_limit, operand)
+    except (TypeError, ValueError):
+        raise ValueError("Range not supported: {}".format(repr(operand)))
+
+    def match(value):
+        try:
+            value = float(value)
+        except ValueError:
+            return False
+        if min_value is not None and value < min_value:
+            return False
+        if max_value is not None and value > max_value:
+            return False
+        return True
+    return match
+
+
+def to_limit(value):
+    """Returns the limit of a range as a float, or None if no limit
+    """
+    if value is None:
+        return None
+    return float(value)
+
+
+def compile_not(operand):
+    matcher = compile_criterion(operand)
+    return lambda value: not matcher(value)
+
+
+# Compilers of criteria, by operator
+OPERATORS = {
+    "prefix": compile_prefix,
+    "iexact": compile_iexact,
+    "regex": compile_regex,
+    "range": compile_range,
+    "not": compile_not,
+}
+
+
+def get_cost(key):
+    """Returns the relative cost of the evaluation of the criteria for the
+    key (<record_type>.<field_name>) passed-in
+    """
+    return RECORD_COSTS.get(key.split(".")[0], DEFAULT_COST)
+
+
+class CriteriaStats(object):
+    """Number of evaluations and rejections of each criteria from a set of
+    criteria, with the order in which they are evaluated. Counters are not
+    guarded by locks, so they might be slightly off when updated by several
+    threads at once, but these are only used for the ordering
+    """
+
+    def __init__(self, keys, costs=None, name=None):
+        self.name = name
+        self.keys = tuple(keys)
+        self.costs = costs or dict(map(lambda key: (key, get_cost(key)),
+                                       self.keys))
+        self.evaluations = dict.fromkeys(self.keys, 0)
+        self.rejections = dict.fromkeys(self.keys, 0)
+        self.count = 0
+        self.order = self.get_order()
+
+    def __repr__(self):
+        return "<CriteriaStats count={} order={}>".format(
+            self.count, ", ".join(self.order))
+
+    def get_rejection_rate(self, key):
+        """Returns the rate of evaluations of the criteria that were rejected,
+        with a prior of 0.5 for the criteria without evaluations
+        """
+        return (self.rejections[key] + 1.0) / (self.evaluations[key] + 2.0)
+
+    def get_order(self):
+        """Returns the keys sorted by their cost divided by their rejection
+        rate. Keys with same score keep their original order
+        """
+        def score(key):
+            return self.costs[key] / self.get_rejection_rate(key)
+        return tuple(sorted(self.keys, key=score))
+
+    def add(self, key, rejected):
+        """Records the evaluation of the criteria for the key passed-in
+        """
+        self.evaluations[key] += 1
+        if rejected:
+            self.rejections[key] += 1
+
+    def done(self):
+        """Records the end of the evaluation of the criteria. The order is
+        computed again every REORDER_INTERVAL evaluations
+        """
+        self.count += 1
+        if self.count % REORDER_INTERVAL == 0:
+            self.order = self.get_order()
+
+    def to_dict(self):
+        """Returns a dict representation of the stats
+        """
+        return {
+            "name": self.name,
+            "count": self.count,
+            "order": list(self.order),
+            "criteria": dict(map(lambda key: (key, {
+                "cost": self.costs[key],
+                "evaluations": self.evaluations[key],
+                "rejections": self.rejections[key],
+            }), self.keys)),
+        }
+
+
+def get_stats(key, keys, costs=None, name=None):
+    """Returns the CriteriaStats for the criteria with the key passed-in, for
+    the keys of the criteria. The stats are created if do not exist yet
+    :param key: unique key of the criteria, as the selection_key of the
+        interpreter
+    :param name: name of the stats, for display
+    """
+    stats = _stats.get(key)
+    if stats is None:
+        with _stats_lock:
+            stats = _stats.get(key)
+            if stats is None:
+                stats = CriteriaStats(keys, costs=costs, name=name)
+                _stats[key] = stats
+    return stats
+
+
+def get_all_stats():
+    """Returns a list with the representation of all stats, sorted by name
+    """
+    stats = map(lambda item: item.to_dict(), _stats.values())
+    return sorted(stats, key=lambda item: item["name"])
+
+
+def reset_stats():
+    """Discards all stats. To be called whenever the interpreters available
+    change, so the stats of interpreters no longer available are not kept
+    """
+    with _stats_lock:
+        _stats.clear()
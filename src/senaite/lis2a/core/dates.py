@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.LIS2A.
+#
+# SENAITE.LIS2A is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+"""Parsing of dates and times in ANSI X3.30 (dates) and X3.43 (times) format,
+as used in LIS2-A2 messages: YYYYMMDD[HHMM[SS]], optionally followed by the
+offset from UTC (+HHMM or -HHMM)
+"""
+
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from datetime import timedelta
+from datetime import tzinfo
+
+# Number of recently parsed dates kept. In a batch, many results share the
+# same date and time
+DATES_CACHE_SIZE = 512
+
+# Lengths of the date and time part supported
+ANSI_LENGTHS = (8, 12, 14)
+
+# Length of the offset from UTC (+HHMM or -HHMM)
+OFFSET_LENGTH = 5
+
+_marker = object()
+
+# Recently parsed dates (string -> datetime), least recently used first
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+# Timezones by offset in minutes
+_timezones = {}
+
+
+class FixedOffset(tzinfo):
+    """Timezone with a fixed offset from UTC, in minutes
+    """
+
+    def __init__(self, minutes):
+        self.minutes = minutes
+        self.offset = timedelta(minutes=minutes)
+
+    def __repr__(self):
+        return "<FixedOffset {}>".format(self.tzname(None))
+
+    def utcoffset(self, dt):
+        return self.offset
+
+    def dst(self, dt):
+        return timedelta(0)
+
+    def tzname(self, dt):
+        sign = self.minutes < 0 and "-" or "+"
+        hours, minutes = divmod(abs(self.minutes), 60)
+        return "{}{:02d}{:02d}".format(sign, hours, minutes)
+
+
+def get_timezone(minutes):
+    """Returns the FixedOffset timezone for the offset in minutes passed-in
+    """
+    timezone = _timezones.get(minutes)
+    if timezone is None:
+        timezone = _timezones.setdefault(minutes, FixedOffset(minutes))
+    return timezone
+
+
+def parse_ansi_date(value):
+    """Returns the datetime for the ANSI date (and time) passed-in. Date and
+    time are sliced from the fixed positions, so this is way faster than
+    strptime. Returns a timezone-aware datetime if the value has an offset
+    from UTC. Raises a ValueError if the value is not in ANSI format
+    """
+    timezone = None
+    if len(value) - OFFSET_LENGTH in ANSI_LENGTHS \
+            and value[-OFFSET_LENGTH] in "+-":
+        offset = value[-OFFSET_LENGTH + 1:]
+        if not offset.isdigit():
+            raise ValueError("No ANSI format date: {}".format(value))
+        minutes = int(offset[:2]) * 60 + int(offset[2:])
+        if value[-OFFSET_LENGTH] == "-":
+            minutes = -minutes
+        timezone = get_timezone(minutes)
+        value = value[:-OFFSET_LENGTH]
+
+    length = len(value)
+    if length not in ANSI_LENGTHS or not value.isdigit():
+        raise ValueError("No ANSI format date: {}".format(value))
+
+    hour = minute = second = 0
+    if length > 8:
+        hour = int(value[8:10])
+        minute = int(value[10:12])
+        if length > 12:
+            second = int(value[12:14])
+
+    return datetime(int(value[:4]), int(value[4:6]), int(value[6:8]),
+                    hour, minute, second, tzinfo=timezone)
+
+
+def to_date(value, default=_marker):
+    """Returns the datetime for the ANSI date (and time) passed-in. Recently
+    parsed values are kept in a cache. Returns the default if the value is
+    not in ANSI format, if set. Raises a ValueError otherwise
+    """
+    if isinstance(value, datetime):
+        return value
+
+    with _cache_lock:
+        date = _cache.pop(value, None)
+        if date is not None:
+            # Move to the end, as the most recently used
+            _cache[value] = date
+            return date
+
+    try:
+        date = parse_ansi_date(value)
+    except (TypeError, ValueError):
+        if default is _marker:
+            raise ValueError("No ANSI format date: {}".format(repr(value)))
+        return default
+
+    with _cache_lock:
+        _cache[value] = date
+        if len(_cache) > DATES_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return date
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.LIS2A.
+#
+# SENAITE.LIS2A is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+"""Dead-letter store of the messages with results that could not be matched.
+Results for a sample that is not received yet find no container, so these
+messages are parked by specimen and retried later, with an exponential
+backoff, or as soon as the sample is received
+"""
+
+import time
+
+from senaite.lis2a.core import message as msgapi
+from senaite.lis2a.core.report import NO_CONTAINER
+
+# Statuses of results that might find a match if imported again later. Results
+# without analysis are not considered, cause these are usually for tests that
+# were not requested and would never find a match
+RETRY_STATUSES = (NO_CONTAINER, )
+
+# Seconds to wait before the first retry of a specimen. The delay doubles
+# on each retry that does not succeed
+DEADLETTER_RETRY_DELAY = 60
+
+# Max number of seconds to wait between retries
+DEADLETTER_MAX_DELAY = 6 * 60 * 60
+
+# Number of scheduled retries for a specimen. Messages are kept afterwards,
+# but only retried when the sample is received
+DEADLETTER_MAX_ATTEMPTS = 10
+
+# Seconds the messages are kept in the store at most
+DEADLETTER_MAX_AGE = 7 * 24 * 60 * 60
+
+
+def get_backoff(attempts, delay=DEADLETTER_RETRY_DELAY,
+                max_delay=DEADLETTER_MAX_DELAY):
+    """Returns the seconds to wait before the next retry, after the number of
+    attempts passed-in
+    """
+    return min(delay * 2 ** attempts, max_delay)
+
+
+def is_retryable(report):
+    """Returns whether the ImportReport passed-in has results that might find
+    a match if imported again later
+    """
+    counts = report.counts
+    return any(map(lambda status: counts[status], RETRY_STATUSES))
+
+
+class DeadLetter(object):
+    """Messages parked for a specimen, with the number of retries attempted
+    and the time of the next retry (None when no more retries are scheduled)
+    """
+
+    def __init__(self, messages, created, attempts=0, next_retry=None):
+        self.messages = tuple(messages)
+        self.created = created
+        self.attempts = attempts
+        self.next_retry = next_retry
+
+    def __repr__(self):
+        return "<DeadLetter messages={} attempts={}>".format(
+            len(self.messages), self.attempts)
+
+    def to_tuple(self):
+        """Returns the tuple representation of this dead letter, suitable for
+        persistent storages
+        """
+        return self.messages, self.created, self.attempts, self.next_retry
+
+    def to_dict(self):
+        """Returns a dict representation of this dead letter
+        """
+        return {
+            "messages": len(self.messages),
+            "created": self.created,
+            "attempts": self.attempts,
+            "next_retry": self.next_retry,
+        }
+
+
+class DeadLetterStore(object):
+    """Store of the messages parked by specimen. The dead letters are kept in
+    the storage passed-in, a mapping of Specimen ID -> tuple, so it can be
+    persistent (e.g. an OOBTree). Subclasses can keep the dead letters
+    otherwise by overriding the methods that read and write the storage (get,
+    items, add, append, reschedule, pop, get_due and get_expired)
+    :param delay: seconds to wait before the first retry
+    :param max_delay: max number of seconds to wait between retries
+    :param max_attempts: number of scheduled retries for a specimen
+    :param max_age: seconds the messages for a specimen are kept at most
+    """
+
+    def __init__(self, delay=DEADLETTER_RETRY_DELAY,
+                 max_delay=DEADLETTER_MAX_DELAY,
+                 max_attempts=DEADLETTER_MAX_ATTEMPTS,
+                 max_age=DEADLETTER_MAX_AGE, storage=None):
+        self.delay = delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.max_age = max_age
+        self.storage = {} if storage is None else storage
+
+    def __len__(self):
+        return len(self.storage)
+
+    def __contains__(self, specimen_id):
+        return specimen_id in self.storage
+
+    def get(self, specimen_id):
+        """Returns the DeadLetter for the specimen passed-in, if any
+        """
+        value = self.storage.get(specimen_id)
+        return value and DeadLetter(*value) or None
+
+    def items(self):
+        """Returns a list of tuples (Specimen ID, DeadLetter)
+        """
+        return map(lambda item: (item[0], DeadLetter(*item[1])),
+                   self.storage.items())
+
+    def add(self, specimen_id, letter):
+        """Stores the DeadLetter passed-in for the specimen
+        """
+        self.storage[specimen_id] = letter.to_tuple()
+
+    def append(self, specimen_id, messages):
+        """Adds the messages passed-in to the DeadLetter of the specimen
+        """
+        value = self.storage[specimen_id]
+        self.storage[specimen_id] = (value[0] + tuple(messages), ) + value[1:]
+
+    def reschedule(self, specimen_id, letter):
+        """Stores the attempts and the next retry of the DeadLetter passed-in
+        for the specimen
+        """
+        self.storage[specimen_id] = letter.to_tuple()
+
+    def park(self, specimen_id, messages, attempts=0, now=None, created=None):
+        """Parks the messages passed-in for the specimen and schedules the
+        next retry after the number of attempts passed-in. Messages are added
+        to those already parked for the specimen, if any, skipping duplicates.
+        Returns the DeadLetter
+        :param created: time the messages were parked first (e.g. for the
+            messages parked again after a retry), so these are not kept for
+            longer than max age. Current time if None
+        """
+        if now is None:
+            now = time.time()
+
+        letter = self.get(specimen_id)
+        if not letter:
+            next_retry = self.get_next_retry(attempts, now)
+            if created is None:
+                created = now
+            letter = DeadLetter(messages, created, attempts, next_retry)
+            self.add(specimen_id, letter)
+            return letter
+
+        # Keep the schedule of the messages parked before, unless these
+        # messages come from a retry with more attempts
+        fingerprints = map(msgapi.get_fingerprint, letter.messages)
+        added = []
+        for message in messages:
+            fingerprint = msgapi.get_fingerprint(message)
+            if fingerprint not in fingerprints:
+                added.append(message)
+                fingerprints.append(fingerprint)
+        if added:
+            letter.messages += tuple(added)
+            self.append(specimen_id, added)
+        if attempts > letter.attempts:
+            letter.attempts = attempts
+            letter.next_retry = self.get_next_retry(attempts, now)
+            self.reschedule(specimen_id, letter)
+        return letter
+
+    def make_due(self, specimen_id, now=None):
+        """Schedules the retry of the messages parked for the specimen passed-in
+        for now, regardless of their schedule and attempts. Returns the
+        DeadLetter, or None if no messages are parked for the specimen
+        """
+        if now is None:
+            now = time.time()
+
+        letter = self.get(specimen_id)
+        if letter:
+            letter.next_retry = now
+            self.reschedule(specimen_id, letter)
+        return letter
+
+    def get_next_retry(self, attempts, now):
+        """Returns the time of the next retry after the number of attempts
+        passed-in, or None if no more retries are scheduled
+        """
+        if attempts >= self.max_attempts:
+            return None
+        return now + get_backoff(attempts, self.delay, self.max_delay)
+
+    def pop(self, specimen_id):
+        """Returns the DeadLetter for the specimen passed-in and removes it
+        from the store. Returns None if no messages are parked for the
+        specimen
+        """
+        value = self.storage.pop(specimen_id, None)
+        return value and DeadLetter(*value) or None
+
+    def get_due(self, now):
+        """Returns the list of Specimen IDs whose retry is due
+        """
+        return map(lambda item: item[0], filter(
+            lambda item: item[1].next_retry is not None and
+            item[1].next_retry <= now, self.items()))
+
+    def get_expired(self, now):
+        """Returns the list of Specimen IDs parked for longer than max age
+        """
+        return map(lambda item: item[0], filter(
+            lambda item: now - item[1].created >= self.max_age,
+            self.items()))
+
+    def pop_due(self, now=None):
+        """Returns the list of tuples (Specimen ID, DeadLetter) whose retry is
+        due and removes them from the store
+        """
+        if now is None:
+            now = time.time()
+        return self.pop_all(self.get_due(now))
+
+    def pop_expired(self, now=None):
+        """Returns the list of tuples (Specimen ID, DeadLetter) parked for
+        longer than max age and removes them from the store
+        """
+        if now is None:
+            now = time.time()
+        return self.pop_all(self.get_expired(now))
+
+    def pop_all(self, specimen_ids):
+        """Returns the list of tuples (Specimen ID, DeadLetter) for the
+        specimens passed-in and removes them from the store
+        """
+        letters = map(lambda spec_id: (spec_id, self.pop(spec_id)),
+                      specimen_ids)
+        return filter(lambda item: item[1], letters)
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.LIS2A.
+#
+# SENAITE.LIS2A is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+"""Low-level decoder of ASTM E1381 (CLSI LIS1-A) byte streams. Frames are
+verified and reassembled into the records of LIS2-A (E1394) messages:
+
+    [ENQ] [STX FN text ETB|ETX C1 C2 CR LF]... [EOT]
+"""
+
+from senaite.lis2a.core import message as msgapi
+from senaite.lis2a.core.compat import PY2
+
+# Control characters
+ENQ = 0x05
+ACK = 0x06
+NAK = 0x15
+EOT = 0x04
+STX = 0x02
+ETX = 0x03
+ETB = 0x17
+CR = 0x0D
+LF = 0x0A
+
+CRLF = b"\r\n"
+
+# Frame numbers go from 0 to 7, starting at 1 on each transmission
+FRAME_NUMBERS = 8
+
+# Maximum number of chars of the text of a frame
+FRAME_SIZE = 240
+
+# Events generated by the decoder
+ESTABLISHED = "established"
+ACCEPTED = "accepted"
+DUPLICATED = "duplicated"
+REJECTED = "rejected"
+MESSAGE = "message"
+TERMINATED = "terminated"
+
+
+class FrameError(ValueError):
+    """Error raised when a frame is not compliant with E1381
+    """
+
+
+def checksum(data):
+    """Returns the checksum of the frame data passed-in (from the frame number
+    to the ETB/ETX, both inclusive) as two uppercase hexadecimal chars. The
+    data is usually a memoryview of the frame within the receive buffer
+    """
+    if PY2:
+        # Items of memoryviews are not integers in Python 2
+        data = bytearray(data)
+    return b"%02X" % (sum(data) & 0xFF)
+
+
+def encode_frame(frame_number, text, last=True):
+    """Returns the bytes of a frame with the text passed-in
+    """
+    data = bytearray(b"%d" % (frame_number % FRAME_NUMBERS))
+    data += text
+    data.append(last and ETX or ETB)
+    return bytes(bytearray([STX]) + data + checksum(data) + CRLF)
+
+
+def encode_message(message, frame_size=FRAME_SIZE, frame_number=1):
+    """Returns the list of frames for the LIS2-A message passed-in. Each record
+    is sent in a frame of its own, split in intermediate frames if longer than
+    the frame size
+    """
+    frames = []
+    for record in msgapi.get_raw_records(message):
+        text = record + "\r"
+        chunks = range(0, len(text), frame_size)
+        for start in chunks:
+            last = start == chunks[-1]
+            chunk = text[start:start + frame_size]
+            frames.append(encode_frame(frame_number, chunk, last=last))
+            frame_number += 1
+    return frames
+
+
+class Decoder(object):
+    """Incremental decoder of E1381 byte streams. Bytes are fed as they are
+    received, and the decoder generates the events of the transmission, so
+    the receiver can reply with ACK or NAK to the sender:
+
+        (ESTABLISHED, None): ENQ received, a new transmission starts
+        (ACCEPTED, frame number): valid frame
+        (DUPLICATED, frame number): retransmission of the last frame
+        (REJECTED, reason): frame with wrong checksum or number
+        (MESSAGE, message): LIS2-A message reassembled
+        (TERMINATED, None): EOT received, end of the transmission
+
+    Intermediate frames (ETB) are added to a single bytearray until the last
+    frame of the record (ETX), so records are reassembled without repeated
+    concatenation of strings
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.record = bytearray()
+        self.records = []
+        self.frame_number = 1
+        self.last_accepted = None
+
+    def reset(self):
+        """Discards the records and frames of current transmission
+        """
+        self.record = bytearray()
+        self.records = []
+        self.frame_number = 1
+        self.last_accepted = None
+
+    def feed(self, data):
+        """Adds the bytes passed-in to the decoder and returns the list of
+        (event, value) tuples generated
+        """
+        self.buffer += data
+        events = []
+        view = memoryview(self.buffer)
+        position = 0
+        size = len(self.buffer)
+        while position < size:
+            char = self.buffer[position]
+            if char == STX:
+                end = self.find_frame_end(position)
+                if end < 0 or size < end + 5:
+                    # Incomplete frame, wait for more bytes
+                    break
+                events.append(self.read_frame(view, position, end))
+                position = end + 5
+
+            elif char == ENQ:
+                self.reset()
+                events.append((ESTABLISHED, None))
+                position += 1
+
+            elif char == EOT:
+                events.extend(self.flush())
+                events.append((TERMINATED, None))
+                position += 1
+
+            else:
+                # Noise between frames
+                position += 1
+
+        # The view has to be released before the buffer is resized
+        del view
+        del self.buffer[:position]
+        return events
+
+    def find_frame_end(self, start):
+        """Returns the position of the ETX or ETB of the frame that starts at
+        the position passed-in, or -1 if not received yet
+        """
+        ends = filter(lambda pos: pos >= 0, [
+            self.buffer.find(b"\x03", start),
+            self.buffer.find(b"\x17", start),
+        ])
+        return ends and min(ends) or -1
+
+    def read_frame(self, view, start, end):
+        """Reads the frame between the positions passed-in and returns the
+        event for the frame
+        """
+        expected = checksum(view[start + 1:end + 1])
+        received = view[end + 1:end + 3].tobytes().upper()
+        if received != expected:
+            return REJECTED, "Checksum {} != {}".format(received, expected)
+        if view[end + 3:end + 5].tobytes() != CRLF:
+            return REJECTED, "No CR LF at the end of frame"
+
+        try:
+            frame_number = int(view[start + 1:start + 2].tobytes())
+        except ValueError:
+            return REJECTED, "No valid frame number"
+
+        if frame_number == self.last_accepted:
+            # The sender did not get our ACK and sent the frame again
+            return DUPLICATED, frame_number
+        if frame_number != self.frame_number:
+            return REJECTED, "Frame number {} != {}".format(
+                frame_number, self.frame_number)
+
+        self.frame_number = (frame_number + 1) % FRAME_NUMBERS
+        self.last_accepted = frame_number
+        self.record += view[start + 2:end]
+        if self.buffer[end] == ETX:
+            # Last frame of the record(s)
+            records = self.record.split(b"\r")
+            self.records.extend(map(bytes, filter(None, records)))
+            self.record = bytearray()
+        return ACCEPTED, frame_number
+
+    def flush(self):
+        """Returns the message events for the records received in current
+        transmission and resets the decoder
+        """
+        records = self.records
+        self.reset()
+        return map(lambda message: (MESSAGE, message),
+                   msgapi.iter_messages(records))
+
+
+def iter_events(chunks):
+    """Generates the (event, value) tuples from the chunks of E1381 bytes
+    passed-in, including the messages received before the end of the data
+    """
+    decoder = Decoder()
+    for chunk in chunks:
+        for event in decoder.feed(chunk):
+            yield event
+    for event in decoder.flush():
+        yield event
+
+
+def iter_messages(chunks):
+    """Generates the LIS2-A messages from the chunks of E1381 bytes passed-in,
+    as captured from the communication with the instrument. Rejected frames
+    (e.g. with a wrong checksum) are skipped, cause the sender transmits the
+    frame again after the NAK of the receiver. Raises a FrameError if a
+    rejected frame is not followed by its retransmission, so the message
+    would be incomplete
+    """
+    rejected = None
+    for event, value in iter_events(chunks):
+        if event == REJECTED:
+            # Keep the reason of the first frame rejected
+            rejected = rejected or value
+        elif event == ACCEPTED:
+            # Retransmission of the rejected frame
+            rejected = None
+        elif event in (ESTABLISHED, MESSAGE, TERMINATED) and rejected:
+            raise FrameError("Frame rejected and not sent again: {}".format(
+                rejected))
+        if event == MESSAGE:
+            yield value
+
+
+def decode(data):
+    """Returns the list of LIS2-A messages from the E1381 bytes passed-in, as
+    captured from the communication with the instrument. Rejected frames that
+    were sent again are skipped. Raises a FrameError if a message is left
+    incomplete
+    """
+    return list(iter_messages([data]))
@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.LIS2A.
+#
+# SENAITE.LIS2A is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+"""Hot folder (drop folder) where instruments export files with LIS2-A
+messages. Files are only taken once stable, claimed atomically so several
+processes can poll the same folder, and moved to the done or failed
+sub-folders after their import. The number of messages of a file already
+imported (offset) is kept next to the file, so the import of a file that is
+recovered or retried resumes after the messages imported
+"""
+
+import os
+import time
+
+from senaite.lis2a.core import message as msgapi
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        # Backport of os.scandir for Python 2
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+# Sub-folders for the files in process, imported and failed
+PROCESSING = "processing"
+DONE = "done"
+FAILED = "failed"
+
+# Seconds a file has to remain unmodified to be considered complete
+STABLE_SECONDS = 5
+
+# Seconds without progress after which a claimed file is considered stale
+# (e.g. the process that claimed it crashed) and is recovered
+CLAIM_TIMEOUT = 60 * 60
+
+# Extension of the files that keep the offset of the files being imported
+OFFSET_EXTENSION = ".offset"
+
+# Extension of the files with the details of a failed import
+ERROR_EXTENSION = ".error"
+
+
+class HotFolder(object):
+    """Folder polled for new files with LIS2-A messages. A file is ready for
+    import when neither its size nor its modification time changed since the
+    previous poll and it was not modified during the last stable_seconds
+    :param extensions: extensions of the files to consider. All if None
+    """
+
+    def __init__(self, directory, stable_seconds=STABLE_SECONDS,
+                 extensions=None):
+        self.directory = directory
+        self.stable_seconds = stable_seconds
+        self.extensions = extensions and tuple(extensions) or None
+        self.snapshots = {}
+        for name in (PROCESSING, DONE, FAILED):
+            path = os.path.join(directory, name)
+            if not os.path.isdir(path):
+                os.makedirs(path)
+
+    def is_candidate(self, name):
+        """Returns whether the file name passed-in is a candidate for import.
+        Hidden and temporary files are skipped
+        """
+        if name.startswith(".") or name.endswith((".tmp", ".part")):
+            return False
+        if self.extensions and not name.endswith(self.extensions):
+            return False
+        return True
+
+    def stat_files(self):
+        """Returns a dict of file name -> (size, mtime) with the candidate
+        files of the folder
+        """
+        stats = {}
+        if scandir:
+            for entry in scandir(self.directory):
+                if not self.is_candidate(entry.name):
+                    continue
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+                stats[entry.name] = (stat.st_size, stat.st_mtime)
+            return stats
+
+        for name in os.listdir(self.directory):
+            if not self.is_candidate(name):
+                continue
+            path = os.path.join(self.directory, name)
+            if not os.path.isfile(path):
+                continue
+            stat = os.stat(path)
+            stats[name] = (stat.st_size, stat.st_mtime)
+        return stats
+
+    def get_ready_files(self):
+        """Returns the paths of the files that are ready for import, sorted by
+        modification time
+        """
+        stats = self.stat_files()
+        limit = time.time() - self.stable_seconds
+        ready = []
+        for name, snapshot in stats.items():
+            if snapshot != self.snapshots.get(name):
+                # New or still being written
+                continue
+            if snapshot[1] > limit:
+                continue
+            ready.append((snapshot[1], name))
+
+        self.snapshots = stats
+        return map(lambda item: os.path.join(self.directory, item[1]),
+                   sorted(ready))
+
+    def claim(self, path):
+        """Moves the file to the processing sub-folder and returns its new
+        path. Returns None if the file was claimed by another process already
+        """
+        name = os.path.basename(path)
+        target = os.path.join(self.directory, PROCESSING, name)
+        try:
+            os.rename(path, target)
+        except OSError:
+            return None
+        self.snapshots.pop(name, None)
+
+        # The offset, if any, goes along with the file
+        self.move_offset(path, target)
+
+        # The modification time tells when the file was claimed, or when the
+        # last batch of messages from the file was imported
+        os.utime(target, None)
+        return target
+
+    def recover(self, timeout=CLAIM_TIMEOUT):
+        """Moves the files claimed more than the timeout seconds ago without
+        progress back to the folder, so they are imported again, after the
+        messages imported already. Returns the list of recovered paths
+        """
+        limit = time.time() - timeout
+        folder = os.path.join(self.directory, PROCESSING)
+        recovered = []
+        for name in os.listdir(folder):
+            if name.startswith("."):
+                continue
+            path = os.path.join(folder, name)
+            try:
+                if os.path.getmtime(path) > limit:
+                    continue
+            except OSError:
+                # Done by another process meanwhile
+                continue
+            target = os.path.join(self.directory, name)
+            if os.path.exists(target):
+                continue
+            try:
+                os.rename(path, target)
+            except OSError:
+                continue
+            self.move_offset(path, target)
+            recovered.append(target)
+        return recovered
+
+    def release(self, path):
+        """Moves the claimed file passed-in back to the folder, along with its
+        offset, so it is imported again with the next poll, after the messages
+        imported already. Returns the new path, or None if the file cannot be
+        released, and is recovered once the claim timeout is reached
+        """
+        target = os.path.join(self.directory, os.path.basename(path))
+        if os.path.exists(target):
+            return None
+        try:
+            os.rename(path, target)
+        except OSError:
+            return None
+        self.move_offset(path, target)
+        return target
+
+    def retry(self, name):
+        """Moves the failed file with the name passed-in back to the folder,
+        so it is imported again, after the messages imported already. Returns
+        the new path, or None if there is no failed file with that name
+        """
+        name = os.path.basename(name)
+        path = os.path.join(self.directory, FAILED, name)
+        target = os.path.join(self.directory, name)
+        if not os.path.isfile(path) or os.path.exists(target):
+            return None
+        os.rename(path, target)
+        self.move_offset(path, target)
+        error_path = "{}{}".format(path, ERROR_EXTENSION)
+        if os.path.exists(error_path):
+            os.remove(error_path)
+        return target
+
+    def get_offset_path(self, path):
+        """Returns the path of the file that keeps the offset of the file
+        passed-in. It is a hidden file, so it is not taken for import
+        """
+        directory, name = os.path.split(path)
+        return os.path.join(directory, ".{}{}".format(name, OFFSET_EXTENSION))
+
+    def get_offset(self, path):
+        """Returns the number of messages of the file passed-in that were
+        imported already
+        """
+        try:
+            with open(self.get_offset_path(path), "r") as f:
+                return int(f.read().strip() or 0)
+        except (IOError, ValueError):
+            return 0
+
+    def set_offset(self, path, offset):
+        """Sets the number of messages of the file passed-in that were
+        imported. The file is touched too, so it is not taken as stale
+        """
+        offset_path = self.get_offset_path(path)
+        temp_path = "{}.tmp".format(offset_path)
+        with open(temp_path, "w") as f:
+            f.write(str(offset))
+        os.rename(temp_path, offset_path)
+        os.utime(path, None)
+
+    def move_offset(self, path, target):
+        """Moves the offset of the file passed-in, if any, along with the file
+        """
+        offset_path = self.get_offset_path(path)
+        if os.path.exists(offset_path):
+            os.rename(offset_path, self.get_offset_path(target))
+
+    def iter_messages(self, path, offset=0):
+        """Generates the messages from the file, reading it line by line. The
+        number of messages passed-in as offset are skipped
+        """
+        with open(path, "rU") as f:
+            for index, message in enumerate(msgapi.iter_messages(f)):
+                if index >= offset:
+                    yield message
+
+    def done(self, path):
+        """Moves the file to the done sub-folder and returns the new path
+        """
+        offset_path = self.get_offset_path(path)
+        if os.path.exists(offset_path):
+            os.remove(offset_path)
+        return self.move(path, DONE)
+
+    def failed(self, path, details=None):
+        """Moves the file to the failed sub-folder and returns the new path.
+        The details of the failure (e.g. a traceback), if any, are stored next
+        to the file. The offset is kept, so the messages imported already are
+        skipped if the import of the file is retried
+        """
+        target = self.move(path, FAILED)
+        if details:
+            with open("{}{}".format(target, ERROR_EXTENSION), "w") as f:
+                f.write(details)
+        return target
+
+    def move(self, path, folder):
+        """Moves the file to the sub-folder passed-in, with a unique name
+        """
+        name = os.path.basename(path)
+        target = os.path.join(self.directory, folder, name)
+        if os.path.exists(target):
+            base, ext = os.path.splitext(name)
+            name = "{}-{}{}".format(base, time.strftime("%Y%m%d%H%M%S"), ext)
+            target = os.path.join(self.directory, folder, name)
+        os.rename(path, target)
+        self.move_offset(path, target)
+        return target
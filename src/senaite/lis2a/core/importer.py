@@ -0,0 +1,771 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.LIS2A.
+#
+# SENAITE.LIS2A is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+import itertools
+import multiprocessing
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from timeit import default_timer
+
+from senaite.lis2a import logger
+from senaite.lis2a.core import message as msgapi
+from senaite.lis2a.core import metrics
+from senaite.lis2a.core.compat import string_types
+from senaite.lis2a.core.interpreter import Interpreter
+from senaite.lis2a.core.report import ImportReport
+from senaite.lis2a.core.report import IMPORTED
+from senaite.lis2a.core.report import INVALID
+from senaite.lis2a.core.report import NO_ANALYSIS
+from senaite.lis2a.core.report import NO_CONTAINER
+from senaite.lis2a.core.report import QueryStats
+from senaite.lis2a.core.report import UNCHANGED
+
+# Lower and Upper Detection Limit operands
+LDL = "<"
+UDL = ">"
+
+_marker = object()
+
+# Stack of the QueryStats collecting the catalog queries of current thread
+_accounting = threading.local()
+
+# Containers found by current thread within a cache_containers block
+_containers = threading.local()
+
+# The backend currently in use
+_backend = {"current": None}
+
+# Number of messages sent at once to each worker process on archive imports
+ARCHIVE_CHUNKSIZE = 20
+
+# Interpreters of current worker process on archive imports
+_worker = {}
+
+# Number of header signatures for which the selection of interpreters is kept
+SELECTION_CACHE_SIZE = 256
+
+
+class SelectionCache(object):
+    """Keeps whether interpreters support the messages with a given header
+    signature, for the most recently seen signatures. Only decisions from
+    interpreters whose selection criteria reference header fields only are
+    kept, cause these are the same for all messages with the same signature
+    """
+
+    def __init__(self, size=SELECTION_CACHE_SIZE):
+        self.size = size
+        self.lock = threading.Lock()
+        self.decisions = OrderedDict()
+
+    def __len__(self):
+        return len(self.decisions)
+
+    def get(self, signature, key):
+        """Returns whether the interpreter with the selection key passed-in
+        supports the messages with the signature, or None if unknown
+        """
+        with self.lock:
+            decisions = self.decisions.pop(signature, None)
+            if decisions is None:
+                return None
+            # Move to the end, as the most recently used
+            self.decisions[signature] = decisions
+            return decisions.get(key)
+
+    def set(self, signature, key, supported):
+        """Keeps whether the interpreter with the selection key passed-in
+        supports the messages with the signature
+        """
+        with self.lock:
+            decisions = self.decisions.pop(signature, None) or {}
+            decisions[key] = supported
+            self.decisions[signature] = decisions
+            if len(self.decisions) > self.size:
+                self.decisions.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.decisions.clear()
+
+
+# Selection of interpreters by header signature
+_selection_cache = SelectionCache()
+
+
+def import_message(message, interpreters, report=None):
+    """Imports the data from the LIS2-A compliant message passed-in
+    :param message: str representing a full LIS2-A compliant message
+    :param interpreters: interpreters to choose from for the message
+    :param report: ImportReport to update with the results of the import
+    :returns: the ImportReport with the status of the results and timings
+    """
+    if report is None:
+        report = ImportReport()
+
+    # The message might be composite. This is, a single message can contain
+    # results for more than one sample
+    with report.timer("split"):
+        messages = msgapi.split_message(message)
+
+    if len(messages) > 1:
+        for msg in messages:
+            import_single_message(msg, interpreters, report)
+    else:
+        import_single_message(message, interpreters, report)
+    return report
+
+
+def import_single_message(message, interpreters, report):
+    """Imports the data from a non-composite LIS2-A compliant message and
+    returns the interpreter used
+    """
+    with metrics.IMPORT_SECONDS.time():
+
+        # Look for a suitable interpreter
+        with report.timer("selection"):
+            interpreter = select_interpreter(message, interpreters)
+        if not interpreter:
+            raise ValueError("No interpreter found for {}".format(message))
+
+        # Extract and import (R)esults
+        with report.timer("extraction"):
+            results = extract_results(message, interpreter)
+        fingerprint = msgapi.get_fingerprint(message)
+        import_results(results, interpreter, report, fingerprint)
+
+    # Extract and import other data
+    return interpreter
+
+
+def import_results(results, interpreter, report, fingerprint=""):
+    """Imports the result data dicts extracted with the interpreter passed-in
+    from a single message, identified by its fingerprint
+    """
+    report.add_message(interpreter)
+    metrics.MESSAGES.inc(interpreter=interpreter.id)
+
+    with account_queries() as queries:
+        for result in results:
+            import_result(result, report=report)
+
+    report.add_queries(queries, interpreter)
+    metrics.MESSAGE_QUERIES.observe(queries.count, interpreter=interpreter.id)
+    logger.debug("Message {} ({}): {}".format(
+        fingerprint[:12], interpreter.id, queries.summary()))
+
+
+def import_group(messages, interpreters, report=None):
+    """Imports the data from the LIS2-A compliant messages passed-in at once,
+    usually the messages coalesced for a single specimen. The results from
+    all messages are merged first, keeping the latest result (from the last
+    message) for each analysis, so each analysis is set and submitted once,
+    no matter the number of messages with results for it
+    :param messages: list of LIS2-A compliant messages
+    :param interpreters: interpreters to choose from for the messages
+    :param report: ImportReport to update with the results of the import
+    :returns: the ImportReport with the status of the merged results
+    """
+    if report is None:
+        report = ImportReport()
+
+    merged = OrderedDict()
+    for message in messages:
+        with report.timer("split"):
+            msgs = msgapi.split_message(message) or [message]
+        for msg in msgs:
+            with report.timer("selection"):
+                interpreter = select_interpreter(msg, interpreters)
+            if not interpreter:
+                raise ValueError("No interpreter found for {}".format(msg))
+            with report.timer("extraction"):
+                results = extract_results(msg, interpreter)
+            report.add_message(interpreter)
+            metrics.MESSAGES.inc(interpreter=interpreter.id)
+            for result in results:
+                # Keep the latest result for the analysis, in the order of
+                # the results of the last message
+                key = get_result_key(result)
+                merged.pop(key, None)
+                merged[key] = result
+
+    with metrics.IMPORT_SECONDS.time(), account_queries() as queries:
+        for result in merged.values():
+            import_result(result, report=report)
+
+    report.add_queries(queries)
+    logger.debug("Group of {} messages ({} results): {}".format(
+        len(messages), len(merged), queries.summary()))
+    return report
+
+
+def get_result_key(data):
+    """Returns a key that identifies the analysis the result data passed-in
+    is for, from its ids and keywords
+    """
+    key = []
+    for name in ("id", "keyword"):
+        value = data.get(name) or []
+        if isinstance(value, string_types):
+            value = [value]
+        key.append(tuple(sorted(set(value))))
+    return tuple(key)
+
+
+def import_archive(messages, interpreters, jobs=None, report=None,
+                   chunksize=ARCHIVE_CHUNKSIZE, pool=None):
+    """Imports the data from the LIS2-A compliant messages passed-in, with the
+    split of messages, the selection of interpreters and the extraction of
+    results done in parallel by a pool of processes. Only the result data
+    dicts are sent back, to be imported by current thread in the order of the
+    messages, so the backend is only used from a single writer.
+
+    Stage timings from the worker processes are added up, so they represent
+    the CPU time spent rather than the wall time of the import
+    :param messages: iterable of LIS2-A compliant messages
+    :param interpreters: interpreters to choose from for the messages
+    :param jobs: number of worker processes. Number of CPUs if None. Messages
+        are processed within current process if 1 or less
+    :param report: ImportReport to update with the results of the import
+    :param pool: ExtractionPool to use instead of a pool of its own, so the
+        pool is created once for the batches of a bulk import
+    :returns: the ImportReport aggregating the import of all messages
+    """
+    if report is None:
+        report = ImportReport()
+
+    extracted = extract_messages(messages, interpreters, jobs=jobs,
+                                 chunksize=chunksize, pool=pool)
+    for message_results, timings in extracted:
+        for stage, elapsed in timings.items():
+            report.add_time(stage, elapsed)
+        for interpreter, results, fingerprint in message_results:
+            if not interpreter:
+                raise ValueError("No interpreter found for message {}"
+                                 .format(fingerprint))
+            with metrics.IMPORT_SECONDS.time():
+                import_results(results, interpreter, report, fingerprint)
+    return report
+
+
+def extract_messages(messages, interpreters, jobs=None,
+                     chunksize=ARCHIVE_CHUNKSIZE, pool=None):
+    """Splits the messages passed-in and extracts the results of each
+    sub-message, in parallel by a pool of processes if jobs is above 1.
+    Generates, in the order of the messages, a tuple with the list of results
+    extracted from each message, as (interpreter, result data dicts,
+    fingerprint) tuples, and the stage timings. The interpreter is None for
+    the sub-messages that are not supported by any of the interpreters
+    :param messages: iterable of LIS2-A compliant messages
+    :param interpreters: interpreters to choose from for the messages
+    :param jobs: number of worker processes. Number of CPUs if None. Messages
+        are processed within current process if 1 or less
+    :param pool: ExtractionPool to use instead of a pool of its own. The
+        interpreters of the pool are used then
+    """
+    if pool is not None:
+        for extracted in pool.extract(messages):
+            yield extracted
+        return
+
+    if jobs is None:
+        jobs = multiprocessing.cpu_count()
+
+    if jobs <= 1:
+        for message in messages:
+            yield _extract_message(message, interpreters)
+        return
+
+    with ExtractionPool(interpreters, jobs, chunksize=chunksize) as pool:
+        for extracted in pool.extract(messages):
+            yield extracted
+
+
+class ExtractionPool(object):
+    """Pool of processes for the extraction of results, with the interpreters
+    passed-in in each worker process. Starting the processes is expensive, so
+    the pool is meant to be created once for all the batches of a bulk import
+    and closed when done, either explicitly or as a context manager
+    :param interpreters: interpreters to choose from for the messages
+    :param jobs: number of worker processes. Number of CPUs if None
+    :param chunksize: number of messages sent at once to each worker process
+    """
+
+    def __init__(self, interpreters, jobs=None, chunksize=ARCHIVE_CHUNKSIZE):
+        self.interpreters = interpreters
+        self.jobs = jobs or multiprocessing.cpu_count()
+        self.chunksize = chunksize
+        configurations = map(dict, interpreters)
+        self.pool = multiprocessing.Pool(self.jobs, initializer=_init_worker,
+                                         initargs=(configurations, ))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def extract(self, messages):
+        """Generates the results extracted from the messages passed-in, as
+        extract_messages does
+        """
+        # Send the messages to the pool in windows, so the pool does not
+        # consume the whole iterable at once and memory is bound for large
+        # archives
+        window = self.jobs * self.chunksize * 4
+        messages = iter(messages)
+        while True:
+            batch = list(itertools.islice(messages, window))
+            if not batch:
+                break
+            extracted = self.pool.imap(_extract_in_worker, batch,
+                                       self.chunksize)
+            for message_results, timings in extracted:
+                # Resolve the interpreters from their position
+                message_results = map(lambda item: (
+                    item[0] is not None and self.interpreters[item[0]] or None,
+                    item[1], item[2]), message_results)
+                yield message_results, timings
+
+    def close(self):
+        """Stops the worker processes
+        """
+        self.pool.terminate()
+        self.pool.join()
+
+
+def _init_worker(configurations):
+    """Initializes a worker process of the pool for the extraction of results
+    """
+    _worker["interpreters"] = map(Interpreter, configurations)
+
+
+def _extract_in_worker(message):
+    """Extracts the results of the message within a worker process, with the
+    position of the interpreters instead of the interpreters themselves, so
+    only the results have to be sent back
+    """
+    interpreters = _worker["interpreters"]
+    positions = map(id, interpreters)
+    message_results, timings = _extract_message(message, interpreters)
+    message_results = map(lambda item: (
+        item[0] and positions.index(id(item[0])), item[1], item[2]),
+        message_results)
+    return message_results, timings
+
+
+def _extract_message(message, interpreters):
+    """Splits the message and extracts the results of each sub-message.
+    Returns a tuple with the list of (interpreter, result data dicts,
+    fingerprint) tuples and the stage timings
+    """
+    report = ImportReport()
+    with report.timer("split"):
+        messages = msgapi.split_message(message)
+
+    message_results = []
+    for msg in messages:
+        with report.timer("selection"):
+            interpreter = select_interpreter(msg, interpreters)
+        results = []
+        if interpreter:
+            with report.timer("extraction"):
+                results = extract_results(msg, interpreter)
+        fingerprint = msgapi.get_fingerprint(msg)
+        message_results.append((interpreter, results, fingerprint))
+    return message_results, report.timings
+
+
+def select_interpreter(message, interpreters, default=None):
+    """Returns the interpreter from those passed-in that can be used for the
+    interpretation of the message, if any
+    """
+    # The message might be composite
+    if msgapi.is_composite(message):
+        messages = msgapi.split_message(message)
+        found = map(lambda msg: select_interpreter(msg, interpreters),
+                    messages)
+        ids = map(lambda i: i and i.id or None, found)
+        if len(list(set(ids))) == 1:
+            return found[0]
+        return default
+
+    with metrics.SELECTION_SECONDS.time():
+        # Non-compliant messages are not supported by any interpreter
+        if not msgapi.is_compliant(message):
+            return default
+
+        signature = msgapi.get_header_signature(message)
+        for interpreter in interpreters:
+            if is_supported(interpreter, message, signature):
+                return interpreter
+
+    return default
+
+
+def is_supported(interpreter, message, signature):
+    """Returns whether the interpreter supports the non-composite message
+    passed-in. The decision is kept for the messages with the same header
+    signature if the interpreter only has criteria for header fields
+    """
+    if not interpreter.header_only:
+        return interpreter.supports(message)
+
+    key = interpreter.selection_key
+    supported = _selection_cache.get(signature, key)
+    if supported is None:
+        supported = interpreter.supports(message)
+        _selection_cache.set(signature, key, supported)
+    return supported
+
+
+def invalidate_selection_cache():
+    """Discards the interpreters selected for the header signatures seen.
+    To be called whenever the interpreters available change
+    """
+    _selection_cache.clear()
+
+
+def extract_results(message, interpreter):
+    """Returns a list of result data dicts. A given message can contain multiple
+    records from (R)esult type, so it returns a list of dicts, and each dict
+    represents a potential results for a single test
+    """
+    interpreter.read(message)
+    results_data = interpreter.get_results_data()
+    interpreter.close()
+    return results_data
+
+
+def import_result(data, report=None):
+    """Tries to import the result data passed in
+    :param data: dict representation of a result, suitable for import
+    :param report: ImportReport to update with the status and timings
+    :returns: the status of the import of the result
+
+    data = {
+        "id": <str/list with the ID/s (SampleID, SampleClientID,Worksheet ID)>,
+        "keyword": <str/list with analysis keyword>,
+        "result": <analysis result>,
+        "capture_date": <DateTime when the result was captured>,
+        "interims": {
+            <interim_keyword>: <interim_result>,
+            ...
+        ],
+        ...
+    }
+
+    "id" and "keyword" are used to find analyses that match with any of the
+    ids passed-in, together with any of the keywords passed-in.
+    """
+    if report is None:
+        report = ImportReport()
+
+    status = _import_result(data, report)
+    report.add_result(data, status)
+    metrics.RESULTS.inc(status=status)
+    return status
+
+
+def _import_result(data, report):
+    """Imports the result data passed in and returns the status
+    """
+    ids = data.get("id")
+    ids = list(set(ids))
+    keywords = data.get("keyword")
+    if not all([ids, keywords]):
+        logger.error("id or keyword are missing or empty")
+        return INVALID
+
+    # Look for matches
+    backend = get_backend()
+    with report.timer("lookup"):
+        container = search_container(backend, ids)
+        analysis = container and backend.search_analysis(container, ids,
+                                                         keywords)
+
+    if not container:
+        logger.error("no container found for ids {}".format(repr(ids)))
+        return NO_CONTAINER
+
+    if not analysis:
+        logger.error("no match found for ids {} and keywords {}"
+                     .format(repr(ids), repr(keywords)))
+        return NO_ANALYSIS
+
+    with report.timer("set_result"):
+        changed = backend.set_result(analysis, data)
+
+    if not changed:
+        return UNCHANGED
+
+    # If the final result changed, then set the capture date that comes
+    # from the device and submit
+    with report.timer("submit"), metrics.SUBMIT_SECONDS.time():
+        capture_date = data.get("capture_date", datetime.now())
+        backend.submit(analysis, capture_date)
+
+    return IMPORTED
+
+
+def search_container(backend, container_ids):
+    """Searches the container for the ids passed-in with the backend. The
+    container is looked up in the cache of current thread first, if any
+    """
+    cache = getattr(_containers, "cache", None)
+    if cache is None:
+        return backend.search_container(container_ids)
+
+    key = tuple(sorted(container_ids))
+    if key not in cache:
+        cache[key] = backend.search_container(container_ids)
+    return cache[key]
+
+
+@contextmanager
+def cache_containers():
+    """Context manager that keeps the containers found by current thread
+    within the block, so results for the same container imported together
+    (e.g. from messages for the same specimen) do not search it again
+    """
+    if getattr(_containers, "cache", None) is not None:
+        # Nested, reuse the cache from the outer block
+        yield
+        return
+
+    _containers.cache = {}
+    try:
+        yield
+    finally:
+        _containers.cache = None
+
+
+def get_backend(default=_marker):
+    """Returns the backend used for the search of analyses and the storage of
+    results on import
+    """
+    backend = _backend["current"]
+    if backend is None:
+        if default is _marker:
+            raise RuntimeError("No backend set for the import of results")
+        return default
+    return backend
+
+
+def set_backend(backend):
+    """Sets the backend to use for the search of analyses and the storage of
+    results on import. Returns the backend previously set, if any
+    """
+    previous = _backend["current"]
+    _backend["current"] = backend
+    return previous
+
+
+def set_result(analysis, data):
+    """Sets the result, interims and ranges from the result data to the
+    analysis passed in. Returns whether the result of the analysis changed
+    """
+    # Get the original result for later comparison
+    original_result = analysis.getResult()
+
+    if data.get("remove_interims"):
+        # Purge interim fields
+        analysis.setInterimFields([])
+
+    else:
+        # Purge non-existent interim fields and fill others
+        interim_fields = get_interims_for(analysis, data)
+        if interim_fields:
+            analysis.setInterimFields(interim_fields)
+            analysis.calculateResult(override=True)
+
+    # store results ranges if necessary. Ranges might be parsed already
+    ranges = data.get("ranges", None)
+    if isinstance(ranges, dict):
+        ranges = dict(ranges)
+    else:
+        ranges = to_results_range(ranges, default=None)
+    if ranges:
+        ranges.update({
+            "uid": analysis.UID(),
+            "keyword": analysis.getKeyword(),
+        })
+        analysis.setResultsRange(ranges)
+
+    # If no result has been calculated, set the result directly
+    result = stringify(data["result"])
+    if result and analysis.getResult() == original_result:
+
+        # Maybe the result is a Detection Limit. The operand is set already
+        # if the result was normalized by the interpreter
+        operand = data.get("detection_limit")
+        if operand is None and is_detection_limit(result):
+            operand = result[0]
+            result = result[1:].strip()
+
+        if operand:
+            # We do want to store the detection limit, even if the manual
+            # detection limit for the analysis is set to False
+            analysis.setAllowManualDetectionLimit(True)
+            analysis.setDetectionLimitOperand(operand)
+
+        # Set the final result
+        analysis.setResult(result)
+
+    return analysis.getResult() != original_result
+
+
+def to_results_range(value, default=_marker):
+    """Converts the value to a valid results range dict
+    """
+    if not isinstance(value, string_types):
+        if default is _marker:
+            raise TypeError("Not supported type")
+        return default
+
+    # e.g. [.58 - 1.59]
+    values = [val.strip() for val in value.split("-")]
+    values = filter(None, values)
+    if len(values) != 2:
+        if default is _marker:
+            raise ValueError("Not a valid result range: {}".format(value))
+        return default
+
+    min_value = values[0][1:]
+    if not is_floatable(min_value):
+        if default is _marker:
+            raise ValueError("Not a valid result range: {}".format(value))
+        return default
+
+    max_value = values[1][:-1]
+    if not is_floatable(max_value):
+        if default is _marker:
+            raise ValueError("Not a valid result range: {}".format(value))
+        return default
+
+    min_operators = {"[": "geq", "(": "gt"}
+    min_operator = min_operators.get(values[0][:1])
+    if not min_operator:
+        if default is _marker:
+            raise ValueError("Not a valid result range: {}".format(value))
+        return default
+
+    max_operators = {"]": "leq", ")": "lt"}
+    max_operator = max_operators.get(values[1][-1:])
+    if not max_operator:
+        if default is _marker:
+            raise ValueError("Not a valid result range: {}".format(value))
+        return default
+
+    min_value = float(min_value)
+    max_value = float(max_value)
+    if min_value > max_value:
+        if default is _marker:
+            raise ValueError("Not a valid result range: {}".format(value))
+        return default
+
+    return {
+        "min": min_value,
+        "max": max_value,
+        "min_operator": min_operator,
+        "max_operator": max_operator,
+    }
+
+
+def is_detection_limit(result):
+    """Returns whether the result is actually a Detection Limit
+    """
+    if len(result) > 1:
+        return result[0] in [LDL, UDL]
+    return False
+
+
+def record_query(catalog, indexes, elapsed):
+    """Records the query made against the catalog with the indexes passed-in
+    in the QueryStats collecting the queries of current thread, if any
+    """
+    metrics.CATALOG_QUERIES.inc(catalog=catalog)
+    for stats in getattr(_accounting, "stack", []):
+        stats.add(catalog, indexes, elapsed)
+
+
+@contextmanager
+def account_queries():
+    """Context manager that yields a QueryStats with the catalog queries made
+    within the block by current thread
+    """
+    stats = QueryStats()
+    stack = getattr(_accounting, "stack", None)
+    if stack is None:
+        stack = _accounting.stack = []
+    stack.append(stats)
+    try:
+        yield stats
+    finally:
+        stack.remove(stats)
+
+
+def get_interims_for(analysis, result_data):
+    """Returns the interims to be applied to the analysis specified based
+    on the data item provided
+    """
+    data_interims = result_data.get("interims")
+    if not data_interims:
+        return False
+
+    interims = list(analysis.getInterimFields() or [])
+    if not interims:
+        return False
+
+    for index in range(len(interims)):
+        keyword = interims[index]["keyword"]
+        title = interims[index]["title"]
+
+        # Try to get the value for this interim field from data_item
+        value = stringify(data_interims.get(keyword, None))
+        if not value:
+            # Try with the title
+            value = stringify(data_interims.get(title, None))
+            if not value:
+                continue
+
+        # Set the interim field value
+        interims[index]["value"] = value
+
+    return interims
+
+
+def stringify(value):
+    """Return the value stringified, with None becoming empty string
+    """
+    if value is None:
+        return ""
+    return str(value).strip()
+
+
+def is_floatable(value):
+    """Returns whether the value passed-in can be converted to a float
+    """
+    try:
+        float(value)
+        return True
+    except (TypeError, ValueError):
+        return False
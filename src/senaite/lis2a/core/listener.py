@@ -0,0 +1,459 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.LIS2A.
+#
+# SENAITE.LIS2A is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+"""TCP listener for instruments that speak ASTM (E1381/E1394) over TCP/IP.
+A single process handles the connections of many instruments within one
+event loop. Messages received are handed in batches to a sink, that either
+stores them in a spool directory or pushes them to a SENAITE instance. Sinks
+hand the batches from a worker thread, so a slow spool or instance never
+delays the replies to the instruments:
+
+    senaite-lis2a-listener --port 4000 --spool /var/senaite/lis2a/spool
+    senaite-lis2a-listener --port 4000 --push http://senaite:8080/senaite \\
+        --user lis2a --password secret
+"""
+
+import argparse
+import asyncore
+import os
+import socket
+import threading
+import time
+import uuid
+
+from senaite.lis2a import logger
+from senaite.lis2a.core import e1381
+from senaite.lis2a.core.coalesce import COALESCE_MAX_MESSAGES
+from senaite.lis2a.core.coalesce import Coalescer
+
+# Seconds without data after which an unfinished transmission is discarded
+RECEIVE_TIMEOUT = 30
+
+# Maximum number of messages handed at once to the sink
+BATCH_SIZE = 100
+
+# Maximum seconds a message waits in the sink before being handed
+BATCH_INTERVAL = 5
+
+# Seconds to wait before trying again a push that failed
+PUSH_RETRY_AFTER = 30
+
+# Maximum number of messages waiting in the sink. New transmissions are
+# refused (NAK to ENQ) while reached, so instruments send them again later
+MAX_PENDING = 10000
+
+# Seconds the worker of the sink waits between checks for due batches
+WORKER_INTERVAL = 1
+
+# Name of the push consumer of senaite.lis2a
+PUSH_CONSUMER = "senaite.lis2a.import"
+
+
+class Sink(object):
+    """Collects the messages received and hands them in batches, either when
+    the batch is full or when the oldest message waited for too long. Once
+    started, batches are handed from a worker thread, so the event loop that
+    adds the messages is never blocked by the handing
+    """
+
+    def __init__(self, batch_size=BATCH_SIZE, batch_interval=BATCH_INTERVAL,
+                 coalescer=None, max_pending=MAX_PENDING):
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.coalescer = coalescer
+        self.max_pending = max_pending
+        self.messages = []
+        self.since = None
+        self.lock = threading.RLock()
+        self.wakeup = threading.Event()
+        self.worker = None
+        self.closing = False
+
+    def add(self, message):
+        """Adds a message to current batch. With a coalescer, the message is
+        buffered with those for the same specimen first
+        """
+        with self.lock:
+            if self.coalescer is None:
+                self.append([message])
+                return
+            for group in self.coalescer.add(message):
+                self.append(group)
+
+    def append(self, messages):
+        """Adds the messages passed-in to current batch
+        """
+        with self.lock:
+            if not self.messages:
+                self.since = time.time()
+            self.messages.extend(messages)
+            full = len(self.messages) >= self.batch_size
+        if not full:
+            return
+        if self.worker is None:
+            self.flush()
+        else:
+            self.wakeup.set()
+
+    def get_pending(self):
+        """Returns the number of messages waiting to be handed, including
+        those being coalesced
+        """
+        with self.lock:
+            pending = len(self.messages)
+            if self.coalescer is not None:
+                pending += len(self.coalescer)
+            return pending
+
+    def is_full(self):
+        """Returns whether the max number of messages waiting to be handed has
+        been reached
+        """
+        return self.get_pending() >= self.max_pending
+
+    def is_due(self):
+        """Returns whether current batch has to be handed
+        """
+        with self.lock:
+            if self.coalescer is not None:
+                for group in self.coalescer.pop_due():
+                    self.messages.extend(group)
+                    self.since = self.since or time.time()
+            if not self.messages:
+                return False
+            if len(self.messages) >= self.batch_size:
+                return True
+            return time.time() - self.since >= self.batch_interval
+
+    def start(self):
+        """Starts the worker thread that hands the batches when due
+        """
+        if self.worker is not None:
+            return
+        self.closing = False
+        self.worker = threading.Thread(target=self.run,
+                                       name="lis2a-sink-worker")
+        self.worker.daemon = True
+        self.worker.start()
+
+    def run(self):
+        """Loop of the worker thread
+        """
+        while not self.closing:
+            self.wakeup.wait(WORKER_INTERVAL)
+            self.wakeup.clear()
+            while not self.closing and self.is_due():
+                if not self.flush():
+                    break
+
+    def close(self):
+        """Stops the worker and hands all the messages, including those being
+        coalesced
+        """
+        if self.worker is not None:
+            self.closing = True
+            self.wakeup.set()
+            self.worker.join()
+            self.worker = None
+        with self.lock:
+            if self.coalescer is not None:
+                for group in self.coalescer.pop_due(force=True):
+                    self.messages.extend(group)
+        while self.messages:
+            if not self.flush():
+                logger.error("{} messages could not be handed".format(
+                    len(self.messages)))
+                break
+
+    def flush(self):
+        """Hands the messages of current batch. Messages are kept for the next
+        flush if the batch cannot be handed. Returns whether a batch was
+        handed
+        """
+        with self.lock:
+            batch = self.messages[:self.batch_size]
+        if not batch:
+            return False
+        if not self.handle(batch):
+            return False
+        with self.lock:
+            # Messages added while handing are at the end of the list
+            self.messages = self.messages[len(batch):]
+            self.since = self.messages and time.time() or None
+        return True
+
+    def handle(self, messages):
+        """Hands the messages passed-in. Returns whether they were handed
+        """
+        raise NotImplementedError("handle not implemented")
+
+
+class SpoolSink(Sink):
+    """Stores each batch of messages in a file of the spool directory. Files
+    are written with a temporary name and renamed, so readers of the
+    directory never see incomplete files
+    """
+
+    def __init__(self, directory, **kwargs):
+        super(SpoolSink, self).__init__(**kwargs)
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def handle(self, messages):
+        name = "{}-{}".format(time.strftime("%Y%m%d%H%M%S"), uuid.uuid4().hex)
+        path = os.path.join(self.directory, "{}.txt".format(name))
+        temp_path = os.path.join(self.directory, ".{}.tmp".format(name))
+        with open(temp_path, "wb") as f:
+            f.write("\n".join(messages))
+            f.write("\n")
+        os.rename(temp_path, path)
+        logger.info("Spooled {} messages to {}".format(len(messages), path))
+        return True
+
+
+class PushSink(Sink):
+    """Pushes each batch of messages to the push endpoint of senaite.jsonapi.
+    Batches rejected because the instance is busy are retried later, after
+    the seconds requested by the instance (Retry-After)
+    """
+
+    def __init__(self, url, username=None, password=None, timeout=60,
+                 **kwargs):
+        super(PushSink, self).__init__(**kwargs)
+        self.url = "{}/@@API/senaite/v1/push".format(url.rstrip("/"))
+        self.auth = username and (username, password) or None
+        self.timeout = timeout
+        self.retry_at = 0
+
+    def is_due(self):
+        if time.time() < self.retry_at:
+            return False
+        return super(PushSink, self).is_due()
+
+    def handle(self, messages):
+        import requests
+        if time.time() < self.retry_at:
+            return False
+
+        # Called from the worker thread of the sink, so a slow instance does
+        # not block the event loop that replies to the instruments
+        data = {"consumer": PUSH_CONSUMER, "messages": messages}
+        try:
+            response = requests.post(self.url, json=data, auth=self.auth,
+                                     timeout=self.timeout)
+        except requests.RequestException as e:
+            logger.error("Cannot push {} messages: {}".format(
+                len(messages), e))
+            self.retry_at = time.time() + PUSH_RETRY_AFTER
+            return False
+
+        if response.status_code == 200:
+            logger.info("Pushed {} messages".format(len(messages)))
+            return True
+
+        logger.error("Push of {} messages failed with status {}".format(
+            len(messages), response.status_code))
+        retry_after = response.headers.get("Retry-After")
+        retry_after = retry_after and retry_after.isdigit() and \
+            int(retry_after) or PUSH_RETRY_AFTER
+        self.retry_at = time.time() + retry_after
+        return False
+
+
+class ASTMHandler(asyncore.dispatcher_with_send):
+    """Handles the connection with an instrument. Replies to the sender with
+    ACK or NAK for each frame and hands the messages reassembled to the sink
+    """
+
+    def __init__(self, sock, address, server):
+        asyncore.dispatcher_with_send.__init__(self, sock, map=server.channels)
+        self.address = address
+        self.server = server
+        self.decoder = e1381.Decoder()
+        self.last_activity = time.time()
+        self.refused = False
+
+    def handle_read(self):
+        data = self.recv(4096)
+        if not data:
+            return
+        self.last_activity = time.time()
+        for event, value in self.decoder.feed(data):
+            if event == e1381.ESTABLISHED:
+                # Refuse the transmission while the sink is full, so the
+                # instrument sends it again later, as defined in E1381
+                self.refused = self.server.sink.is_full()
+                if self.refused:
+                    logger.warn("Transmission from {} refused, sink is "
+                                "full".format(self.address))
+                    self.send(chr(e1381.NAK))
+                else:
+                    self.send(chr(e1381.ACK))
+            elif self.refused:
+                # Frames sent although the establishment was refused
+                continue
+            elif event in (e1381.ACCEPTED, e1381.DUPLICATED):
+                self.send(chr(e1381.ACK))
+            elif event == e1381.REJECTED:
+                logger.warn("Frame from {} rejected: {}".format(
+                    self.address, value))
+                self.send(chr(e1381.NAK))
+            elif event == e1381.MESSAGE:
+                self.server.sink.add(value)
+        if self.refused:
+            self.decoder.reset()
+
+    def check_timeout(self, timeout):
+        """Discards the transmission in progress if no data was received for
+        the seconds passed-in
+        """
+        if time.time() - self.last_activity > timeout:
+            if self.decoder.records or self.decoder.record:
+                logger.warn("Transmission from {} timed out".format(
+                    self.address))
+            self.decoder.reset()
+            self.last_activity = time.time()
+
+    def handle_close(self):
+        # Hand the messages received before the connection was closed
+        if self.refused:
+            self.decoder.reset()
+        for event, value in self.decoder.flush():
+            self.server.sink.add(value)
+        self.close()
+
+
+class ASTMServer(asyncore.dispatcher):
+    """TCP server that accepts connections from instruments
+    """
+
+    def __init__(self, host, port, sink, timeout=RECEIVE_TIMEOUT):
+        self.channels = {}
+        asyncore.dispatcher.__init__(self, map=self.channels)
+        self.sink = sink
+        self.timeout = timeout
+        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.set_reuse_addr()
+        self.bind((host, port))
+        self.listen(64)
+
+    @property
+    def address(self):
+        return self.socket.getsockname()
+
+    def handle_accept(self):
+        pair = self.accept()
+        if pair is None:
+            return
+        sock, address = pair
+        logger.info("Connection from {}".format(address))
+        ASTMHandler(sock, address, self)
+
+    def get_handlers(self):
+        """Returns the handlers of the open connections
+        """
+        return filter(lambda channel: channel is not self,
+                      self.channels.values())
+
+    def poll(self, timeout=1.0):
+        """Processes the events of the connections for the seconds passed-in
+        at most, and hands the messages to the sink if due
+        """
+        asyncore.loop(timeout=timeout, map=self.channels, count=1)
+        for handler in self.get_handlers():
+            handler.check_timeout(self.timeout)
+        if self.sink.worker is None and self.sink.is_due():
+            # No worker thread, hand the batch from the event loop
+            self.sink.flush()
+
+    def serve_forever(self, timeout=1.0):
+        """Serves until interrupted. Batches are handed by the worker of the
+        sink. Messages waiting in the sink are handed before returning
+        """
+        logger.info("Listening on {}:{}".format(*self.address))
+        self.sink.start()
+        try:
+            while True:
+                self.poll(timeout=timeout)
+        finally:
+            self.sink.close()
+            asyncore.close_all(map=self.channels)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Receives LIS2-A messages from instruments that speak "
+                    "ASTM over TCP/IP")
+    parser.add_argument("--host", default="0.0.0.0",
+                        help="Address to listen on (default: 0.0.0.0)")
+    parser.add_argument("--port", type=int, required=True,
+                        help="Port to listen on")
+    sinks = parser.add_mutually_exclusive_group(required=True)
+    sinks.add_argument("--spool", default=None,
+                       help="Directory where messages are stored")
+    sinks.add_argument("--push", default=None,
+                       help="URL of the SENAITE site to push messages to")
+    parser.add_argument("--user", default=None, help="User for the push")
+    parser.add_argument("--password", default=None,
+                        help="Password for the push")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help="Messages per batch (default: {})"
+                        .format(BATCH_SIZE))
+    parser.add_argument("--batch-interval", type=float,
+                        default=BATCH_INTERVAL,
+                        help="Maximum seconds a message waits for its batch "
+                             "(default: {})".format(BATCH_INTERVAL))
+    parser.add_argument("--max-pending", type=int, default=MAX_PENDING,
+                        help="Messages waiting in the sink at most, before "
+                             "new transmissions are refused (default: {})"
+                        .format(MAX_PENDING))
+    parser.add_argument("--coalesce-window", type=float, default=0,
+                        help="Seconds messages are buffered by specimen, so "
+                             "results for same specimen are sent together "
+                             "(default: 0, disabled)")
+    parser.add_argument("--coalesce-max-messages", type=int,
+                        default=COALESCE_MAX_MESSAGES,
+                        help="Messages for a specimen sent without waiting "
+                             "(default: {})".format(COALESCE_MAX_MESSAGES))
+    args = parser.parse_args(argv)
+
+    coalescer = None
+    if args.coalesce_window > 0:
+        coalescer = Coalescer(window=args.coalesce_window,
+                              max_messages=args.coalesce_max_messages)
+    options = dict(batch_size=args.batch_size,
+                   batch_interval=args.batch_interval, coalescer=coalescer,
+                   max_pending=args.max_pending)
+    if args.spool:
+        sink = SpoolSink(args.spool, **options)
+    else:
+        sink = PushSink(args.push, username=args.user,
+                        password=args.password, **options)
+
+    server = ASTMServer(args.host, args.port, sink)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
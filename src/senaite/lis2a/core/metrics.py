@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.LIS2A.
+#
+# SENAITE.LIS2A is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+import threading
+from contextlib import contextmanager
+from functools import wraps
+from timeit import default_timer
+
+# Default buckets (in seconds) for histograms of latencies
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Buckets (in seconds) for histograms of queue lags
+LAG_BUCKETS = (1.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0,
+               3600.0, 7200.0)
+
+
+class Metric(object):
+    """Base class for metrics, with values per combination of labels
+    """
+    kind = None
+
+    def __init__(self, name, description, labels=None):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels or ())
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def get_key(self, labels):
+        """Returns the key for the values of the labels passed-in
+        """
+        if set(labels.keys()) != set(self.labels):
+            raise ValueError("Labels do not match: {}".format(repr(labels)))
+        return tuple(map(lambda label: labels[label], self.labels))
+
+    def format_labels(self, key, **extra):
+        """Returns the labels of the key in Prometheus text format
+        """
+        labels = zip(self.labels, key) + sorted(extra.items())
+        if not labels:
+            return ""
+        labels = map(lambda l: '{}="{}"'.format(l[0], escape(l[1])), labels)
+        return "{{{}}}".format(",".join(labels))
+
+    def reset(self):
+        with self.lock:
+            self.values = {}
+
+    def render(self):
+        """Returns the lines of this metric in Prometheus text format
+        """
+        lines = [
+            "# HELP {} {}".format(self.name, self.description),
+            "# TYPE {} {}".format(self.name, self.kind),
+        ]
+        with self.lock:
+            values = sorted(self.values.items())
+        for key, value in values:
+            lines.extend(self.render_value(key, value))
+        return lines
+
+    def render_value(self, key, value):
+        raise NotImplementedError("render_value not implemented")
+
+
+class Counter(Metric):
+    """A value that can only increase
+    """
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        """Increases the counter for the labels passed-in by the amount
+        """
+        key = self.get_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        """Returns the current value of the counter for the labels passed-in
+        """
+        return self.values.get(self.get_key(labels), 0)
+
+    def render_value(self, key, value):
+        return ["{}{} {}".format(self.name, self.format_labels(key),
+                                 to_str(value))]
+
+
+class Histogram(Metric):
+    """Distribution of observed values in fixed buckets
+    """
+    kind = "histogram"
+
+    def __init__(self, name, description, labels=None,
+                 buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, description, labels=labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        """Adds the value to the histogram for the labels passed-in
+        """
+        key = self.get_key(labels)
+        with self.lock:
+            counts, total = self.values.get(key, (None, 0.0))
+            if counts is None:
+                # one count for each bucket plus +Inf
+                counts = [0] * (len(self.buckets) + 1)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            else:
+                counts[-1] += 1
+            self.values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Context manager that observes the seconds spent within the block
+        """
+        start = default_timer()
+        try:
+            yield
+        finally:
+            self.observe(default_timer() - start, **labels)
+
+    def get_count(self, **labels):
+        """Returns the number of observations for the labels passed-in
+        """
+        counts, total = self.values.get(self.get_key(labels), ([], 0.0))
+        return sum(counts)
+
+    def render_value(self, key, value):
+        counts, total = value
+        lines = []
+        cumulative = 0
+        bounds = map(to_str, self.buckets) + ["+Inf"]
+        for bound, count in zip(bounds, counts):
+            cumulative += count
+            labels = self.format_labels(key, le=bound)
+            lines.append("{}_bucket{} {}".format(self.name, labels, cumulative))
+        labels = self.format_labels(key)
+        lines.append("{}_sum{} {}".format(self.name, labels, to_str(total)))
+        lines.append("{}_count{} {}".format(self.name, labels, cumulative))
+        return lines
+
+
+class Registry(object):
+    """In-process registry of metrics
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+
+    def register(self, metric):
+        """Registers the metric passed-in. Returns the metric already
+        registered with same name, if any
+        """
+        with self.lock:
+            return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, description, labels=None):
+        """Returns the counter registered with the name, creates a new one if
+        does not exist yet
+        """
+        return self.register(Counter(name, description, labels=labels))
+
+    def histogram(self, name, description, labels=None,
+                  buckets=DEFAULT_BUCKETS):
+        """Returns the histogram registered with the name, creates a new one if
+        does not exist yet
+        """
+        histogram = Histogram(name, description, labels=labels,
+                              buckets=buckets)
+        return self.register(histogram)
+
+    def get(self, name):
+        return self.metrics.get(name)
+
+    def reset(self):
+        """Resets the values of all metrics registered
+        """
+        for metric in self.metrics.values():
+            metric.reset()
+
+    def render(self):
+        """Returns the metrics in Prometheus text exposition format
+        """
+        lines = []
+        for name in sorted(self.metrics.keys()):
+            lines.extend(self.metrics[name].render())
+        return "\n".join(lines) + "\n"
+
+
+def timed(histogram, **labels):
+    """Decorator that observes the seconds spent on each call of the function
+    in the histogram passed-in
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with histogram.time(**labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def escape(value):
+    """Escapes the label value for Prometheus text format
+    """
+    value = u"{}".format(value)
+    value = value.replace("\\", r"\\").replace("\n", r"\n")
+    return value.replace('"', r'\"')
+
+
+def to_str(value):
+    """Returns the number passed-in as a string for Prometheus text format
+    """
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+# Buckets for histograms of number of catalog queries
+QUERIES_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+# The registry of metrics for this process
+REGISTRY = Registry()
+
+MESSAGES = REGISTRY.counter(
+    "lis2a_messages_total",
+    "Number of messages imported, by interpreter",
+    labels=["interpreter"])
+
+RESULTS = REGISTRY.counter(
+    "lis2a_results_total",
+    "Number of results processed, by status of the import",
+    labels=["status"])
+
+IMPORT_SECONDS = REGISTRY.histogram(
+    "lis2a_import_seconds",
+    "Seconds spent on the import of a single message")
+
+SELECTION_SECONDS = REGISTRY.histogram(
+    "lis2a_selection_seconds",
+    "Seconds spent on the selection of the interpreter for a message")
+
+CATALOG_QUERIES = REGISTRY.counter(
+    "lis2a_catalog_queries_total",
+    "Number of catalog queries, by catalog",
+    labels=["catalog"])
+
+MESSAGE_QUERIES = REGISTRY.histogram(
+    "lis2a_message_catalog_queries",
+    "Number of catalog queries made for the import of a message, by "
+    "interpreter",
+    labels=["interpreter"],
+    buckets=QUERIES_BUCKETS)
+
+LOOKUP_SECONDS = REGISTRY.histogram(
+    "lis2a_lookup_seconds",
+    "Seconds spent on searches of analyses and containers, by function",
+    labels=["function"])
+
+SUBMIT_SECONDS = REGISTRY.histogram(
+    "lis2a_submit_seconds",
+    "Seconds spent on the submission of a result")
+
+PUSHED_MESSAGES = REGISTRY.counter(
+    "lis2a_pushed_messages_total",
+    "Number of messages received, by outcome of the push",
+    labels=["outcome"])
+
+QUEUED_MESSAGES = REGISTRY.counter(
+    "lis2a_queued_messages_total",
+    "Number of messages processed from the queue")
+
+QUEUE_LAG_SECONDS = REGISTRY.histogram(
+    "lis2a_queue_lag_seconds",
+    "Seconds elapsed since a task was queued until it was processed",
+    buckets=LAG_BUCKETS)
+
+DEADLETTER_MESSAGES = REGISTRY.counter(
+    "lis2a_deadletter_messages_total",
+    "Number of messages from the dead-letter store, by outcome",
+    labels=["outcome"])
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.LIS2A.
+#
+# SENAITE.LIS2A is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+"""Normalization of the results extracted from a message. Each interpreter
+compiles the pipeline from its "normalization" setting once, and applies it
+to all the result data dicts extracted from a message at once:
+
+    "normalization": {
+        "decimal_separator": ",",
+        "value_map": {"POS": "1", "NEG": "0"},
+        "detection_limits": {"<": "<", "LOW": "<", ">": ">", "HIGH": ">"},
+        "units": {"mg/dL": {"unit": "mmol/L", "factor": 0.0555}},
+        "range_pattern": "^(?P<min>\\\\S+) to (?P<max>\\\\S+)$"
+    }
+"""
+
+import re
+
+from senaite.lis2a.core.compat import string_types
+
+# Operators of the Lower and Upper Detection Limits, as expected by SENAITE
+LDL = "<"
+UDL = ">"
+
+# Operators that denote a detection limit in results, by default
+DETECTION_LIMITS = {
+    LDL: LDL,
+    "<=": LDL,
+    UDL: UDL,
+    ">=": UDL,
+}
+
+# Default pattern of reference ranges, e.g. "[.58 - 1.59]" or "(0 - 10]".
+# Brackets are optional, in which case both limits are included
+RANGE_PATTERN = (r"^\s*(?P<open>[\[\(]?)\s*(?P<min>-?[\d.]+)\s*(?:-|to)\s*"
+                 r"(?P<max>-?[\d.]+)\s*(?P<close>[\]\)]?)\s*$")
+
+# Operators of the limits of the range, by bracket
+MIN_OPERATORS = {"[": "geq", "(": "gt", "": "geq"}
+MAX_OPERATORS = {"]": "leq", ")": "lt", "": "leq"}
+
+
+class Normalizer(object):
+    """Compiled pipeline for the normalization of result data dicts:
+
+    - value_map: results (and interims) replaced by another value
+    - decimal_separator: replaced by "." in numeric values only
+    - detection_limits: operators that prefix the result (e.g. "<=") and the
+      detection limit operand they stand for ("<" or ">"). The operand is set
+      in "detection_limit" and the result keeps the value only
+    - units: conversions by unit, with the target unit, factor and offset
+    - range_pattern: regex with named groups "min" and "max" (and optionally
+      "open" and "close" with the brackets) for the parsing of the reference
+      range, that is set in "ranges" as a dict
+    """
+
+    def __init__(self, configuration=None):
+        configuration = configuration or {}
+        self.value_map = dict(configuration.get("value_map") or {})
+        self.decimal_separator = configuration.get("decimal_separator") or "."
+
+        # Longest operators first, so "<=" is not taken as "<"
+        limits = configuration.get("detection_limits") or DETECTION_LIMITS
+        self.detection_limits = dict(limits)
+        operators = sorted(limits.keys(), key=len, reverse=True)
+        self.detection_limit_pattern = re.compile(r"^\s*({})\s*(.+)$".format(
+            "|".join(map(re.escape, operators))))
+
+        # Numeric values with the decimal separator, optionally prefixed by a
+        # detection limit operator, e.g. "<0,5". Text values (e.g. "neg, see
+        # comment") and values with thousands separators are kept as is
+        self.numeric_pattern = re.compile(
+            r"^\s*(?:{})?\s*[+-]?\d*{}?\d+(?:[eE][+-]?\d+)?\s*$".format(
+                "|".join(map(re.escape, operators)),
+                re.escape(self.decimal_separator)))
+
+        self.units = {}
+        for unit, conversion in (configuration.get("units") or {}).items():
+            self.units[unit] = (conversion.get("unit", unit),
+                                float(conversion.get("factor", 1)),
+                                float(conversion.get("offset", 0)))
+
+        pattern = configuration.get("range_pattern") or RANGE_PATTERN
+        self.range_pattern = re.compile(pattern)
+
+    def __call__(self, results):
+        """Normalizes the result data dicts passed-in, in place. Returns the
+        same list of dicts
+        """
+        for data in results:
+            self.normalize(data)
+        return results
+
+    def normalize(self, data):
+        """Normalizes the result data dict passed-in, in place
+        """
+        result = self.to_value(data.get("result"))
+
+        operand = ""
+        if result:
+            match = self.detection_limit_pattern.match(result)
+            if match:
+                operand = self.detection_limits[match.group(1)]
+                result = match.group(2).strip()
+
+        ranges = self.to_range(data.get("ranges"))
+
+        conversion = self.units.get(data.get("units"))
+        if conversion:
+            unit, factor, offset = conversion
+            result = self.convert(result, factor, offset)
+            if ranges:
+                ranges["min"] = round(ranges["min"] * factor + offset, 10)
+                ranges["max"] = round(ranges["max"] * factor + offset, 10)
+            data["units"] = unit
+
+        data["result"] = result
+        data["detection_limit"] = operand
+        if ranges or "ranges" in data:
+            data["ranges"] = ranges
+
+        interims = data.get("interims")
+        if interims:
+            data["interims"] = dict(map(
+                lambda item: (item[0], self.to_value(item[1])),
+                interims.items()))
+        return data
+
+    def to_value(self, value):
+        """Returns the value mapped to the value passed-in, with the decimal
+        separator replaced if the value is numeric
+        """
+        if value is None:
+            return value
+        value = self.value_map.get(value, value)
+        if self.decimal_separator == "." or \
+                not isinstance(value, string_types):
+            return value
+        if self.numeric_pattern.match(value):
+            value = value.replace(self.decimal_separator, ".")
+        return value
+
+    def to_range(self, value):
+        """Returns the reference range dict for the value passed-in, or None
+        if the value is not a valid range
+        """
+        if isinstance(value, dict):
+            return dict(value)
+        if not value:
+            return None
+
+        if self.decimal_separator != ".":
+            value = value.replace(self.decimal_separator, ".")
+        match = self.range_pattern.match(value)
+        if not match:
+            return None
+
+        groups = match.groupdict()
+        try:
+            min_value = float(groups["min"])
+            max_value = float(groups["max"])
+        except ValueError:
+            return None
+        if min_value > max_value:
+            return None
+
+        return {
+            "min": min_value,
+            "max": max_value,
+            "min_operator": MIN_OPERATORS.get(groups.get("open") or ""),
+            "max_operator": MAX_OPERATORS.get(groups.get("close") or ""),
+        }
+
+    def convert(self, value, factor, offset):
+        """Returns the numeric value passed-in converted with the factor and
+        offset. Returns the value as is if not numeric
+        """
+        try:
+            converted = float(value) * factor + offset
+        except (TypeError, ValueError):
+            return value
+        return repr(round(converted, 10))
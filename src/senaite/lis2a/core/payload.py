@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.LIS2A.
+#
+# SENAITE.LIS2A is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+import base64
+import zlib
+
+from senaite.lis2a.core import message as msgapi
+from senaite.lis2a.core.compat import string_types
+from senaite.lis2a.core.compat import text_type
+
+# Version of the format used for packed payloads
+PAYLOAD_FORMAT = "zlib-records/1"
+
+# Separator between the table of records and the layout of messages. Records
+# never contain line breaks, so line break is safe to separate records
+RECORDS_SEPARATOR = b"\n"
+LAYOUT_SEPARATOR = b"\x00"
+
+
+def pack_messages(messages):
+    """Returns a base64-encoded, zlib-compressed representation of the
+    messages passed-in, suitable for the params of a queued task.
+
+    Sub-messages from a composite message share the H and P records, so
+    records are stored only once in a table and each message is represented
+    by the list of positions of its records within that table
+    """
+    if isinstance(messages, string_types):
+        messages = (messages, )
+
+    records = []
+    positions = {}
+    layout = []
+    for message in messages:
+        indexes = []
+        for record in msgapi.get_raw_records(to_bytes(message)):
+            index = positions.get(record)
+            if index is None:
+                index = len(records)
+                positions[record] = index
+                records.append(record)
+            indexes.append(str(index))
+        layout.append(",".join(indexes))
+
+    data = LAYOUT_SEPARATOR.join([
+        RECORDS_SEPARATOR.join(records),
+        ";".join(layout),
+    ])
+    return base64.b64encode(zlib.compress(data, 9))
+
+
+def unpack_messages(payload):
+    """Returns the list of messages from a payload generated with
+    pack_messages. Records of each message are separated by line breaks
+    """
+    data = zlib.decompress(base64.b64decode(payload))
+    records, layout = data.split(LAYOUT_SEPARATOR, 1)
+    records = to_unicode(records).split(RECORDS_SEPARATOR)
+
+    messages = []
+    for indexes in filter(None, layout.split(";")):
+        message = map(lambda idx: records[int(idx)], indexes.split(","))
+        messages.append(u"\n".join(message))
+    return messages
+
+
+def to_bytes(value):
+    """Returns the value passed-in as an utf-8 encoded str
+    """
+    if isinstance(value, text_type):
+        return value.encode("utf-8")
+    return value
+
+
+def to_unicode(value):
+    """Returns the value passed-in as unicode
+    """
+    if isinstance(value, text_type):
+        return value
+    try:
+        return value.decode("utf-8")
+    except UnicodeDecodeError:
+        return value.decode("latin-1")
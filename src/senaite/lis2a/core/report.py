@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.LIS2A.
+#
+# SENAITE.LIS2A is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+from contextlib import contextmanager
+from timeit import default_timer
+
+# Statuses of the import of a result
+IMPORTED = "imported"
+UNCHANGED = "unchanged"
+NO_CONTAINER = "no_container"
+NO_ANALYSIS = "no_analysis"
+INVALID = "invalid"
+
+STATUSES = (IMPORTED, UNCHANGED, NO_CONTAINER, NO_ANALYSIS, INVALID)
+
+# Stages of the import of a message, in order
+STAGES = ("split", "selection", "extraction", "lookup", "set_result", "submit")
+
+
+class QueryStats(object):
+    """Accounting of the catalog queries made during an import, with the
+    number of queries and elapsed time, per catalog and per set of indexes
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.elapsed = 0.0
+        self.catalogs = {}
+        self.indexes = {}
+
+    def __repr__(self):
+        return "<QueryStats count={} elapsed={:.3f}s>".format(
+            self.count, self.elapsed)
+
+    def add(self, catalog, indexes, elapsed, count=1):
+        """Adds the query (or queries) made against the catalog with the
+        indexes passed-in
+        """
+        self.count += count
+        self.elapsed += elapsed
+        for key, stats in ((catalog, self.catalogs),
+                           (",".join(sorted(indexes)), self.indexes)):
+            entry = stats.setdefault(key, {"count": 0, "elapsed": 0.0})
+            entry["count"] += count
+            entry["elapsed"] += elapsed
+
+    def merge(self, other):
+        """Aggregates the queries from the stats passed-in
+        """
+        self.count += other.count
+        self.elapsed += other.elapsed
+        for mine, theirs in ((self.catalogs, other.catalogs),
+                             (self.indexes, other.indexes)):
+            for key, entry in theirs.items():
+                stats = mine.setdefault(key, {"count": 0, "elapsed": 0.0})
+                stats["count"] += entry["count"]
+                stats["elapsed"] += entry["elapsed"]
+        return self
+
+    def to_dict(self):
+        """Returns a dict representation of the stats
+        """
+        return {
+            "count": self.count,
+            "elapsed": self.elapsed,
+            "catalogs": dict(self.catalogs),
+            "indexes": dict(self.indexes),
+        }
+
+    def summary(self):
+        """Returns a single-line summary of the stats, suitable for logs
+        """
+        catalogs = ", ".join(map(
+            lambda c: "{}={}".format(c[0], c[1]["count"]),
+            sorted(self.catalogs.items())))
+        return "{} queries in {:.3f}s [{}]".format(
+            self.count, self.elapsed, catalogs)
+
+
+class ImportReport(object):
+    """Report of the import of one or more messages, with the number of
+    messages and results processed, the status of each result and the time
+    spent on each stage of the import
+    """
+
+    def __init__(self):
+        self.messages = 0
+        self.results = []
+        self.interpreters = {}
+        self.timings = dict.fromkeys(STAGES, 0.0)
+        self.queries = QueryStats()
+        self.interpreter_queries = {}
+
+    def __nonzero__(self):
+        """Returns whether at least one result found a match in the system
+        """
+        return self.matched > 0
+
+    __bool__ = __nonzero__
+
+    def __repr__(self):
+        counts = self.counts
+        counts = ", ".join(map(lambda status: "{}={}".format(
+            status, counts[status]), STATUSES))
+        return "<ImportReport messages={} results={} ({})>".format(
+            self.messages, len(self.results), counts)
+
+    @property
+    def counts(self):
+        """Returns a dict with the number of results per status
+        """
+        counts = dict.fromkeys(STATUSES, 0)
+        for result in self.results:
+            counts[result["status"]] += 1
+        return counts
+
+    @property
+    def matched(self):
+        """Returns the number of results that found a match in the system
+        """
+        counts = self.counts
+        return counts[IMPORTED] + counts[UNCHANGED]
+
+    @property
+    def imported(self):
+        """Returns the number of results imported
+        """
+        return self.counts[IMPORTED]
+
+    @property
+    def elapsed(self):
+        """Returns the total time in seconds spent on the import
+        """
+        return sum(self.timings.values())
+
+    def add_message(self, interpreter=None):
+        """Adds a message to the report, along with its interpreter
+        """
+        self.messages += 1
+        if interpreter:
+            count = self.interpreters.get(interpreter.id, 0)
+            self.interpreters[interpreter.id] = count + 1
+
+    def add_result(self, data, status):
+        """Adds the status of the import of the result data passed-in
+        """
+        if status not in STATUSES:
+            raise ValueError("Status not supported: {}".format(status))
+        self.results.append({
+            "id": data.get("id"),
+            "keyword": data.get("keyword"),
+            "status": status,
+        })
+
+    def add_queries(self, queries, interpreter=None):
+        """Adds the catalog queries (QueryStats) made for the import of a
+        message, along with its interpreter
+        """
+        self.queries.merge(queries)
+        if interpreter:
+            stats = self.interpreter_queries.setdefault(interpreter.id,
+                                                        QueryStats())
+            stats.merge(queries)
+
+    def add_time(self, stage, elapsed):
+        """Adds the time in seconds spent on the stage passed-in
+        """
+        self.timings[stage] = self.timings.get(stage, 0.0) + elapsed
+
+    @contextmanager
+    def timer(self, stage):
+        """Context manager that adds the time spent within the block to the
+        stage passed-in
+        """
+        start = default_timer()
+        try:
+            yield
+        finally:
+            self.add_time(stage, default_timer() - start)
+
+    def merge(self, other):
+        """Aggregates the data from the report passed-in into this report
+        """
+        self.messages += other.messages
+        self.results.extend(other.results)
+        for interpreter_id, count in other.interpreters.items():
+            total = self.interpreters.get(interpreter_id, 0) + count
+            self.interpreters[interpreter_id] = total
+        for stage, elapsed in other.timings.items():
+            self.add_time(stage, elapsed)
+        self.queries.merge(other.queries)
+        for interpreter_id, queries in other.interpreter_queries.items():
+            stats = self.interpreter_queries.setdefault(interpreter_id,
+                                                        QueryStats())
+            stats.merge(queries)
+        return self
+
+    def to_dict(self):
+        """Returns a dict representation of this report
+        """
+        return {
+            "messages": self.messages,
+            "counts": self.counts,
+            "interpreters": dict(self.interpreters),
+            "timings": dict(self.timings),
+            "queries": self.queries.to_dict(),
+            "interpreter_queries": dict(map(
+                lambda q: (q[0], q[1].to_dict()),
+                self.interpreter_queries.items())),
+            "results": list(self.results),
+        }
+
+    def summary(self):
+        """Returns a single-line summary of this report, suitable for logs
+        """
+        timings = ", ".join(map(
+            lambda stage: "{}={:.3f}s".format(stage, self.timings[stage]),
+            filter(lambda stage: stage in self.timings, STAGES)))
+        queries = "; ".join(map(
+            lambda q: "{}: {}".format(q[0], q[1].summary()),
+            sorted(self.interpreter_queries.items())))
+        return "{} [{}] [{}]".format(repr(self), timings, queries)
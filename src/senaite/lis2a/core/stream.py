@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.LIS2A.
+#
+# SENAITE.LIS2A is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+"""Streaming readers of bulk uploads of LIS2-A messages. Bodies are read in
+chunks, decompressed on the fly and split into messages as they are read, so
+the whole body is never held in memory
+"""
+
+import itertools
+import json
+import re
+import zlib
+
+from senaite.lis2a.core import e1381
+from senaite.lis2a.core import message as msgapi
+from senaite.lis2a.core.compat import string_types
+
+# Size in bytes of the chunks read from the body
+CHUNK_SIZE = 64 * 1024
+
+# Formats of the body
+NDJSON = "ndjson"
+TEXT = "text"
+
+# Line breaks. Records of ASTM bodies are usually separated by CR only
+LINE_BREAKS = re.compile(b"\r\n|\r|\n")
+
+
+def iter_chunks(stream, size=CHUNK_SIZE):
+    """Generates the chunks of bytes read from the file-like object passed-in
+    """
+    while True:
+        chunk = stream.read(size)
+        if not chunk:
+            break
+        yield chunk
+
+
+def iter_decompressed(chunks):
+    """Generates the decompressed chunks from the gzip-compressed chunks
+    passed-in. Concatenated gzip members are supported
+    """
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        while chunk:
+            data = decompressor.decompress(chunk)
+            if data:
+                yield data
+            # Data after the end of a gzip member is the start of next member
+            chunk = decompressor.unused_data
+            if chunk:
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    data = decompressor.flush()
+    if data:
+        yield data
+
+
+def iter_lines(chunks):
+    """Generates the lines from the chunks of bytes passed-in, without the
+    line break. Lines end with LF, CR or CRLF. A CRLF split between two chunks
+    yields an empty line
+    """
+    pending = b""
+    for chunk in chunks:
+        lines = LINE_BREAKS.split(pending + chunk)
+        pending = lines.pop()
+        for line in lines:
+            yield line
+    if pending:
+        yield pending
+
+
+def iter_ndjson(lines):
+    """Generates the messages from newline-delimited JSON lines. Each line is
+    either a JSON string with the message or an object with the message under
+    the "message" key
+    """
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        item = json.loads(line)
+        if not isinstance(item, string_types):
+            item = item.get("message")
+        if not item:
+            raise ValueError("No message found: {}".format(line[:80]))
+        yield item
+
+
+def iter_frames(chunks):
+    """Generates the messages from chunks of bytes with ASTM E1381 frames.
+    Rejected frames sent again are skipped. Raises a FrameError if a message
+    is left incomplete
+    """
+    return e1381.iter_messages(chunks)
+
+
+def iter_messages(stream, body_format=TEXT, gzip=False,
+                  chunk_size=CHUNK_SIZE):
+    """Generates the LIS2-A messages from the body passed-in as a file-like
+    object. With TEXT format, the body is made of concatenated messages, or
+    of ASTM E1381 frames if the body starts with ENQ or STX
+    :param body_format: TEXT or NDJSON
+    :param gzip: whether the body is gzip-compressed
+    """
+    chunks = iter_chunks(stream, size=chunk_size)
+    if gzip:
+        chunks = iter_decompressed(chunks)
+
+    if body_format == NDJSON:
+        return iter_ndjson(iter_lines(chunks))
+
+    # Peek the first chunk to know whether the body contains frames
+    first = next(chunks, b"")
+    chunks = itertools.chain([first], chunks)
+    if first.lstrip()[:1] in (chr(e1381.ENQ), chr(e1381.STX)):
+        return iter_frames(chunks)
+    return msgapi.iter_messages(iter_lines(chunks))
+
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.LIS2A.
+#
+# SENAITE.LIS2A is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+import cProfile
+import json
+import os
+import random
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from timeit import default_timer
+
+from senaite.lis2a import logger
+from senaite.lis2a.core import message as msgapi
+from senaite.lis2a.config import get_setting
+
+# Max number of profiles kept in the profiles directory
+PROFILE_MAX_FILES = 50
+
+# Number of message imports that are profiled after an import that exceeded
+# the threshold, so the profile of the next slow import is stored
+PROFILE_AFTER_SLOW = 10
+
+# Extensions of the files generated for each profile
+PROFILE_EXTENSION = ".prof"
+INFO_EXTENSION = ".json"
+
+# Permissions of the profiles directory and files, readable by owner only
+DIRECTORY_MODE = 0o700
+FILE_MODE = 0o600
+
+_lock = threading.Lock()
+
+# Number of message imports that remain to be profiled
+_armed = {"count": 0}
+
+
+def get_profile_directory():
+    """Returns the directory where profiles are stored, if any
+    """
+    return get_setting("profile_directory", "")
+
+
+def is_enabled():
+    """Returns whether the profiling of messages import is enabled
+    """
+    if not get_profile_directory():
+        return False
+    threshold = get_setting("profile_threshold", 0.0)
+    sample_rate = get_setting("profile_sample_rate", 0.0)
+    return threshold > 0 or sample_rate > 0
+
+
+def arm(count):
+    """Sets the number of next message imports to be profiled
+    """
+    with _lock:
+        _armed["count"] = max(_armed["count"], count)
+
+
+def disarm():
+    """Returns whether the next message import has to be profiled because a
+    previous import exceeded the threshold
+    """
+    with _lock:
+        if _armed["count"] <= 0:
+            return False
+        _armed["count"] -= 1
+        return True
+
+
+@contextmanager
+def profiled(message):
+    """Context manager that times the import of the message passed-in if
+    profiling is enabled. Only the imports sampled (profile_sample_rate) are
+    profiled and stored. When an import exceeds the threshold
+    (profile_threshold), its timing is stored and the next imports are
+    profiled (profile_after_slow), so the profile of the next slow import is
+    stored as well. Yields a dict in which the block can store additional
+    information about the import (e.g. interpreter and report)
+    """
+    info = {}
+    if not is_enabled():
+        yield info
+        return
+
+    threshold = get_setting("profile_threshold", 0.0)
+    sample_rate = get_setting("profile_sample_rate", 0.0)
+    sampled = random.random() < sample_rate
+    armed = not sampled and threshold > 0 and disarm()
+
+    profiler = None
+    if sampled or armed:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    start = default_timer()
+    try:
+        yield info
+    finally:
+        elapsed = default_timer() - start
+        if profiler:
+            profiler.disable()
+        slow = 0 < threshold <= elapsed
+        if slow and not profiler:
+            # Profile the next imports, without overhead on the fast ones
+            arm(get_setting("profile_after_slow", PROFILE_AFTER_SLOW))
+        if slow or sampled:
+            info.update({
+                "elapsed": elapsed,
+                "reason": slow and "threshold" or "sampled",
+            })
+            try:
+                store_profile(profiler, message, info)
+            except (IOError, OSError) as e:
+                logger.error("Cannot store profile: {}".format(e))
+
+
+def store_profile(profiler, message, info):
+    """Stores the stats of the profiler, if any, along with the info passed-in
+    in the profiles directory. Only the fingerprint of the message is stored,
+    unless profile_store_messages is set, cause messages contain patient data.
+    Oldest profiles are removed so the directory never keeps more than
+    profile_max_files profiles
+    """
+    directory = get_profile_directory()
+    fingerprint = msgapi.get_fingerprint(message)
+    timestamp = datetime.now().strftime("%Y%m%d%H%M%S%f")
+    basename = "{}-{}".format(timestamp, fingerprint[:12])
+    path = os.path.join(directory, basename)
+
+    data = dict(info)
+    data.update({
+        "fingerprint": fingerprint,
+        "profile": None,
+    })
+    if get_setting("profile_store_messages", False):
+        data["message"] = message
+
+    with _lock:
+        if not os.path.isdir(directory):
+            os.makedirs(directory, DIRECTORY_MODE)
+        if profiler:
+            profile_path = "{}{}".format(path, PROFILE_EXTENSION)
+            profiler.dump_stats(profile_path)
+            os.chmod(profile_path, FILE_MODE)
+            data["profile"] = os.path.basename(profile_path)
+        info_path = "{}{}".format(path, INFO_EXTENSION)
+        fd = os.open(info_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                     FILE_MODE)
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, indent=2, sort_keys=True, default=str)
+        prune_profiles(directory)
+
+    logger.warn("Import of message {} took {:.3f}s ({}). Stored in {}"
+                .format(fingerprint[:12], info["elapsed"], info["reason"],
+                        path))
+
+
+def prune_profiles(directory):
+    """Removes the oldest profiles from the directory passed-in, so no more
+    than profile_max_files profiles are kept
+    """
+    max_files = get_setting("profile_max_files", PROFILE_MAX_FILES)
+    profiles = filter(lambda f: f.endswith(INFO_EXTENSION),
+                      os.listdir(directory))
+    # File names start with a timestamp, so oldest go first
+    profiles = sorted(profiles)
+    for profile in profiles[:max(len(profiles) - max_files, 0)]:
+        basename = os.path.splitext(profile)[0]
+        for extension in (PROFILE_EXTENSION, INFO_EXTENSION):
+            path = os.path.join(directory, basename + extension)
+            if os.path.exists(path):
+                os.remove(path)
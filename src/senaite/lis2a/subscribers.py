@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.LIS2A.
+#
+# SENAITE.LIS2A is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+from senaite.lis2a.api import deadletter as deadletterapi
+
+
+def on_sample_transition(sample, event):
+    """Event handler for samples that were transitioned. Messages parked for
+    the sample because it was not received yet are retried as soon as the
+    sample is received, either by a queued task or by the next retry of the
+    dead letters that are due, but never within the reception itself
+    """
+    if not event.transition or event.transition.id != "receive":
+        return
+
+    if not deadletterapi.is_deadletter_enabled():
+        return
+
+    specimen_ids = [sample.getId(), sample.getClientSampleID()]
+    deadletterapi.retry_for(specimen_ids)